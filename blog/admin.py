@@ -1,9 +1,15 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
+from django.shortcuts import render
+
+from .counters import update_posts
 from .models import Post, PostImage, Category
+from .pagination import EstimatedCountPaginator
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
-    list_display = ('name',)
+    list_display = ('name', 'active_post_count')
     search_fields = ('name',)
 
 
@@ -12,25 +18,65 @@ class PostImageInline(admin.TabularInline):
     model = PostImage
     extra = 1  # Mostra 1 campo vuoto per aggiungere immagini
     max_num = 5  # Limita a 5 immagini
-    fields = ['image', 'uploaded_at']
-    readonly_fields = ['uploaded_at']
+    fields = ['image', 'uploaded_at', 'status']
+    readonly_fields = ['uploaded_at', 'status']
+
+
+class ReassignCategoryForm(forms.Form):
+    category = forms.ModelChoiceField(queryset=Category.objects.all(), label='Nuova categoria')
 
 
 @admin.register(Post)
 class PostAdmin(admin.ModelAdmin):
-    list_display = ['title', 'author', 'date_posted', 'image_count']
-    list_filter = ['date_posted', 'author']
+    # image_count is a counter column (blog/counters.py), not a COUNT per row
+    list_display = ['title', 'author', 'category', 'price', 'is_sold', 'date_posted', 'image_count']
+    list_select_related = ['author', 'category']
+    # No filter on author: it would list every user
+    list_filter = ['is_sold', 'category']
+    date_hierarchy = 'date_posted'
     search_fields = ['title', 'content']
+    autocomplete_fields = ['author', 'category']
     inlines = [PostImageInline]
-    
-    def image_count(self, obj):
-        """Mostra il numero di immagini nella lista"""
-        return obj.images.count()
-    image_count.short_description = 'Immagini'
+    actions = ['mark_sold', 'mark_available', 'reassign_category']
+    # No second COUNT(*) for the unfiltered total. The row count itself stays exact:
+    # Post.objects hides soft-deleted rows, which the table statistics include.
+    show_full_result_count = False
+
+    @admin.action(description='Segna come venduti')
+    def mark_sold(self, request, queryset):
+        updated = update_posts(queryset, is_sold=True)
+        self.message_user(request, f'{updated} post segnati come venduti.', messages.SUCCESS)
+
+    @admin.action(description='Segna come disponibili')
+    def mark_available(self, request, queryset):
+        updated = update_posts(queryset, is_sold=False)
+        self.message_user(request, f'{updated} post segnati come disponibili.', messages.SUCCESS)
+
+    @admin.action(description='Cambia categoria')
+    def reassign_category(self, request, queryset):
+        form = ReassignCategoryForm(request.POST if 'apply' in request.POST else None)
+        if form.is_valid():
+            updated = update_posts(queryset, category_id=form.cleaned_data['category'].pk)
+            self.message_user(request, f'{updated} post spostati in {form.cleaned_data["category"]}.',
+                              messages.SUCCESS)
+            return None
+        return render(request, 'admin/blog/post/reassign_category.html', {
+            **self.admin_site.each_context(request),
+            'title': 'Cambia categoria',
+            'opts': self.model._meta,
+            'form': form,
+            'queryset': queryset,
+            'selected': request.POST.getlist(helpers.ACTION_CHECKBOX_NAME),
+            'select_across': request.POST.get('select_across', '0'),
+        })
 
 
 @admin.register(PostImage)
 class PostImageAdmin(admin.ModelAdmin):
-    list_display = ['post', 'uploaded_at']
-    list_filter = ['uploaded_at']
-    search_fields = ['post__title']
\ No newline at end of file
+    list_display = ['post', 'uploaded_at', 'status']
+    list_select_related = ['post']
+    list_filter = ['uploaded_at', 'status']
+    search_fields = ['post__title']
+    raw_id_fields = ['post']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
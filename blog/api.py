@@ -0,0 +1,192 @@
+"""Read-only JSON API over the listings.
+
+Rows are read with `.values()` and serialized as plain dicts, never as model
+instances. Common query parameters:
+
+    fields=title,price   only return these fields (sparse fieldset)
+    cursor=...           page cursor, from the "next"/"previous" keys
+    limit=20             page size, at most MAX_LIMIT
+    ids=1,2,3            fetch these posts in a single query, no pagination
+
+Every response carries a strong ETag; clients revalidating with
+If-None-Match get an empty 304 when nothing changed.
+"""
+import hashlib
+import json
+from collections import defaultdict
+from functools import wraps
+
+from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.views.decorators.http import require_safe
+
+from .cache import get_categories
+from .models import Post, PostImageRendition
+from .pagination import CursorPaginator, InvalidCursor
+from .views import filter_feed
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+# Public field name -> lookup passed to .values()
+POST_FIELDS = {
+    'id': 'id',
+    'title': 'title',
+    'content': 'content',
+    'price': 'price',
+    'is_sold': 'is_sold',
+    'date_posted': 'date_posted',
+    'updated_at': 'updated_at',
+    'category': 'category_id',
+    'category_name': 'category__name',
+    'author': 'author__username',
+}
+# Not a column: the renditions of the post images, fetched in one extra query
+IMAGES_FIELD = 'images'
+LIST_FIELDS = [name for name in POST_FIELDS if name != 'content']
+
+
+class BadRequest(Exception):
+    pass
+
+
+def json_response(request, data):
+    """Serialize `data`, answering 304 when the client already has this exact body"""
+    content = json.dumps(data, cls=DjangoJSONEncoder, separators=(',', ':'))
+    etag = '"%s"' % hashlib.md5(content.encode(), usedforsecurity=False).hexdigest()
+    response = HttpResponse(content, content_type='application/json')
+    response['ETag'] = etag
+    patch_cache_control(response, no_cache=True)
+    return get_conditional_response(request, etag=etag, response=response)
+
+
+def parse_fields(request, default):
+    value = request.GET.get('fields', '').strip()
+    if not value:
+        return list(default)
+    fields = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in fields if name not in POST_FIELDS and name != IMAGES_FIELD]
+    if unknown:
+        raise BadRequest(f'Unknown fields: {", ".join(unknown)}')
+    return fields
+
+
+def parse_limit(request):
+    try:
+        limit = int(request.GET.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise BadRequest('limit must be an integer')
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def parse_ids(request):
+    try:
+        ids = [int(value) for value in request.GET['ids'].split(',') if value.strip()]
+    except ValueError:
+        raise BadRequest('ids must be a comma separated list of integers')
+    if len(ids) > MAX_LIMIT:
+        raise BadRequest(f'At most {MAX_LIMIT} ids')
+    return ids
+
+
+def post_values(queryset, fields, extra=()):
+    """Queryset of dicts with the lookups of `fields` plus `extra` columns"""
+    lookups = {POST_FIELDS[name] for name in fields if name in POST_FIELDS}
+    return queryset.values(*lookups | {'id'} | set(extra))
+
+
+def serialize_posts(rows, fields):
+    """Rename the looked up columns to the public field names"""
+    posts = [{name: row[POST_FIELDS[name]] for name in fields if name in POST_FIELDS} for row in rows]
+    if IMAGES_FIELD in fields:
+        images = post_images([row['id'] for row in rows])
+        for post, row in zip(posts, rows):
+            post[IMAGES_FIELD] = images.get(row['id'], [])
+    return posts
+
+
+def post_images(post_ids):
+    """Rendition URLs of the images of the posts, {post id: [{name: url, ...}]}"""
+    renditions = (PostImageRendition.objects
+                  .filter(image__post_id__in=post_ids, format='jpeg')
+                  .order_by('image__uploaded_at', 'image_id')
+                  .values('image__post_id', 'image_id', 'name', 'file', 'width', 'height'))
+    storage = PostImageRendition._meta.get_field('file').storage
+    images = defaultdict(dict)
+    for rendition in renditions:
+        image = images[rendition['image__post_id']].setdefault(rendition['image_id'], {})
+        image[rendition['name']] = {
+            'url': storage.url(rendition['file']),
+            'width': rendition['width'],
+            'height': rendition['height'],
+        }
+    return {post_id: list(by_image.values()) for post_id, by_image in images.items()}
+
+
+def posts_by_ids(request, queryset):
+    """The posts listed in ?ids=, in that order, with a single query"""
+    fields = parse_fields(request, LIST_FIELDS)
+    ids = parse_ids(request)
+    rows = {row['id']: row for row in post_values(queryset.filter(pk__in=ids), fields)}
+    return {'results': serialize_posts([rows[pk] for pk in ids if pk in rows], fields)}
+
+
+def paginated_posts(request, queryset, ordering):
+    fields = parse_fields(request, LIST_FIELDS)
+    ordering_fields = [name.lstrip('-') for name in ordering]
+    paginator = CursorPaginator(post_values(queryset, fields, ordering_fields), parse_limit(request), ordering)
+    try:
+        page = paginator.page(request.GET.get('cursor'))
+    except InvalidCursor:
+        raise BadRequest('Invalid cursor')
+    return {
+        'results': serialize_posts(page.object_list, fields),
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    }
+
+
+def api_view(view):
+    """GET/HEAD only, with BadRequest turned into a 400 JSON response"""
+    @require_safe
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except BadRequest as e:
+            return JsonResponse({'error': str(e)}, status=400)
+    return wrapper
+
+
+@api_view
+def post_list(request):
+    """The home feed, with the same filters: query, category, min_price, max_price, sold and sort"""
+    if 'ids' in request.GET:
+        # Batched fetch, e.g. to refresh posts a client already has, sold or not
+        return json_response(request, posts_by_ids(request, Post.objects.all()))
+    posts, ordering = filter_feed(Post.objects.all(), request.GET)
+    return json_response(request, paginated_posts(request, posts, ordering))
+
+
+@api_view
+def post_detail(request, pk):
+    fields = parse_fields(request, list(POST_FIELDS) + [IMAGES_FIELD])
+    row = get_object_or_404(post_values(Post.objects.all(), fields), pk=pk)
+    return json_response(request, serialize_posts([row], fields)[0])
+
+
+@api_view
+def user_post_list(request, username):
+    """All the posts of a seller, sold ones included"""
+    author = get_object_or_404(User.objects.only('id'), username=username)
+    posts = Post.objects.filter(author=author)
+    return json_response(request, paginated_posts(request, posts, ('-date_posted', '-id')))
+
+
+@api_view
+def category_list(request):
+    categories = [{'id': category.pk, 'name': category.name} for category in get_categories()]
+    return json_response(request, {'results': categories})
@@ -3,4 +3,13 @@ from django.apps import AppConfig
 
 class BlogConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'blog'
\ No newline at end of file
+    name = 'blog'
+
+    def ready(self):
+        import blog.middleware  # registers the shared cache check
+        import blog.signals
+        import blog.vendor  # registers the vendored assets check
+        from PIL import Image
+        from .uploads import max_pixels
+        # Pillow refuses to open anything over twice this size
+        Image.MAX_IMAGE_PIXELS = max_pixels()
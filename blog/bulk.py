@@ -0,0 +1,265 @@
+"""Bulk import and export of listings.
+
+Imports read CSV or JSON Lines, one listing per row, with the images of a row
+named in its `images` column (separated by ";") and taken from a zip archive:
+
+    title,content,category,price,is_sold,images
+    Lampada,Lampada da tavolo,Casa,15,false,lampada-1.jpg;lampada-2.jpg
+
+Rows are validated and inserted in chunks, so memory stays flat whatever the
+size of the file; invalid rows are skipped and reported with their line
+number. Exports stream the same columns back out.
+"""
+import codecs
+import csv
+import io
+import json
+import os
+import zipfile
+
+from django import forms
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Prefetch
+
+from jobs.queue import enqueue_many
+from .cache import FACETS, bump_version
+from .counters import count_new_posts
+from .models import Category, Post, PostImage
+from .search import get_search_backend
+from .uploads import max_size, validate_image
+
+FORMATS = ('csv', 'jsonl')
+IMPORT_FIELDS = ['title', 'content', 'category', 'price', 'is_sold', 'images']
+EXPORT_FIELDS = ['id', 'date_posted'] + IMPORT_FIELDS
+BATCH_SIZE = 500
+# Same limits as the post form (blog/forms.py)
+MAX_IMAGES = 5
+IMAGE_EXTENSIONS = ('jpg', 'jpeg', 'png', 'gif', 'webp')
+
+
+class BulkImportError(Exception):
+    """The file as a whole can't be imported"""
+
+
+def guess_format(filename):
+    extension = os.path.splitext(filename)[1].lower().lstrip('.')
+    return {'json': 'jsonl', 'ndjson': 'jsonl'}.get(extension, extension)
+
+
+def check_encoding(fileobj, chunk_size=64 * 1024):
+    """Refuse a file that isn't UTF-8 before importing any of its rows"""
+    decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    try:
+        while chunk := fileobj.read(chunk_size):
+            decoder.decode(chunk)
+        decoder.decode(b'', final=True)
+    except UnicodeDecodeError:
+        raise BulkImportError('Il file non è codificato in UTF-8.')
+    finally:
+        fileobj.seek(0)
+
+
+def read_rows(fileobj, format):
+    """Yield (line number, row dict) from a binary file object"""
+    text = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+    if format == 'csv':
+        reader = csv.DictReader(text)
+        try:
+            missing = set(IMPORT_FIELDS) - {'images'} - set(reader.fieldnames or ())
+            if missing:
+                raise BulkImportError(f'Colonne mancanti: {", ".join(sorted(missing))}')
+            for row in reader:
+                yield reader.line_num, row
+        except csv.Error as e:
+            raise BulkImportError(f'CSV non valido alla riga {reader.line_num}: {e}')
+    elif format == 'jsonl':
+        for line_num, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_num, e
+                continue
+            yield line_num, row if isinstance(row, dict) else ValueError('expected a JSON object')
+    else:
+        raise BulkImportError(f'Formato non supportato: {format}')
+
+
+class PostImportForm(forms.Form):
+    """Validates one imported row"""
+    title = forms.CharField(max_length=100)
+    content = forms.CharField()
+    category = forms.CharField()
+    price = forms.FloatField(min_value=0)
+    is_sold = forms.BooleanField(required=False)
+    images = forms.CharField(required=False)
+
+    def __init__(self, *args, categories, archive=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.categories = categories
+        self.archive = archive
+
+    def clean_category(self):
+        value = self.cleaned_data['category'].strip()
+        category_id = self.categories.get(value.lower())
+        if category_id is None:
+            raise forms.ValidationError(f'Categoria sconosciuta: {value}')
+        return category_id
+
+    def clean_images(self):
+        names = [name.strip() for name in self.cleaned_data['images'].split(';') if name.strip()]
+        if len(names) > MAX_IMAGES:
+            raise forms.ValidationError(f'Massimo {MAX_IMAGES} immagini.')
+        if names and self.archive is None:
+            raise forms.ValidationError('Immagini indicate ma nessun archivio zip caricato.')
+        for name in names:
+            try:
+                info = self.archive.getinfo(name)
+            except KeyError:
+                raise forms.ValidationError(f'Immagine "{name}" non presente nell\'archivio.')
+            if name.rsplit('.', 1)[-1].lower() not in IMAGE_EXTENSIONS:
+                raise forms.ValidationError(f'Formato di "{name}" non supportato.')
+            if info.file_size > max_size():  # Checked before reading the member into memory
+                raise forms.ValidationError(f'"{name}" è troppo grande. Max {max_size() // (1024 * 1024)}MB.')
+            with self.archive.open(info) as f:
+                validate_image(ContentFile(f.read(), name=name))
+        return names
+
+
+class ImportResult:
+
+    def __init__(self):
+        self.created = 0
+        self.images = 0
+        self.errors = []  # (line number, message)
+
+    def add_error(self, line_num, message):
+        self.errors.append((line_num, message))
+
+
+class PostImporter:
+    """Create the posts of `author` from (line number, row) pairs"""
+
+    def __init__(self, author, archive=None, batch_size=BATCH_SIZE):
+        self.author = author
+        self.archive = archive
+        self.batch_size = batch_size
+        self.categories = {}
+        for pk, name in Category.objects.values_list('pk', 'name'):
+            self.categories[str(pk)] = pk
+            self.categories[name.lower()] = pk
+
+    def run(self, rows):
+        result = ImportResult()
+        chunk = []
+        for line_num, row in rows:
+            if isinstance(row, Exception):
+                result.add_error(line_num, f'Riga non valida: {row}')
+                continue
+            data = {field: row.get(field, '') for field in IMPORT_FIELDS}
+            if isinstance(data['images'], list):  # JSON Lines may list the images
+                if not all(isinstance(name, str) for name in data['images']):
+                    result.add_error(line_num, 'images: la lista deve contenere nomi di file.')
+                    continue
+                data['images'] = ';'.join(data['images'])
+            form = PostImportForm(data, categories=self.categories, archive=self.archive)
+            if not form.is_valid():
+                for field, errors in form.errors.items():
+                    result.add_error(line_num, f'{field}: {" ".join(errors)}')
+                continue
+            chunk.append(form.cleaned_data)
+            if len(chunk) >= self.batch_size:
+                self.save_chunk(chunk, result)
+                chunk = []
+        if chunk:
+            self.save_chunk(chunk, result)
+        if result.created:
+            bump_version('posts', FACETS, f'author:{self.author.pk}')
+        return result
+
+    def save_chunk(self, chunk, result):
+        with transaction.atomic():
+            posts = Post.objects.bulk_create([
+                Post(
+                    title=data['title'],
+                    content=data['content'],
+                    category_id=data['category'],
+                    price=data['price'],
+                    is_sold=data['is_sold'],
+                    author=self.author,
+                    image_count=len(data['images']),
+                )
+                for data in chunk
+            ])
+            images = PostImage.objects.bulk_create([
+                PostImage(post=post, image=self.store_image(name))
+                for post, data in zip(posts, chunk)
+                for name in data['images']
+            ])
+            get_search_backend().index(posts)
+            count_new_posts(posts)
+            enqueue_many('blog.tasks.process_post_image', [{'image_id': image.pk} for image in images])
+        result.created += len(posts)
+        result.images += len(images)
+
+    def store_image(self, name):
+        with self.archive.open(name) as f:
+            return default_storage.save(f'post_images/{os.path.basename(name)}', ContentFile(f.read()))
+
+
+def import_posts(fileobj, format, author, images=None, batch_size=BATCH_SIZE):
+    """Import a CSV/JSONL file object, `images` being an optional zip file object"""
+    archive = None
+    if images is not None:
+        try:
+            archive = zipfile.ZipFile(images)
+        except zipfile.BadZipFile:
+            raise BulkImportError('L\'archivio delle immagini non è un file zip valido.')
+    try:
+        check_encoding(fileobj)
+        return PostImporter(author, archive, batch_size).run(read_rows(fileobj, format))
+    finally:
+        if archive is not None:
+            archive.close()
+
+
+class Echo:
+    """File-like object whose write() returns the data, for csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+def export_rows(queryset, chunk_size=2000):
+    """Yield the export row of every post, fetching `chunk_size` posts at a time"""
+    posts = (queryset.select_related('category')
+             .prefetch_related(Prefetch('images', queryset=PostImage.objects.only('post_id', 'image')))
+             .order_by('id'))
+    for post in posts.iterator(chunk_size=chunk_size):
+        yield {
+            'id': post.pk,
+            'date_posted': post.date_posted.isoformat(),
+            'title': post.title,
+            'content': post.content,
+            'category': post.category.name,
+            'price': post.price,
+            'is_sold': post.is_sold,
+            'images': ';'.join(image.image.name for image in post.images.all()),
+        }
+
+
+def export_posts(queryset, format):
+    """Serialize posts as an iterator of strings, for StreamingHttpResponse"""
+    if format == 'csv':
+        writer = csv.DictWriter(Echo(), fieldnames=EXPORT_FIELDS)
+        yield writer.writeheader()
+        for row in export_rows(queryset):
+            yield writer.writerow(row)
+    elif format == 'jsonl':
+        for row in export_rows(queryset):
+            yield json.dumps(row, ensure_ascii=False) + '\n'
+    else:
+        raise ValueError(f'Unsupported format: {format}')
@@ -0,0 +1,64 @@
+"""Cache helpers for the listing pages.
+
+Cached values are keyed on a version number stored in the cache itself:
+bumping the version invalidates every entry built from the old one, without
+having to know their keys. Versions start from the current time so that an
+evicted version key never resurrects stale entries.
+
+Versions double as the tags of the anonymous page cache (blog/middleware.py):
+"posts" (any listing), "post:<id>", "author:<user id>" and "categories".
+"facets" versions the per-category counts of the feed (blog/facets.py).
+"""
+import time
+
+from django.core.cache import cache
+
+from .models import Category
+
+CATEGORIES = 'categories'
+FACETS = 'facets'
+
+
+def _version_key(name):
+    return f'blog:version:{name}'
+
+
+def get_version(name):
+    return cache.get_or_set(_version_key(name), time.time_ns, timeout=None)
+
+
+def get_versions(names):
+    """Current version of several names in one cache round trip"""
+    keys = {_version_key(name): name for name in names}
+    versions = {keys[key]: version for key, version in cache.get_many(keys).items()}
+    missing = {key: time.time_ns() for key, name in keys.items() if name not in versions}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        versions.update((keys[key], version) for key, version in missing.items())
+    return versions
+
+
+def bump_version(*names):
+    for name in names:
+        try:
+            cache.incr(_version_key(name))
+        except ValueError:  # Not in the cache (yet or any more)
+            cache.set(_version_key(name), time.time_ns(), timeout=None)
+
+
+def invalidate_post(post_id, author_id=None):
+    """Expire the cached pages showing a post"""
+    tags = ['posts', f'post:{post_id}']
+    if author_id is not None:
+        tags.append(f'author:{author_id}')
+    bump_version(*tags)
+
+
+def get_categories():
+    """All categories, cached until a Category is saved or deleted"""
+    key = f'blog:categories:{get_version(CATEGORIES)}'
+    categories = cache.get(key)
+    if categories is None:
+        categories = list(Category.objects.all())
+        cache.set(key, categories)
+    return categories
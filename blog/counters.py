@@ -0,0 +1,125 @@
+"""Denormalized counters: Post.image_count, Category.active_post_count and
+Profile.active_listing_count.
+
+"Active" posts are unsold and not deleted. The counters are adjusted with
+F() expressions, clamped at 0, when posts and images are created, deleted,
+sold or moved (blog/signals.py), so showing them is a column read instead of a COUNT.
+Bulk inserts skip the signals and call count_new_posts() themselves, bulk
+updates go through update_posts().
+`manage.py repair_counters` recomputes them all and fixes any drift.
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from users.models import Profile
+from .cache import FACETS, bump_version
+from .models import Category, Post, PostImage
+
+
+def shifted(field, delta):
+    """`field` + `delta` for update(), clamped at 0.
+
+    The counters are PositiveIntegerFields: a decrement of a counter that
+    drifted to 0 (e.g. two concurrent saves of the same post) must not fail
+    the user's action. repair_counters fixes the drift.
+    """
+    return Greatest(F(field) + delta, 0)
+
+
+def is_active(values):
+    """Whether Post.tracked_values() describe an active post"""
+    return not values['is_sold'] and values['deleted_at'] is None
+
+
+def adjust_listing_counts(category_id, author_id, delta):
+    Category.objects.filter(pk=category_id).update(active_post_count=shifted('active_post_count', delta))
+    Profile.objects.filter(user_id=author_id).update(active_listing_count=shifted('active_listing_count', delta))
+
+
+def post_changed(old, new):
+    """Move a saved post between counters; `old` is None for a new post"""
+    was_active = old is not None and is_active(old)
+    now_active = is_active(new)
+    same_place = old is not None and (old['category_id'], old['author_id']) == (new['category_id'], new['author_id'])
+    if was_active and now_active and same_place:
+        return
+    if was_active:
+        adjust_listing_counts(old['category_id'], old['author_id'], -1)
+    if now_active:
+        adjust_listing_counts(new['category_id'], new['author_id'], 1)
+
+
+def count_new_posts(posts):
+    """Add bulk created posts to the counters, with one UPDATE per category and per author"""
+    active = [post for post in posts if is_active(post.tracked_values())]
+    for category_id, count in Counter(post.category_id for post in active).items():
+        Category.objects.filter(pk=category_id).update(active_post_count=shifted('active_post_count', count))
+    for author_id, count in Counter(post.author_id for post in active).items():
+        Profile.objects.filter(user_id=author_id).update(active_listing_count=shifted('active_listing_count', count))
+
+
+def update_posts(queryset, **changes):
+    """queryset.update(**changes) in one UPDATE, keeping counters and cached pages right.
+
+    `changes` may set `is_sold` and `category_id`, the counters are adjusted
+    from a GROUP BY of the rows taken before the update.
+    """
+    categories, authors = Counter(), Counter()
+    with transaction.atomic():
+        groups = list(queryset.filter(deleted_at__isnull=True)
+                      .order_by()
+                      .values('category_id', 'author_id', 'is_sold')
+                      .annotate(count=Count('pk')))
+        updated = queryset.update(updated_at=timezone.now(), **changes)
+        for before in groups:
+            after = {**before, **changes}
+            for row, sign in ((before, -1), (after, 1)):
+                if not row['is_sold']:
+                    categories[row['category_id']] += sign * row['count']
+                    authors[row['author_id']] += sign * row['count']
+        for category_id, delta in categories.items():
+            if delta:
+                Category.objects.filter(pk=category_id).update(active_post_count=shifted('active_post_count', delta))
+        for author_id, delta in authors.items():
+            if delta:
+                Profile.objects.filter(user_id=author_id).update(active_listing_count=shifted('active_listing_count', delta))
+    # The author tags cover the detail pages of the updated posts
+    bump_version('posts', FACETS, *{f'author:{group["author_id"]}' for group in groups})
+    return updated
+
+
+def count_of(queryset, field, outer='pk'):
+    """Correlated subquery counting the rows of `queryset` whose `field` is the outer row"""
+    counts = (queryset.filter(**{field: OuterRef(outer)})
+              .order_by()
+              .values(field)
+              .annotate(count=Count('pk'))
+              .values('count'))
+    return Coalesce(Subquery(counts), 0)
+
+
+def counters():
+    """(name, queryset, counter field, expression computing its true value)"""
+    active = Post.objects.filter(is_sold=False)
+    return [
+        ('Post.image_count', Post.all_objects.all(), 'image_count', count_of(PostImage.objects.all(), 'post')),
+        ('Category.active_post_count', Category.objects.all(), 'active_post_count', count_of(active, 'category')),
+        ('Profile.active_listing_count', Profile.objects.all(), 'active_listing_count',
+         count_of(active, 'author', outer='user_id')),
+    ]
+
+
+def repair_counters(dry_run=False):
+    """Recompute every counter, returns {name: number of rows that had drifted}"""
+    drifted = {}
+    for name, queryset, field, actual in counters():
+        wrong = queryset.annotate(actual_count=actual).exclude(**{field: F('actual_count')})
+        if dry_run:
+            drifted[name] = wrong.count()
+        else:
+            drifted[name] = queryset.filter(pk__in=wrong.values('pk')).update(**{field: actual})
+    return drifted
@@ -0,0 +1,103 @@
+"""Faceted browsing of the listings feed.
+
+FeedFilters reads the feed query string: text query, category, price range,
+sold status and sort order. category_counts() gives the number of matching
+posts per category with a single GROUP BY query, or reads them from the
+Category.active_post_count counters for the plain feed. The counts are
+cached under the "facets" version, which is only bumped when a post enters
+or leaves a facet (created, deleted, or its category, price or sold status
+changed, see blog/signals.py), so editing a title or adding photos keeps
+them cached.
+"""
+import hashlib
+import math
+
+from django.core.cache import cache
+from django.db.models import Count
+
+from .cache import FACETS, get_version
+from .models import Category
+from .search import get_search_backend, tokenize
+
+# Value of ?sort= -> cursor ordering (the last field must be unique)
+SORTS = {
+    'newest': ('-date_posted', '-id'),
+    'price_asc': ('price', 'id'),
+    'price_desc': ('-price', '-id'),
+}
+# Best matches first, used when searching without an explicit sort
+SEARCH_ORDERING = ('search_rank', '-date_posted', '-id')
+# Value of ?sold= -> is_sold lookup (None: no filter). Available posts by default.
+SOLD_FILTERS = {'': False, 'sold': True, 'all': None}
+
+
+def parse_price(value):
+    try:
+        price = float(value)
+    except (TypeError, ValueError):
+        return None
+    return price if price >= 0 and math.isfinite(price) else None
+
+
+class FeedFilters:
+    """The feed filters of a query string; invalid values are ignored"""
+
+    def __init__(self, params):
+        self.query = params.get('query', '').strip()
+        category = params.get('category', '').strip()
+        self.category_id = int(category) if category.isdigit() else None
+        self.min_price = parse_price(params.get('min_price'))
+        self.max_price = parse_price(params.get('max_price'))
+        sort = params.get('sort', '').strip()
+        self.sort = sort if sort in SORTS else ''
+        sold = params.get('sold', '').strip()
+        self.sold = sold if sold in SOLD_FILTERS else ''
+
+    @property
+    def ordering(self):
+        if self.sort:
+            return SORTS[self.sort]
+        # search_rank only exists when the query has search terms
+        return SEARCH_ORDERING if tokenize(self.query) else SORTS['newest']
+
+    def apply(self, posts, category=True):
+        """Filter `posts`; category=False leaves out the category filter (for its facet)"""
+        is_sold = SOLD_FILTERS[self.sold]
+        if is_sold is not None:
+            posts = posts.filter(is_sold=is_sold)
+        if self.min_price is not None:
+            posts = posts.filter(price__gte=self.min_price)
+        if self.max_price is not None:
+            posts = posts.filter(price__lte=self.max_price)
+        if category and self.category_id is not None:
+            posts = posts.filter(category_id=self.category_id)
+        if self.query:
+            posts = get_search_backend().search(posts, self.query)
+        return posts
+
+    def is_default(self):
+        """No filter besides the category: the feed of all active posts"""
+        return not self.query and self.min_price is None and self.max_price is None and not self.sold
+
+    def facet_key(self):
+        """Hash of the filters the category counts depend on"""
+        key = (tokenize(self.query), self.min_price, self.max_price, self.sold)
+        return hashlib.md5(repr(key).encode(), usedforsecurity=False).hexdigest()
+
+
+def category_counts(posts, filters):
+    """{category id: number of posts} matching `filters` other than the category"""
+    key = f'blog:facets:{get_version(FACETS)}:{filters.facet_key()}'
+    counts = cache.get(key)
+    if counts is None and filters.is_default():
+        # Plain feed: the maintained counters, no need to count the posts
+        counts = dict(Category.objects.filter(active_post_count__gt=0).values_list('pk', 'active_post_count'))
+        cache.set(key, counts)
+    elif counts is None:
+        rows = (filters.apply(posts, category=False)
+                .order_by()
+                .values('category_id')
+                .annotate(count=Count('id')))
+        counts = {row['category_id']: row['count'] for row in rows}
+        cache.set(key, counts)
+    return counts
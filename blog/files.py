@@ -0,0 +1,75 @@
+"""Removal of media files that no row references any more.
+
+Files are deleted off-request by the `blog.tasks.delete_files` job, queued
+when a PostImage is deleted or a Profile picture replaced. The same file can
+be shared by several rows (renditions are content-addressed), so a file is
+only removed once no FileField of any model points to it.
+"""
+import os
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import models
+
+from .images import FORMATS, RENDITIONS, rendition_path
+
+# Never deleted: the default profile picture
+PROTECTED_FILES = {'default.jpg'}
+
+
+def file_fields():
+    """(model, field name) of every FileField/ImageField of the project"""
+    for model in apps.get_models():
+        for field in model._meta.get_fields():
+            if isinstance(field, models.FileField):
+                yield model, field.name
+
+
+def referenced_files(names=None):
+    """Names (among `names`, or all of them) that some row still points to"""
+    referenced = set()
+    for model, field in file_fields():
+        # The base manager also sees soft-deleted rows waiting to be purged
+        queryset = model._base_manager.exclude(**{field: ''})
+        if names is not None:
+            queryset = queryset.filter(**{f'{field}__in': names})
+        referenced.update(queryset.values_list(field, flat=True).distinct())
+    return referenced
+
+
+def image_files(image):
+    """Original and (possible) rendition files of a PostImage"""
+    names = [image.image.name] if image.image else []
+    if image.checksum:
+        names += [rendition_path(image.checksum, name, fmt) for name in RENDITIONS for fmt in FORMATS]
+    return names
+
+
+def delete_files(names, storage=default_storage):
+    """Delete the files of `names` nobody references, returns how many were removed"""
+    names = set(names) - PROTECTED_FILES
+    deleted = 0
+    for name in names - referenced_files(names):
+        if storage.exists(name):
+            storage.delete(name)
+            deleted += 1
+    return deleted
+
+
+def find_orphaned_files(min_age=3600, root=None):
+    """Files under MEDIA_ROOT referenced by no row, older than `min_age` seconds.
+
+    Recent files are skipped: an upload is written to disk before its row is
+    committed.
+    """
+    root = root or settings.MEDIA_ROOT
+    referenced = referenced_files() | PROTECTED_FILES
+    now = time.time()
+    for directory, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(directory, filename)
+            name = os.path.relpath(path, root).replace(os.sep, '/')
+            if name not in referenced and now - os.path.getmtime(path) >= min_age:
+                yield name
@@ -1,6 +1,8 @@
 from django import forms
 from django.forms import inlineformset_factory
+from .bulk import FORMATS, guess_format
 from .models import Post, PostImage
+from .uploads import ImageUploadField
 
 class PostForm(forms.ModelForm):
     """Main form for Post model"""
@@ -27,47 +29,14 @@ class PostImageForm(forms.ModelForm):
     class Meta:
         model = PostImage
         fields = ['image']
+        # Validates size, real format and pixel count without decoding the image
+        field_classes = {'image': ImageUploadField}
         widgets = {
             'image': forms.FileInput(attrs={
                 'class': 'form-control'#,
                 #'accept': 'image/jpeg,image/jpg,image/png,image/gif,image/webp'
             })
         }
-    
-    def clean_image(self):
-        """Validate single image - only for NEW uploads"""
-        image = self.cleaned_data.get('image')
-        
-        # Skip validation if no new file uploaded (existing image or empty)
-        if not image or not hasattr(image, 'content_type'):
-            return image
-        
-        # Validate only NEW uploads (UploadedFile objects)
-        
-        # Check file size (max 5MB)
-        if image.size > 5 * 1024 * 1024:
-            raise forms.ValidationError(
-                f'Il file "{image.name}" è troppo grande. Max 5MB.'
-            )
-        
-        # Check extension
-        allowed_extensions = ['jpg', 'jpeg', 'png', 'gif', 'webp']
-        file_extension = image.name.split('.')[-1].lower()
-        
-        if file_extension not in allowed_extensions:
-            raise forms.ValidationError(
-                f'Formato .{file_extension.upper()} non supportato. '
-                f'Usa: JPG, PNG, GIF, WebP'
-            )
-        
-        # Check MIME type
-        allowed_mime = ['image/jpeg', 'image/png', 'image/gif', 'image/webp']
-        if image.content_type not in allowed_mime:
-            raise forms.ValidationError(
-                f'Il file "{image.name}" non è un\'immagine valida.'
-            )
-        
-        return image
 
 
 # Formset: gestisce multipli PostImageForm
@@ -80,4 +49,15 @@ PostImageFormSet = inlineformset_factory(
     max_num=5,               # Max 5 immagini totali
     validate_max=True,       # Valida il limite
     can_delete=True          # Permette eliminazione
-)
\ No newline at end of file
+)
+
+class PostImportUploadForm(forms.Form):
+    """Upload of a bulk import, see blog/bulk.py"""
+    file = forms.FileField(label='File CSV o JSONL')
+    images = forms.FileField(label='Archivio zip delle immagini', required=False)
+
+    def clean_file(self):
+        file = self.cleaned_data['file']
+        if guess_format(file.name) not in FORMATS:
+            raise forms.ValidationError('Usa un file .csv o .jsonl')
+        return file
@@ -0,0 +1,247 @@
+"""Resized renditions of listing photos.
+
+Uploads are stored untouched; the background task in blog/tasks.py derives a
+fixed set of renditions from them, and the `{% thumbnail %}` template tag
+shows a placeholder until the worker has got there. The tag only reads:
+`manage.py queue_missing_renditions` queues the images that lack a
+rendition, e.g. after a size is added to RENDITIONS. Rendition files are
+keyed on the sha256 of the original upload, so identical uploads share the
+same files under MEDIA_ROOT.
+"""
+import hashlib
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Count, Q
+from django.templatetags.static import static
+from django.utils import timezone
+from django.utils.html import format_html, format_html_join
+from PIL import Image as PILImage, ImageOps
+
+from jobs.queue import enqueue
+
+from .cache import invalidate_post
+from .models import Post, PostImage, PostImageRendition
+from .uploads import max_pixels
+
+# Rendition name -> bounding box (pixels) the image is scaled down to fit
+RENDITIONS = {
+    'feed': 400,
+    'detail': 800,
+    'full': 1600,
+}
+
+# Shown until the rendition exists, never the (possibly huge) original upload
+PLACEHOLDER = 'blog/placeholder.svg'
+
+# Output format -> (PIL format, file extension, save options)
+FORMATS = {
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+
+
+def file_checksum(field_file, chunk_size=64 * 1024):
+    """sha256 of a stored file, read in chunks"""
+    digest = hashlib.sha256()
+    with field_file.open('rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def rendition_path(checksum, name, fmt):
+    extension = FORMATS[fmt][1]
+    return f'renditions/{checksum[:2]}/{checksum}/{name}.{extension}'
+
+
+def _prepare(img, fmt):
+    """Convert to a mode the output format can store"""
+    has_alpha = img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info)
+    if fmt == 'webp' and has_alpha:
+        return img.convert('RGBA')
+    if has_alpha:
+        background = PILImage.new('RGB', img.size, 'white')
+        background.paste(img.convert('RGBA'), mask=img.convert('RGBA').getchannel('A'))
+        return background
+    return img.convert('RGB') if img.mode != 'RGB' else img
+
+
+def _encode(img, fmt):
+    pil_format, _, options = FORMATS[fmt]
+    buffer = BytesIO()
+    _prepare(img, fmt).save(buffer, pil_format, **options)
+    return buffer.getvalue()
+
+
+def render_renditions(field_file, checksum, names=None, formats=None, storage=None):
+    """Write the missing rendition files for an upload.
+
+    Returns a list of dicts (name, format, path, width, height) and the pixel
+    size of the original. The source is decoded once and scaled down
+    progressively, from the largest rendition to the smallest.
+    """
+    storage = storage or default_storage
+    names = names or list(RENDITIONS)
+    formats = formats or list(FORMATS)
+    sizes = sorted(((RENDITIONS[name], name) for name in names), reverse=True)
+
+    results = []
+    with field_file.open('rb') as f:
+        with PILImage.open(f) as source:
+            original_size = source.size
+            # Uploads are checked by the form, this covers files that bypassed it
+            if source.width * source.height > max_pixels():
+                raise PILImage.DecompressionBombError(f'{source.width}x{source.height} pixels')
+            # JPEG can decode straight to a reduced size, much cheaper than a full decode
+            source.draft('RGB', (sizes[0][0], sizes[0][0]))
+            working = ImageOps.exif_transpose(source)
+            for size, name in sizes:
+                working.thumbnail((size, size), PILImage.LANCZOS)
+                for fmt in formats:
+                    path = rendition_path(checksum, name, fmt)
+                    if not storage.exists(path):
+                        path = storage.save(path, ContentFile(_encode(working, fmt)))
+                    results.append({
+                        'name': name,
+                        'format': fmt,
+                        'path': path,
+                        'width': working.width,
+                        'height': working.height,
+                    })
+    return results, original_size
+
+
+def generate_renditions(image):
+    """Render and record every rendition of a PostImage, then mark it ready.
+
+    Returns the new PostImageRendition rows, or an empty list (and the image
+    marked failed) when the upload cannot be decoded.
+    """
+    try:
+        checksum = image.checksum or file_checksum(image.image)
+        renditions, (width, height) = render_renditions(image.image, checksum)
+    except (OSError, PILImage.DecompressionBombError):
+        PostImage.objects.filter(pk=image.pk).update(status=PostImage.FAILED)
+        image.status = PostImage.FAILED
+        return []
+
+    rows = [
+        PostImageRendition(
+            image=image,
+            name=rendition['name'],
+            format=rendition['format'],
+            file=rendition['path'],
+            width=rendition['width'],
+            height=rendition['height'],
+        )
+        for rendition in renditions
+    ]
+    with transaction.atomic():
+        image.renditions.all().delete()
+        # A concurrent run for the same image may have inserted the same rows
+        PostImageRendition.objects.bulk_create(rows, ignore_conflicts=True)
+        PostImage.objects.filter(pk=image.pk).update(
+            status=PostImage.READY, checksum=checksum, width=width, height=height,
+        )
+        # Cached cards and pages have to pick up the new renditions
+        Post.objects.filter(pk=image.post_id).update(updated_at=timezone.now())
+    invalidate_post(image.post_id)
+    image.status, image.checksum, image.width, image.height = PostImage.READY, checksum, width, height
+    return rows
+
+
+class Thumbnail:
+    """Pre-sized variant of a PostImage, as returned by the {% thumbnail %} tag.
+
+    Rendered directly it produces a <picture> element with WebP and JPEG
+    sources and a width-based srcset; with `as` the attributes can be used to
+    build custom markup.
+    """
+
+    def __init__(self, image, name, renditions, attrs=None):
+        self.image = image
+        self.name = name
+        self.attrs = attrs or {}
+        size = RENDITIONS[name]
+        by_format = {}
+        for rendition in renditions:
+            # Offer renditions up to twice the requested size for HiDPI screens
+            if RENDITIONS.get(rendition.name, 0) <= size * 2:
+                by_format.setdefault(rendition.format, []).append(rendition)
+        for variants in by_format.values():
+            variants.sort(key=lambda r: r.width)
+        self.sources = by_format
+
+        main = {r.format: r for r in renditions if r.name == name}
+        fallback = main.get('jpeg') or main.get('webp')
+        self.url = fallback.file.url if fallback else static(PLACEHOLDER)
+        self.webp_url = main['webp'].file.url if 'webp' in main else None
+        self.width = fallback.width if fallback else None
+        self.height = fallback.height if fallback else None
+
+    def _srcset(self, fmt):
+        return ', '.join(f'{r.file.url} {r.width}w' for r in self.sources.get(fmt, []))
+
+    @property
+    def srcset(self):
+        return self._srcset('jpeg')
+
+    @property
+    def webp_srcset(self):
+        return self._srcset('webp')
+
+    @property
+    def sizes(self):
+        return self.attrs.get('sizes') or (f'(max-width: {self.width}px) 100vw, {self.width}px'
+                                            if self.width else '')
+
+    def __html__(self):
+        attrs = {'loading': 'lazy', **self.attrs, 'src': self.url}
+        attrs.pop('sizes', None)
+        if self.width:
+            attrs.update(width=self.width, height=self.height,
+                         srcset=self.srcset, sizes=self.sizes)
+        img = format_html('<img{}>', format_html_join('', ' {}="{}"', attrs.items()))
+        if not self.webp_srcset:
+            return img
+        return format_html(
+            '<picture><source type="image/webp" srcset="{}" sizes="{}">{}</picture>',
+            self.webp_srcset, self.sizes, img,
+        )
+
+    def __str__(self):
+        return self.__html__()
+
+
+def get_thumbnail(image, name, attrs=None):
+    """Thumbnail for a PostImage, a placeholder until its renditions exist.
+
+    Uses `image.renditions` (prefetch it when rendering lists), so a page of
+    ready images costs no extra queries. Read-only: renditions are made by
+    the workers, see queue_missing_renditions().
+    """
+    if name not in RENDITIONS:
+        raise ValueError(f'Unknown rendition "{name}", expected one of {", ".join(RENDITIONS)}')
+    return Thumbnail(image, name, list(image.renditions.all()), attrs)
+
+
+def queue_missing_renditions(dry_run=False):
+    """Queue the rendition job of every ready image missing a rendition; returns their number"""
+    expected = len(RENDITIONS) * len(FORMATS)
+    current = Q(renditions__name__in=list(RENDITIONS), renditions__format__in=list(FORMATS))
+    incomplete = list(PostImage.objects.filter(status=PostImage.READY).order_by()
+                      .annotate(renditions_count=Count('renditions', filter=current))
+                      .filter(renditions_count__lt=expected)
+                      .values_list('pk', flat=True))
+    if dry_run:
+        return len(incomplete)
+    queued = 0
+    for image_id in incomplete:
+        # Skips an image that a new upload already sent back to the workers
+        if PostImage.objects.filter(pk=image_id, status=PostImage.READY).update(status=PostImage.PENDING):
+            enqueue('blog.tasks.process_post_image', image_id=image_id)
+            queued += 1
+    return queued
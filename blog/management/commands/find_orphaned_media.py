@@ -0,0 +1,25 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from blog.files import find_orphaned_files
+
+
+class Command(BaseCommand):
+    help = 'List (or delete) files under MEDIA_ROOT that no database row references'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--delete', action='store_true', help='Delete the orphaned files')
+        parser.add_argument('--min-age', type=int, default=3600,
+                            help='Ignore files modified in the last N seconds (uploads in progress)')
+
+    def handle(self, *args, **options):
+        count = size = 0
+        for name in find_orphaned_files(options['min_age']):
+            count += 1
+            size += default_storage.size(name)
+            if options['delete']:
+                default_storage.delete(name)
+            self.stdout.write(name)
+
+        action = 'Deleted' if options['delete'] else 'Found'
+        self.stdout.write(self.style.SUCCESS(f'{action} {count} orphaned files ({size / 1024 / 1024:.1f} MB)'))
@@ -0,0 +1,38 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from blog.bulk import BATCH_SIZE, FORMATS, BulkImportError, guess_format, import_posts
+
+
+class Command(BaseCommand):
+    help = 'Import listings from a CSV or JSON Lines file, with their images from a zip archive'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--author', required=True, help='Username of the seller')
+        parser.add_argument('--images', help='Zip archive with the images named in the file')
+        parser.add_argument('--format', choices=FORMATS, help='Guessed from the file extension by default')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            author = User.objects.get(username=options['author'])
+        except User.DoesNotExist:
+            raise CommandError(f"Unknown user {options['author']}")
+        format = options['format'] or guess_format(options['path'])
+
+        images = open(options['images'], 'rb') if options['images'] else None
+        try:
+            with open(options['path'], 'rb') as f:
+                result = import_posts(f, format, author, images, options['batch_size'])
+        except BulkImportError as e:
+            raise CommandError(str(e))
+        finally:
+            if images is not None:
+                images.close()
+
+        for line_num, message in result.errors:
+            self.stderr.write(f'Line {line_num}: {message}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {result.created} posts with {result.images} images, {len(result.errors)} error(s)'
+        ))
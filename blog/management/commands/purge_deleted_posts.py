@@ -0,0 +1,31 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from blog.models import Post
+from blog.tasks import purge_post
+
+
+class Command(BaseCommand):
+    help = 'Purge soft-deleted posts whose background job did not run (or failed)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=3600,
+                            help='Only posts deleted more than this many seconds ago')
+        parser.add_argument('--batch-size', type=int, default=100)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(seconds=options['older_than'])
+        deleted = Post.all_objects.filter(deleted_at__lt=cutoff).order_by('id')
+
+        total = 0
+        while True:
+            batch = list(deleted.values_list('id', flat=True)[:options['batch_size']])
+            if not batch:
+                break
+            for post_id in batch:
+                purge_post(post_id)
+            total += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f'Purged {total} posts'))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from blog.images import queue_missing_renditions
+
+
+class Command(BaseCommand):
+    help = ('Queue the rendition job of the ready images missing a rendition, '
+            'e.g. after adding a size or a format (see blog/images.py)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report the images missing a rendition')
+
+    def handle(self, *args, **options):
+        count = queue_missing_renditions(dry_run=options['dry_run'])
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'{count} images missing a rendition'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Queued {count} images'))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from blog.cache import FACETS, bump_version
+from blog.counters import repair_counters
+
+
+class Command(BaseCommand):
+    help = 'Recompute the image and listing counters (see blog/counters.py) and fix the rows that drifted'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report the rows that drifted')
+
+    def handle(self, *args, **options):
+        drifted = repair_counters(dry_run=options['dry_run'])
+        for name, count in drifted.items():
+            self.stdout.write(f'{name:<30} {count} rows')
+
+        total = sum(drifted.values())
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'{total} rows drifted'))
+            return
+        if total:
+            bump_version(FACETS)
+        self.stdout.write(self.style.SUCCESS(f'Fixed {total} rows'))
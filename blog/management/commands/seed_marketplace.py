@@ -0,0 +1,189 @@
+import io
+import random
+from collections import Counter
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image, ImageDraw
+
+from blog.cache import CATEGORIES, FACETS, bump_version
+from blog.counters import count_new_posts
+from blog.models import Category, Post, PostImage
+from blog.search import get_search_backend
+from jobs.queue import enqueue_many
+from messaging.models import Conversation, ConversationMessage, ConversationSummary
+from messaging.signals import snippet
+from users.models import Profile
+
+CATEGORY_NAMES = ['Abbigliamento', 'Casa', 'Elettronica', 'Giardino', 'Libri', 'Musica', 'Sport', 'Veicoli']
+WORDS = ('lampada divano bicicletta chitarra libro giacca scarpe tavolo sedia telefono '
+         'computer monitor tastiera zaino borsa orologio vaso specchio tappeto poltrona '
+         'usato nuovo ottimo stato vintage legno metallo rosso blu nero bianco grande piccolo').split()
+
+# Distinct source images, shared by all seeded posts (renditions are keyed by content)
+IMAGE_VARIANTS = 12
+
+
+class Command(BaseCommand):
+    help = 'Fill the database with a synthetic marketplace for load testing and benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--posts', type=int, default=2000)
+        parser.add_argument('--max-images', type=int, default=3, help='Images per post, from 0 to this')
+        parser.add_argument('--conversations', type=int, default=500)
+        parser.add_argument('--messages', type=int, default=10, help='Messages per conversation')
+        parser.add_argument('--prefix', default='seed', help='Prefix of the generated usernames')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed, for repeatable data sets')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+
+        with transaction.atomic():
+            categories = self.create_categories()
+            users = self.create_users(options['users'], options['prefix'])
+            posts = self.create_posts(options['posts'], users, categories)
+            covers = self.create_images(posts, options['max_images'])
+            conversations = self.create_conversations(
+                options['conversations'], options['messages'], users, posts, covers)
+        # Bulk inserts skip the signals that expire the cached pages
+        bump_version('posts', CATEGORIES, FACETS, *{f'author:{post.author_id}' for post in posts})
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {len(users)} users, {len(posts)} posts, {len(covers)} posts with images '
+            f'and {conversations} conversations. Run "manage.py run_jobs --once" to generate the renditions.'
+        ))
+
+    def sentence(self, words):
+        return ' '.join(self.random.choice(WORDS) for _ in range(words))
+
+    def past(self, days=365):
+        return self.now - timedelta(seconds=self.random.randint(0, days * 24 * 3600))
+
+    def create_categories(self):
+        existing = set(Category.objects.values_list('name', flat=True))
+        Category.objects.bulk_create([Category(name=name) for name in CATEGORY_NAMES if name not in existing])
+        return list(Category.objects.all())
+
+    def create_users(self, count, prefix):
+        # Hashing is deliberately slow, every seeded user gets the same password
+        password = make_password('password')
+        usernames = [f'{prefix}{i:05d}' for i in range(count)]
+        User.objects.bulk_create(
+            [User(username=username, email=f'{username}@example.com', password=password)
+             for username in usernames],
+            batch_size=self.batch_size, ignore_conflicts=True,
+        )
+        users = list(User.objects.filter(username__in=usernames))
+        # bulk_create() skips the post_save signal that creates profiles
+        with_profile = set(Profile.objects.filter(user__in=users).values_list('user_id', flat=True))
+        Profile.objects.bulk_create(
+            [Profile(user=user) for user in users if user.pk not in with_profile],
+            batch_size=self.batch_size,
+        )
+        return users
+
+    def create_posts(self, count, users, categories):
+        posts = Post.objects.bulk_create([
+            Post(
+                title=self.sentence(self.random.randint(2, 5)).capitalize(),
+                content=self.sentence(self.random.randint(20, 80)),
+                price=round(self.random.uniform(1, 500), 2),
+                is_sold=self.random.random() < 0.1,
+                date_posted=self.past(),
+                author=self.random.choice(users),
+                category=self.random.choice(categories),
+            )
+            for _ in range(count)
+        ], batch_size=self.batch_size)
+        get_search_backend().index(posts)
+        count_new_posts(posts)
+        return posts
+
+    def source_images(self):
+        names = []
+        for i in range(IMAGE_VARIANTS):
+            name = f'post_images/seed/{i}.jpg'
+            if not default_storage.exists(name):
+                image = Image.new('RGB', (1200, 900), tuple(self.random.randrange(256) for _ in range(3)))
+                ImageDraw.Draw(image).ellipse((300, 200, 900, 700), fill=(255, 255, 255))
+                buffer = io.BytesIO()
+                image.save(buffer, 'JPEG', quality=85)
+                name = default_storage.save(name, ContentFile(buffer.getvalue()))
+            names.append(name)
+        return names
+
+    def create_images(self, posts, max_images):
+        """Attach images to the posts, returns the cover image of each post that has one"""
+        if not max_images:
+            return {}
+        sources = self.source_images()
+        images = PostImage.objects.bulk_create([
+            PostImage(post=post, image=self.random.choice(sources))
+            for post in posts
+            for _ in range(self.random.randint(0, max_images))
+        ], batch_size=self.batch_size)
+        enqueue_many('blog.tasks.process_post_image', [{'image_id': image.pk} for image in images])
+
+        covers = {}
+        image_counts = Counter()
+        for image in images:
+            covers.setdefault(image.post_id, image)
+            image_counts[image.post_id] += 1
+        # Posts were inserted first, fill in their image counters (one UPDATE per distinct count)
+        by_count = {}
+        for post_id, count in image_counts.items():
+            by_count.setdefault(count, []).append(post_id)
+        for count, post_ids in by_count.items():
+            for i in range(0, len(post_ids), self.batch_size):
+                Post.objects.filter(pk__in=post_ids[i:i + self.batch_size]).update(image_count=count)
+        return covers
+
+    def create_conversations(self, count, messages_per_conversation, users, posts, covers):
+        pairs = set()
+        for _ in range(count * 3):
+            if len(pairs) >= count:
+                break
+            post, buyer = self.random.choice(posts), self.random.choice(users)
+            if buyer.pk != post.author_id:
+                pairs.add((post, buyer))
+        pairs = sorted(pairs, key=lambda pair: (pair[0].pk, pair[1].pk))
+
+        conversations = Conversation.objects.bulk_create(
+            [Conversation(post=post, buyer=buyer, seller_id=post.author_id) for post, buyer in pairs],
+            batch_size=self.batch_size,
+        )
+
+        messages, summaries = [], []
+        for conversation, (post, buyer) in zip(conversations, pairs):
+            members = (buyer.pk, post.author_id)
+            content = ''
+            for i in range(messages_per_conversation):
+                content = self.sentence(self.random.randint(3, 25))
+                messages.append(ConversationMessage(
+                    conversation=conversation, content=content, created_by_id=members[i % 2]))
+            # Messages are bulk inserted, so the inbox rows are written here
+            last_activity = self.past(days=30)
+            for user_id, other_id in (members, members[::-1]):
+                summaries.append(ConversationSummary(
+                    user_id=user_id,
+                    conversation=conversation,
+                    other_user_id=other_id,
+                    post_title=post.title,
+                    cover_image=covers.get(post.pk),
+                    last_message=snippet(content),
+                    unread_count=self.random.randint(0, 3),
+                    last_activity=last_activity,
+                ))
+        ConversationMessage.objects.bulk_create(messages, batch_size=self.batch_size)
+        ConversationSummary.objects.bulk_create(summaries, batch_size=self.batch_size)
+        return len(conversations)
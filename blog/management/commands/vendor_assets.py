@@ -0,0 +1,43 @@
+import base64
+import hashlib
+import os
+import re
+from urllib.request import urlopen
+
+from django.core.management.base import BaseCommand, CommandError
+
+from blog.vendor import VENDOR_ASSETS
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'static')
+# The .map files are not vendored, and the manifest storage refuses missing references
+SOURCE_MAP = re.compile(rb'\n?/[*/]# sourceMappingURL=[^\n]*\s*$')
+
+
+class Command(BaseCommand):
+    help = 'Download the third-party CSS/JS into blog/static/vendor/, so pages do not depend on a CDN'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Download again files already present')
+
+    def handle(self, *args, **options):
+        for name, (path, url, integrity) in VENDOR_ASSETS.items():
+            target = os.path.join(STATIC_DIR, path)
+            if os.path.exists(target) and not options['force']:
+                self.stdout.write(f'{name}: already vendored')
+                continue
+            try:
+                with urlopen(url, timeout=30) as response:
+                    content = response.read()
+            except OSError as e:
+                raise CommandError(f'{name}: download of {url} failed: {e}')
+
+            algorithm, expected = integrity.split('-', 1)
+            digest = base64.b64encode(hashlib.new(algorithm, content).digest()).decode()
+            if digest != expected:
+                raise CommandError(f'{name}: {url} does not match {integrity}')
+
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, 'wb') as f:
+                f.write(SOURCE_MAP.sub(b'\n', content))
+            self.stdout.write(f'{name}: {path} ({len(content) // 1024} KB)')
+        self.stdout.write(self.style.SUCCESS('Done. Run "manage.py collectstatic" to publish them.'))
@@ -0,0 +1,154 @@
+import hashlib
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core import checks
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, urlencode
+
+from .cache import get_versions
+
+
+@checks.register(checks.Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """The page cache is invalidated by version keys, which must be shared by every process"""
+    if f'{__name__}.AnonymousPageCacheMiddleware' not in settings.MIDDLEWARE \
+            or not isinstance(caches['default'], LocMemCache):
+        return []
+    return [checks.Error(
+        'The anonymous page cache needs a cache shared between processes, not LocMemCache.',
+        hint='Invalidations made by other server processes or by run_jobs would never reach '
+             'this one. Set CACHE_DIR (file-based cache) or configure a shared cache backend.',
+        id='blog.E002',
+    )]
+
+
+class PageCacheTagsMixin:
+    """Opt a view into the anonymous page cache.
+
+    The rendered response is tagged with get_cache_tags(); it is served from
+    the cache until one of the tags is bumped (see blog/cache.py).
+    """
+    cache_tags = ()
+
+    def get_cache_tags(self):
+        return list(self.cache_tags)
+
+    def render_to_response(self, context, **response_kwargs):
+        response = super().render_to_response(context, **response_kwargs)
+        response.cache_tags = self.get_cache_tags()
+        return response
+
+
+class AnonymousPageCacheMiddleware:
+    """Cache complete pages for logged-out visitors.
+
+    Only responses of views using PageCacheTagsMixin are stored. The key is
+    the path plus the PAGE_CACHE_QUERY_PARAMS of the query string (requests
+    with any other parameter bypass the cache). Responses carry an ETag and
+    Last-Modified, so revalidating clients get a 304.
+    Must come after the authentication middleware. Runs natively under
+    both WSGI and ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.timeout = getattr(settings, 'PAGE_CACHE_TIMEOUT', 300)
+        self.query_params = set(getattr(settings, 'PAGE_CACHE_QUERY_PARAMS', ()))
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        key = self.get_cache_key(request, request.user)
+        if key is None:
+            return self.get_response(request)
+
+        entry = self.lookup(key)
+        if entry is not None:
+            return self.cached_response(request, entry)
+
+        response = self.get_response(request)
+        if not self.is_cacheable(response):
+            return response
+        return self.store(request, key, response)
+
+    async def __acall__(self, request):
+        key = self.get_cache_key(request, await request.auser())
+        if key is None:
+            return await self.get_response(request)
+
+        entry = await sync_to_async(self.lookup)(key)
+        if entry is not None:
+            return self.cached_response(request, entry)
+
+        response = await self.get_response(request)
+        if not self.is_cacheable(response):
+            return response
+        return await sync_to_async(self.store)(request, key, response)
+
+    def lookup(self, key):
+        """The cached page under `key`, if none of its tags was bumped since"""
+        entry = cache.get(key)
+        if entry is not None and get_versions(entry['tags']) == entry['tags']:
+            return entry
+        return None
+
+    def cached_response(self, request, entry):
+        response = HttpResponse(entry['content'], status=entry['status'])
+        for header, value in entry['headers'].items():
+            response[header] = value
+        response['X-Page-Cache'] = 'hit'
+        return get_conditional_response(
+            request, etag=entry['headers']['ETag'],
+            last_modified=entry['last_modified'], response=response,
+        )
+
+    def store(self, request, key, response):
+        last_modified = int(time.time())
+        response['ETag'] = '"%s"' % hashlib.md5(response.content, usedforsecurity=False).hexdigest()
+        response['Last-Modified'] = http_date(last_modified)
+        cache.set(key, {
+            'content': response.content,
+            'status': response.status_code,
+            'headers': {
+                header: response[header]
+                for header in ('Content-Type', 'ETag', 'Last-Modified')
+            },
+            'tags': get_versions(response.cache_tags),
+            'last_modified': last_modified,
+        }, self.timeout)
+        response['X-Page-Cache'] = 'miss'
+        return get_conditional_response(
+            request, etag=response['ETag'], last_modified=last_modified, response=response,
+        )
+
+    def get_cache_key(self, request, user):
+        if request.method not in ('GET', 'HEAD'):
+            return None
+        # Pending flash messages are part of the page
+        if 'messages' in request.COOKIES or user.is_authenticated:
+            return None
+        if not set(request.GET) <= self.query_params:
+            return None
+        query = urlencode(sorted(
+            (name, request.GET.get(name, '').strip()) for name in request.GET
+        ))
+        digest = hashlib.md5(f'{request.path}?{query}'.encode(), usedforsecurity=False).hexdigest()
+        return f'blog:page:{digest}'
+
+    def is_cacheable(self, response):
+        return (
+            hasattr(response, 'cache_tags')
+            and response.status_code == 200
+            and not response.streaming
+            and not response.cookies
+        )
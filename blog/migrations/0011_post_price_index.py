@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:46
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0010_post_soft_delete'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True), ('is_sold', False)), fields=['price', 'id'], name='blog_post_unsold_price_idx'),
+        ),
+    ]
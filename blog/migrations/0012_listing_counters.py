@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:48
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_of(queryset, field, outer='pk'):
+    counts = queryset.filter(**{field: OuterRef(outer)}).order_by().values(field).annotate(n=Count('pk')).values('n')
+    return Coalesce(Subquery(counts), 0)
+
+
+def fill_counters(apps, schema_editor):
+    Category = apps.get_model('blog', 'Category')
+    Post = apps.get_model('blog', 'Post')
+    PostImage = apps.get_model('blog', 'PostImage')
+    Profile = apps.get_model('users', 'Profile')
+    active = Post.objects.filter(is_sold=False, deleted_at__isnull=True)
+    Post.objects.update(image_count=count_of(PostImage.objects.all(), 'post'))
+    Category.objects.update(active_post_count=count_of(active, 'category'))
+    Profile.objects.update(active_listing_count=count_of(active, 'author', outer='user_id'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0011_post_price_index'),
+        ('users', '0003_profile_active_listing_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='active_post_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='image_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='immagini'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -2,12 +2,14 @@ from django.db import models
 from django.utils import timezone
 from django.contrib.auth.models import User
 from django.urls import reverse
-from PIL import Image as PILImage
+from jobs.queue import enqueue
 
 class Category(models.Model):
     name = models.CharField(max_length=255, default='General')
     # Set a default for Category.name to populate existing records
     # To be removed in production as cactegory is a required field
+    # Unsold, not deleted posts, maintained by blog/counters.py
+    active_post_count = models.PositiveIntegerField(default=0, editable=False)
 
     class Meta:
         ordering = ('name',)
@@ -16,6 +18,24 @@ class Category(models.Model):
     def __str__(self):
         return self.name
 
+class PostQuerySet(models.QuerySet):
+
+    def with_cover_image(self):
+        """Fetch the first image of every post (and its renditions) in batched queries"""
+        return self.prefetch_related(models.Prefetch(
+            'images',
+            queryset=PostImage.objects.prefetch_related('renditions').order_by('uploaded_at', 'id')[:1],
+            to_attr='cover_images',
+        ))
+
+
+class PostManager(models.Manager.from_queryset(PostQuerySet)):
+    """Hides soft-deleted posts, see Post.soft_delete()"""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
 class Post(models.Model):
     # Adding extra fields to transform posts into products.
     category = models.ForeignKey(Category, related_name='posts', on_delete=models.CASCADE, default=1)
@@ -25,30 +45,166 @@ class Post(models.Model):
     title = models.CharField(max_length=100)
     content = models.TextField()
     date_posted = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)  # Part of the post card cache key
     author = models.ForeignKey(User, on_delete=models.CASCADE)
+    # Set when the seller deletes the post, the row is removed later by a job
+    deleted_at = models.DateTimeField(null=True, blank=True)
+    # Maintained by blog/counters.py
+    image_count = models.PositiveIntegerField('immagini', default=0, editable=False)
+
+    objects = PostManager()
+    all_objects = PostQuerySet.as_manager()  # Soft-deleted posts included
+
+    class Meta:
+        # Related objects (image.post, conversation.post) still resolve while the post waits to be purged
+        base_manager_name = 'all_objects'
+        indexes = [
+            # Backs keyset pagination on (date_posted, id), see blog/pagination.py
+            models.Index(fields=['-date_posted', '-id'], name='blog_post_date_id_idx'),
+            # Home feed: unsold posts, newest first, optionally in one category
+            models.Index(fields=['-date_posted', '-id'],
+                         condition=models.Q(is_sold=False, deleted_at__isnull=True),
+                         name='blog_post_unsold_date_idx'),
+            models.Index(fields=['category', '-date_posted', '-id'],
+                         condition=models.Q(is_sold=False, deleted_at__isnull=True),
+                         name='blog_post_category_date_idx'),
+            # Feed sorted by price (either direction), see blog/facets.py
+            models.Index(fields=['price', 'id'],
+                         condition=models.Q(is_sold=False, deleted_at__isnull=True),
+                         name='blog_post_unsold_price_idx'),
+            # Seller page: all posts of an author, newest first
+            models.Index(fields=['author', '-date_posted', '-id'], name='blog_post_author_date_idx'),
+        ]
+
+    # Fields the feed facets (blog/facets.py) and the listing counters (blog/counters.py) depend on,
+    # and the title copied into the inbox rows (messaging/signals.py)
+    TRACKED_FIELDS = ('category_id', 'author_id', 'price', 'is_sold', 'deleted_at', 'title')
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # Only now: every post_save receiver compares against the values loaded before this save
+        self._stored_values = self.tracked_values()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored values, to notice what a save changes
+        instance._stored_values = instance.tracked_values()
+        return instance
+
+    def tracked_values(self):
+        # Deferred fields are not loaded just for this
+        return {attname: self.__dict__.get(attname) for attname in self.TRACKED_FIELDS}
+
+    def changed_fields(self):
+        """Tracked fields changed since the post was loaded, None if it wasn't loaded from the database"""
+        stored = getattr(self, '_stored_values', None)
+        if stored is None:
+            return None
+        return {attname for attname, value in self.tracked_values().items() if stored[attname] != value}
+
     def get_absolute_url(self):
         return reverse('blog:post-detail', kwargs={'pk': self.pk})
-    
+
+    def soft_delete(self):
+        """Hide the post right away and queue the removal of its rows and files"""
+        self.deleted_at = timezone.now()
+        self.save(update_fields=['deleted_at', 'updated_at'])
+        enqueue('blog.tasks.purge_post', post_id=self.pk)
+
+    @property
+    def cover_image(self):
+        """First image of the post, prefetched by PostQuerySet.with_cover_image()"""
+        if hasattr(self, 'cover_images'):
+            return self.cover_images[0] if self.cover_images else None
+        return self.images.order_by('uploaded_at', 'id').first()
+
+
+class PostSearchIndex(models.Model):
+    """Row of the SQLite FTS5 table (migration 0005), joined by blog/search.py.
+
+    Not managed: the virtual table is created by the migration and written
+    with raw SQL by SQLiteFTSSearchBackend.
+    """
+    post = models.OneToOneField(Post, models.DO_NOTHING, primary_key=True, db_column='rowid',
+                                db_constraint=False, related_name='search_index')
+    title = models.TextField()
+    content = models.TextField()
+    # Hidden column named after the table: the left operand of MATCH and the argument of bm25()
+    document = models.TextField(db_column='blog_post_fts')
+
+    class Meta:
+        managed = False
+        db_table = 'blog_post_fts'
+
+
 class PostImage(models.Model):
+    PENDING = 'pending'
+    READY = 'ready'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Processing'),
+        (READY, 'Ready'),
+        (FAILED, 'Failed'),
+    ]
+
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='images')
     # Last kwarg allows me to write post.images.all() to get all images of a post, by creating an inverse relation in DB
     image = models.ImageField(upload_to='post_images')
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    # Filled in by the background task that generates the renditions (blog/tasks.py)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    checksum = models.CharField(max_length=64, blank=True)  # sha256 of the original upload
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
 
     class Meta:
         ordering = ['uploaded_at']
 
-    # Resize image on save
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored upload, to remove its files when it is replaced
+        instance._stored_image = instance.image.name if 'image' in field_names else None
+        return instance
+
+    # The upload is stored as is, renditions are generated off-request
     def save(self, *args, **kwargs):
+        new_upload = bool(self.image) and not self.image._committed
+        if new_upload:
+            self.status = self.PENDING
+            self.checksum = ''
+
         super().save(*args, **kwargs)
 
-        img = PILImage.open(self.image.path)
+        if new_upload:
+            stored = getattr(self, '_stored_image', None)
+            old_files = [stored] if stored and stored != self.image.name else []
+            old_files += self.renditions.values_list('file', flat=True)
+            self.renditions.all().delete()
+            if old_files:
+                # Only removed if no other row shares them, see blog/files.py
+                enqueue('blog.tasks.delete_files', names=old_files)
+            enqueue('blog.tasks.process_post_image', image_id=self.pk)
+        self._stored_image = self.image.name
+
 
-        if img.height > 800 or img.width > 800:
-            output_size = (800, 800)
-            img.thumbnail(output_size)
-            img.save(self.image.path)
\ No newline at end of file
+class PostImageRendition(models.Model):
+    """Resized copy of a PostImage, see blog/images.py"""
+    image = models.ForeignKey(PostImage, on_delete=models.CASCADE, related_name='renditions')
+    name = models.CharField(max_length=20)  # Key of blog.images.RENDITIONS
+    format = models.CharField(max_length=10)  # Key of blog.images.FORMATS
+    file = models.ImageField(max_length=255)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['image', 'name', 'format'], name='blog_rendition_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.image} {self.name}.{self.format}'
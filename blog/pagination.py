@@ -0,0 +1,231 @@
+"""Keyset (cursor) pagination.
+
+Instead of OFFSET/LIMIT, each page is fetched with a WHERE clause that seeks
+past the last row of the previous page, so every page costs the same as the
+first one and no COUNT(*) is needed. Cursors are opaque url-safe tokens.
+
+EstimatedCountPaginator keeps OFFSET pagination (for the admin) but takes the
+number of rows of large unfiltered tables from the database statistics.
+"""
+import base64
+import binascii
+import datetime
+import decimal
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage, Paginator
+from django.db import connections
+from django.db.models import Q
+from django.http import Http404
+from django.utils.functional import cached_property
+
+
+class InvalidCursor(InvalidPage):
+    pass
+
+
+def _parse_ordering(ordering):
+    return [(field.lstrip('-'), field.startswith('-')) for field in ordering]
+
+
+def _to_json(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    return value
+
+
+class CursorPage:
+    """Page of results, exposing the subset of django.core.paginator.Page used by templates"""
+
+    def __init__(self, object_list, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f'<CursorPage of {len(self.object_list)} objects>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """Paginate a queryset on a unique ordering, e.g. ('-date_posted', '-id').
+
+    The last ordering field must be unique (normally the primary key) so that
+    rows sharing the same timestamp are neither skipped nor repeated.
+    Works with model instances as well as `.values()` dictionaries.
+    """
+
+    def __init__(self, queryset, per_page, ordering=('-date_posted', '-id')):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+        self.fields = _parse_ordering(self.ordering)
+
+    def encode_cursor(self, obj, direction):
+        values = [
+            _to_json(obj[name] if isinstance(obj, dict) else getattr(obj, name))
+            for name, _ in self.fields
+        ]
+        data = json.dumps({'d': direction, 'v': values}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            direction, values = data['d'], data['v']
+        except (ValueError, TypeError, KeyError, binascii.Error):
+            raise InvalidCursor('Invalid cursor')
+        if direction not in ('next', 'prev') or not isinstance(values, list) \
+                or len(values) != len(self.fields):
+            raise InvalidCursor('Invalid cursor')
+        try:
+            values = [self._field(name).to_python(value) for (name, _), value in zip(self.fields, values)]
+        except (ValidationError, TypeError, ValueError):
+            raise InvalidCursor('Invalid cursor')
+        # The ordering fields are not nullable, and NaN compares with nothing
+        if any(value is None or value != value for value in values):
+            raise InvalidCursor('Invalid cursor')
+        return direction, values
+
+    def _field(self, name):
+        """Model field or annotation output field of an ordering field, to validate cursor values"""
+        annotation = self.queryset.query.annotations.get(name)
+        if annotation is not None:
+            return annotation.output_field
+        return self.queryset.model._meta.get_field(name)
+
+    def _seek_filter(self, values, backwards):
+        """Rows strictly after (or before, when going backwards) the cursor position"""
+        condition = Q()
+        equal = Q()
+        for (name, descending), value in zip(self.fields, values):
+            lookup = 'lt' if descending != backwards else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def page(self, cursor=None):
+        queryset, values, backwards = self._page_queryset(cursor)
+        return self._make_page(list(queryset), values, backwards)
+
+    async def apage(self, cursor=None):
+        """page() for async views, fetching the rows with the async ORM API"""
+        queryset, values, backwards = self._page_queryset(cursor)
+        return self._make_page([row async for row in queryset], values, backwards)
+
+    def _page_queryset(self, cursor):
+        """The rows of the page at `cursor`, plus one to tell whether more follow"""
+        if cursor:
+            direction, values = self.decode_cursor(cursor)
+        else:
+            direction, values = 'next', None
+        backwards = direction == 'prev'
+
+        queryset = self.queryset
+        if values is not None:
+            queryset = queryset.filter(self._seek_filter(values, backwards))
+        if backwards:
+            ordering = [name if descending else f'-{name}' for name, descending in self.fields]
+        else:
+            ordering = self.ordering
+        return queryset.order_by(*ordering)[:self.per_page + 1], values, backwards
+
+    def _make_page(self, rows, values, backwards):
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+
+        if backwards:
+            rows.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, values is not None
+
+        next_cursor = previous_cursor = None
+        if rows and has_next:
+            next_cursor = self.encode_cursor(rows[-1], 'next')
+        if rows and has_previous:
+            previous_cursor = self.encode_cursor(rows[0], 'prev')
+        return CursorPage(rows, self, next_cursor, previous_cursor)
+
+
+class CursorPaginationMixin:
+    """Use with ListView in place of the default OFFSET pagination"""
+    cursor_kwarg = 'cursor'
+    cursor_ordering = ('-date_posted', '-id')
+
+    def get_cursor_ordering(self):
+        return self.cursor_ordering
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = CursorPaginator(queryset, page_size, self.get_cursor_ordering())
+        try:
+            page = paginator.page(self.request.GET.get(self.cursor_kwarg))
+        except InvalidCursor:
+            raise Http404('Invalid page cursor.')
+        return (paginator, page, page.object_list, page.has_other_pages())
+
+
+def estimate_row_count(model, using='default'):
+    """Rows in the table of `model` according to the planner statistics, None if unknown"""
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+        elif connection.vendor == 'sqlite':
+            # Filled in by ANALYZE: the first number of each row is the table size
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if cursor.fetchone() is None:
+                return None
+            cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table])
+        else:
+            return None
+        row = cursor.fetchone()
+    if row is None or row[0] is None:
+        return None
+    estimate = int(str(row[0]).split()[0])
+    return estimate if estimate >= 0 else None  # -1: never analyzed (PostgreSQL 14+)
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that skips the exact COUNT(*) of large unfiltered querysets.
+
+    The statistics count every row of the table, so only querysets without
+    any WHERE clause are estimated. Filtered querysets (search, list filters)
+    are still counted exactly, and so are models whose default manager
+    filters: Post.objects hides soft-deleted rows that the estimate includes.
+    """
+    # Below this many rows the exact count is cheap enough
+    exact_limit = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        model = getattr(queryset, 'model', None)
+        if model is not None and not queryset.query.where:
+            estimate = estimate_row_count(model, queryset.db)
+            if estimate is not None and estimate > self.exact_limit:
+                return estimate
+        return super().count
@@ -0,0 +1,143 @@
+"""Full-text search over listings.
+
+The index is kept in sync by the Post signals in blog/signals.py and can be
+rebuilt from scratch with `python manage.py rebuild_search_index`.
+The backend is chosen with the BLOG_SEARCH_BACKEND setting (dotted path);
+when it is empty the best backend for the default database is used.
+"""
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, FloatField, Func, Lookup, Q, Value
+from django.utils.module_loading import import_string
+
+from .models import PostSearchIndex
+
+# Title matches weigh more than content matches when ranking.
+TITLE_WEIGHT = 10.0
+CONTENT_WEIGHT = 1.0
+MAX_TERMS = 10
+
+
+def tokenize(query):
+    """Split a user query into plain search terms"""
+    return re.findall(r'\w+', query.lower())[:MAX_TERMS]
+
+
+@PostSearchIndex._meta.get_field('document').register_lookup
+class Match(Lookup):
+    """search_index__document__match=<FTS5 expression>"""
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', (*lhs_params, *rhs_params)
+
+
+class BaseSearchBackend:
+    """Interface every search backend implements.
+
+    `search()` returns the queryset restricted to matching posts and annotated
+    with `search_rank`: lower values are better matches.
+    """
+
+    def index(self, posts):
+        raise NotImplementedError
+
+    def remove(self, post_ids):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def search(self, queryset, query):
+        raise NotImplementedError
+
+    def no_results(self, queryset):
+        """Empty result of a query without search terms, annotated like the others"""
+        return queryset.none().annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+
+class SimpleSearchBackend(BaseSearchBackend):
+    """Fallback without an index: substring match on title and content"""
+
+    def index(self, posts):
+        pass
+
+    def remove(self, post_ids):
+        pass
+
+    def clear(self):
+        pass
+
+    def search(self, queryset, query):
+        terms = tokenize(query)
+        if not terms:
+            return self.no_results(queryset)
+        for term in terms:
+            queryset = queryset.filter(Q(title__icontains=term) | Q(content__icontains=term))
+        return queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+
+class SQLiteFTSSearchBackend(BaseSearchBackend):
+    """Inverted index stored in the `blog_post_fts` FTS5 virtual table.
+
+    Rows are keyed on the post id (the FTS rowid, see PostSearchIndex),
+    ranking uses bm25.
+    """
+    table = 'blog_post_fts'
+
+    def index(self, posts):
+        rows = [(post.pk, post.title, post.content) for post in posts]
+        if not rows:
+            return
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(
+                f'DELETE FROM {self.table} WHERE rowid = %s', [(row[0],) for row in rows]
+            )
+            cursor.executemany(
+                f'INSERT INTO {self.table} (rowid, title, content) VALUES (%s, %s, %s)', rows
+            )
+
+    def remove(self, post_ids):
+        post_ids = list(post_ids)
+        if not post_ids:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'DELETE FROM {self.table} WHERE rowid = %s', [(pk,) for pk in post_ids]
+            )
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+
+    def build_match(self, query):
+        """Turn user input into a safe FTS5 expression (prefix match on every term)"""
+        return ' '.join('"%s"*' % term for term in tokenize(query))
+
+    def search(self, queryset, query):
+        match = self.build_match(query)
+        if not match:
+            return self.no_results(queryset)
+        # One MATCH over the index, joined on the post id; bm25() reads the
+        # scores of that same full-text query
+        rank = Func(F('search_index__document'), Value(TITLE_WEIGHT), Value(CONTENT_WEIGHT),
+                    function='bm25', output_field=FloatField())
+        return queryset.filter(search_index__document__match=match).annotate(search_rank=rank)
+
+
+@lru_cache(maxsize=None)
+def _load_backend(path, vendor):
+    if path:
+        return import_string(path)()
+    if vendor == 'sqlite':
+        return SQLiteFTSSearchBackend()
+    return SimpleSearchBackend()
+
+
+def get_search_backend():
+    return _load_backend(getattr(settings, 'BLOG_SEARCH_BACKEND', ''), connection.vendor)
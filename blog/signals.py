@@ -0,0 +1,75 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from jobs.queue import enqueue
+from . import counters
+from .cache import CATEGORIES, FACETS, bump_version, invalidate_post
+from .files import image_files
+from .models import Category, Post, PostImage
+from .search import get_search_backend
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, update_fields=None, **kwargs):
+    """Keep the search index in sync with title and content"""
+    if instance.deleted_at is not None:
+        get_search_backend().remove([instance.pk])
+        return
+    if update_fields is not None and not {'title', 'content'} & set(update_fields):
+        return
+    get_search_backend().index([instance])
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, **kwargs):
+    get_search_backend().remove([instance.pk])
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_pages(sender, instance, **kwargs):
+    invalidate_post(instance.pk, instance.author_id)
+
+
+@receiver(post_save, sender=Post)
+def track_post_changes(sender, instance, created, **kwargs):
+    """Update the listing counters and the feed facets when a post is added, sold, moved or deleted"""
+    changed = None if created else instance.changed_fields()
+    if not created and (changed is None or changed <= {'title'}):
+        return  # Unchanged, or unknown for instances not loaded from the database
+    counters.post_changed(None if created else instance._stored_values, instance.tracked_values())
+    bump_version(FACETS)
+
+
+@receiver(post_delete, sender=Post)
+def untrack_post(sender, instance, **kwargs):
+    # Soft-deleted posts already left the counts
+    if counters.is_active(instance.tracked_values()):
+        counters.adjust_listing_counts(instance.category_id, instance.author_id, -1)
+        bump_version(FACETS)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_categories(sender, instance, **kwargs):
+    bump_version(CATEGORIES)
+
+
+@receiver(post_save, sender=PostImage)
+@receiver(post_delete, sender=PostImage)
+def touch_post(sender, instance, created=False, signal=None, **kwargs):
+    """Images are part of the post card: refresh its cache key and image count"""
+    changes = {'updated_at': timezone.now()}
+    if created:
+        changes['image_count'] = counters.shifted('image_count', 1)
+    elif signal is post_delete:
+        changes['image_count'] = counters.shifted('image_count', -1)
+    Post.objects.filter(pk=instance.post_id).update(**changes)
+    invalidate_post(instance.post_id)
+
+
+@receiver(post_delete, sender=PostImage)
+def delete_image_files(sender, instance, **kwargs):
+    names = image_files(instance)
+    if names:
+        enqueue('blog.tasks.delete_files', names=names)
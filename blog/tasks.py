@@ -0,0 +1,56 @@
+"""Background tasks, queued with jobs.queue.enqueue()"""
+from django.db import models, transaction
+
+from . import files
+from .images import generate_renditions
+from .models import Post, PostImage
+
+# Rows deleted per transaction when purging a post
+PURGE_BATCH_SIZE = 200
+
+
+def process_post_image(image_id):
+    """Generate the renditions of an uploaded PostImage and mark it ready"""
+    image = PostImage.objects.filter(pk=image_id).first()
+    if image is None:  # Deleted before the worker got to it
+        return
+    generate_renditions(image)
+
+
+def _delete_in_batches(queryset, batch_size):
+    """Delete the rows of `queryset` and everything cascading from them, children first.
+
+    Every batch of at most `batch_size` rows is deleted in a transaction of its
+    own, so no single transaction (and, on SQLite, no hold of the write lock)
+    spans the whole cascade.
+    """
+    for relation in queryset.model._meta.related_objects:
+        if relation.on_delete is models.CASCADE:
+            children = relation.related_model._base_manager.filter(
+                **{f'{relation.field.name}__in': queryset.values('pk')}
+            )
+            _delete_in_batches(children, batch_size)
+    while True:
+        with transaction.atomic():
+            ids = list(queryset.values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                return
+            queryset.model._base_manager.filter(pk__in=ids).delete()
+
+
+def purge_post(post_id, batch_size=PURGE_BATCH_SIZE):
+    """Delete a soft-deleted post with its images, conversations and messages.
+
+    The rows go in short batches, see _delete_in_batches(). The image files
+    are removed by the delete_files jobs queued by the PostImage post_delete
+    signal.
+    """
+    post = Post.all_objects.filter(pk=post_id, deleted_at__isnull=False)
+    if not post.exists():  # Already purged
+        return
+    _delete_in_batches(post, batch_size)
+
+
+def delete_files(names):
+    """Remove media files left behind by deleted rows"""
+    files.delete_files(names)
@@ -0,0 +1,11 @@
+from django import template
+
+from ..vendor import vendor_url
+
+register = template.Library()
+
+
+@register.simple_tag
+def vendor(name):
+    """URL of a third-party asset: {% vendor "bootstrap.css" %}"""
+    return vendor_url(name)
@@ -0,0 +1,17 @@
+from django import template
+
+from ..images import get_thumbnail
+
+register = template.Library()
+
+
+@register.simple_tag
+def thumbnail(image, name, **attrs):
+    """Pre-sized rendition of a PostImage with srcset.
+
+    {% thumbnail image "feed" class="img-fluid" alt=post.title %}
+    {% thumbnail image "full" as full %}<a href="{{ full.url }}">...</a>
+    """
+    if not image:
+        return ''
+    return get_thumbnail(image, name, attrs)
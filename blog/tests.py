@@ -1,3 +1,1164 @@
-from django.test import TestCase
+import base64
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import QuerySet
+from django.template import Context, Template
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+from PIL import Image
+
+from jobs.models import Job
+from jobs.queue import run_job
+from messaging.models import Conversation, ConversationMessage, ConversationSummary
+from monitoring.loadtest import routed_views
+from users.models import Profile
+
+from .bulk import BulkImportError, import_posts
+from .cache import get_categories
+from .counters import repair_counters
+from .facets import FeedFilters, category_counts
+from .images import generate_renditions, get_thumbnail, queue_missing_renditions
+from .tasks import purge_post
+from .middleware import check_shared_cache
+from .models import Category, Post, PostImage
+from .pagination import CursorPaginator, EstimatedCountPaginator, InvalidCursor, estimate_row_count
+from .search import get_search_backend
+from .uploads import ImageUploadHandler
+from .vendor import VENDOR_ASSETS, check_vendored_assets, is_vendored
+from . import views
+from .views import PostListView, UserPostListView
+
+
+MEDIA_ROOT = tempfile.mkdtemp()
+Image.new('RGB', (10, 10)).save(f'{MEDIA_ROOT}/default.jpg')
+
+
+def image_file(name='photo.png', size=(20, 20)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, 'red').save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+def tearDownModule():
+    shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class BlogTestCase(TestCase):
+    """Temporary MEDIA_ROOT and an empty cache for every test"""
+
+    def setUp(self):
+        cache.clear()
+
+
+class PostSearchTests(BlogTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('seller', password='pass')
+        cls.category = Category.objects.create(name='Bici')
+        cls.in_title = Post.objects.create(
+            title='Bicicletta da corsa', content='Telaio in alluminio',
+            author=cls.user, category=cls.category,
+        )
+        cls.in_content = Post.objects.create(
+            title='Casco', content='Perfetto per la bicicletta',
+            author=cls.user, category=cls.category,
+        )
+        cls.other = Post.objects.create(
+            title='Divano', content='Tre posti', author=cls.user, category=cls.category,
+        )
+
+    def search(self, query):
+        return list(get_search_backend().search(Post.objects.all(), query).order_by('search_rank'))
+
+    def test_title_matches_rank_first(self):
+        self.assertEqual(self.search('bicicletta'), [self.in_title, self.in_content])
+
+    def test_prefix_and_all_terms(self):
+        self.assertEqual(self.search('bici telaio'), [self.in_title])
+        self.assertEqual(self.search('"divano" OR'), [])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.other.title = 'Divano letto'
+        self.other.save()
+        self.assertEqual(self.search('letto'), [self.other])
+        self.other.delete()
+        self.assertEqual(self.search('divano'), [])
+
+    def test_home_view_search(self):
+        response = self.client.get(reverse('blog:home'), {'query': 'alluminio'})
+        self.assertEqual(list(response.context['posts']), [self.in_title])
+
+
+class CursorPaginationTests(BlogTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user('seller', password='pass')
+        category = Category.objects.create(name='Casa')
+        # Pairs of posts share the same timestamp to exercise the id tie-breaker
+        timestamps = [timezone.now() - timedelta(days=i // 2) for i in range(7)]
+        cls.posts = [
+            Post.objects.create(title=f'Post {i}', content='-', author=user,
+                                category=category, date_posted=date_posted)
+            for i, date_posted in enumerate(timestamps)
+        ]
+        cls.expected = sorted(cls.posts, key=lambda p: (p.date_posted, p.id), reverse=True)
+
+    def test_walk_forward_and_back(self):
+        paginator = CursorPaginator(Post.objects.all(), 3)
+        first = paginator.page()
+        second = paginator.page(first.next_cursor)
+        third = paginator.page(second.next_cursor)
+        self.assertFalse(first.has_previous())
+        self.assertFalse(third.has_next())
+        self.assertEqual(list(first) + list(second) + list(third), self.expected)
+
+        back = paginator.page(third.previous_cursor)
+        self.assertEqual(list(back), list(second))
+        self.assertEqual(list(paginator.page(back.previous_cursor)), list(first))
+        self.assertFalse(paginator.page(back.previous_cursor).has_previous())
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(InvalidCursor):
+            CursorPaginator(Post.objects.all(), 3).page('not-a-cursor')
+        response = self.client.get(reverse('blog:home'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_tampered_cursor_values(self):
+        def cursor(values):
+            data = json.dumps({'d': 'next', 'v': values}).encode()
+            return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+        tampered = [cursor(['garbage', 1]), cursor([{'a': 1}, 1]), cursor([None, None]),
+                    cursor([self.posts[0].date_posted.isoformat(), 'x'])]
+        for value in tampered:
+            with self.assertRaises(InvalidCursor):
+                CursorPaginator(Post.objects.all(), 3).page(value)
+            for params in ({}, {'query': 'post'}, {'sort': 'price_asc'}):
+                response = self.client.get(reverse('blog:home'), {'cursor': value, **params})
+                self.assertEqual(response.status_code, 404)
+            self.assertEqual(self.client.get(reverse('blog:user-posts', args=['seller']),
+                                             {'cursor': value}).status_code, 404)
+            self.assertEqual(self.client.get(reverse('blog:api-post-list'),
+                                             {'cursor': value}).status_code, 400)
+
+    def test_home_does_not_count(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('blog:home'))
+        # The only count is the cached per-category facet query
+        self.assertFalse([q for q in queries if 'COUNT(' in q['sql'] and 'GROUP BY' not in q['sql']])
+        self.assertEqual(list(response.context['posts']), self.expected[:5])
+        self.assertContains(response, response.context['page_obj'].next_cursor)
+
+
+class FacetTests(BlogTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user('seller', password='pass')
+        cls.casa = Category.objects.create(name='Casa')
+        cls.sport = Category.objects.create(name='Sport')
+        cls.lamp = Post.objects.create(title='Lampada', content='-', price=5, author=user, category=cls.casa)
+        cls.sofa = Post.objects.create(title='Divano', content='-', price=50, author=user, category=cls.casa)
+        cls.bike = Post.objects.create(title='Bici', content='-', price=20, author=user, category=cls.sport)
+        cls.sold = Post.objects.create(title='Sci', content='-', price=30, author=user, category=cls.sport,
+                                       is_sold=True)
+
+    def feed(self, **params):
+        return self.client.get(reverse('blog:home'), params).context
+
+    def test_price_range_sort_and_sold(self):
+        context = self.feed(min_price='10', sort='price_desc')
+        self.assertEqual(list(context['posts']), [self.sofa, self.bike])
+        context = self.feed(max_price='30', sort='price_asc', sold='all')
+        self.assertEqual(list(context['posts']), [self.lamp, self.bike, self.sold])
+        self.assertEqual(list(self.feed(sold='sold')['posts']), [self.sold])
+        # Invalid values are ignored
+        self.assertEqual(len(self.feed(min_price='abc', sort='?', sold='x')['posts']), 3)
+
+    def test_category_counts(self):
+        context = self.feed(category=str(self.casa.pk), max_price='40')
+        counts = {category.name: category.result_count for category in context['categories']}
+        # Counts ignore the selected category, so the other facets stay visible
+        self.assertEqual(counts, {'Casa': 1, 'Sport': 1})
+        self.assertEqual(context['result_count'], 1)
+        self.assertContains(self.client.get(reverse('blog:home')), 'Trovati <strong>3</strong> annunci')
+
+    def test_counts_are_cached_until_a_post_changes_facet(self):
+        filters = FeedFilters({})
+        with self.assertNumQueries(1):
+            category_counts(Post.objects.all(), filters)
+        self.lamp.title = 'Lampada da tavolo'
+        self.lamp.save()
+        with self.assertNumQueries(0):
+            category_counts(Post.objects.all(), filters)
+
+        self.lamp.category = self.sport
+        self.lamp.save()
+        self.assertEqual(category_counts(Post.objects.all(), filters), {self.casa.pk: 1, self.sport.pk: 2})
+        self.bike.soft_delete()
+        self.assertEqual(category_counts(Post.objects.all(), filters), {self.casa.pk: 1, self.sport.pk: 1})
+
+    def test_api_sort_pages_by_price(self):
+        url = reverse('blog:api-post-list')
+        first = self.client.get(url, {'sort': 'price_asc', 'limit': 2, 'fields': 'title'}).json()
+        second = self.client.get(url, {'sort': 'price_asc', 'limit': 2, 'fields': 'title',
+                                       'cursor': first['next']}).json()
+        self.assertEqual([post['title'] for post in first['results'] + second['results']],
+                         ['Lampada', 'Bici', 'Divano'])
+
+    def test_query_without_search_terms(self):
+        for query in ('"', '-', '!!'):
+            response = self.client.get(reverse('blog:home'), {'query': query})
+            self.assertEqual(response.status_code, 200, query)
+            self.assertEqual(list(response.context['posts']), [])
+            response = self.client.get(reverse('blog:api-post-list'), {'query': query})
+            self.assertEqual(response.status_code, 200, query)
+            self.assertEqual(response.json()['results'], [])
+        self.assertEqual(FeedFilters({'query': '!!'}).ordering, ('-date_posted', '-id'))
+
+
+class FeedQueryCountTests(BlogTestCase):
+    # posts page, cover images, their renditions, categories, category counts
+    FEED_QUERY_BUDGET = 5
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('seller', password='pass')
+        cls.category = Category.objects.create(name='Casa')
+
+    def create_posts(self, count):
+        for i in range(count):
+            post = Post.objects.create(title=f'Post {i}', content='-', author=self.user,
+                                       category=self.category)
+            for _ in range(2):
+                generate_renditions(PostImage.objects.create(post=post, image=image_file()))
+
+    def test_feed_renders_in_constant_queries(self):
+        self.create_posts(1)
+        with self.assertNumQueries(self.FEED_QUERY_BUDGET):
+            self.client.get(reverse('blog:home'))
+        self.create_posts(4)
+        # Categories now come from the cache
+        with self.assertNumQueries(self.FEED_QUERY_BUDGET - 1):
+            response = self.client.get(reverse('blog:home'))
+        self.assertContains(response, '<picture><source type="image/webp"', count=5)
+
+    def test_cover_is_first_image(self):
+        self.create_posts(1)
+        post = Post.objects.with_cover_image().get()
+        self.assertEqual(post.cover_image, post.images.order_by('uploaded_at', 'id').first())
+
+
+class ImagePipelineTests(BlogTestCase):
+
+    def setUp(self):
+        super().setUp()
+        user = User.objects.create_user('seller', password='pass')
+        category = Category.objects.create(name='Casa')
+        self.post = Post.objects.create(title='Lampada', content='-', author=user, category=category)
+
+    def test_upload_is_queued_then_processed(self):
+        image = PostImage.objects.create(post=self.post, image=image_file(size=(1000, 500)))
+        self.assertEqual(image.status, PostImage.PENDING)
+        job = Job.objects.get(task='blog.tasks.process_post_image')
+        self.assertEqual(job.payload, {'image_id': image.pk})
+
+        self.assertEqual(run_job(job.pk, claim_first=True), Job.DONE)
+        image.refresh_from_db()
+        self.assertEqual(image.status, PostImage.READY)
+        self.assertEqual((image.width, image.height), (1000, 500))
+        sizes = {(r.name, r.format): (r.width, r.height) for r in image.renditions.all()}
+        self.assertEqual(sizes[('feed', 'webp')], (400, 200))
+        self.assertEqual(sizes[('detail', 'jpeg')], (800, 400))
+        self.assertEqual(sizes[('full', 'jpeg')], (1000, 500))  # Never upscaled
+
+    def test_corrupt_upload_is_marked_failed(self):
+        upload = SimpleUploadedFile('broken.png', b'not an image', content_type='image/png')
+        image = PostImage.objects.create(post=self.post, image=upload)
+        job = Job.objects.get(task='blog.tasks.process_post_image')
+        self.assertEqual(run_job(job.pk, claim_first=True), Job.DONE)
+        image.refresh_from_db()
+        self.assertEqual(image.status, PostImage.FAILED)
+
+
+class ThumbnailTests(BlogTestCase):
+
+    def setUp(self):
+        super().setUp()
+        user = User.objects.create_user('seller', password='pass')
+        category = Category.objects.create(name='Casa')
+        post = Post.objects.create(title='Lampada', content='-', author=user, category=category)
+        self.image = PostImage.objects.create(post=post, image=image_file(size=(1200, 900)))
+
+    def render(self):
+        for job_id in Job.objects.filter(status=Job.PENDING).values_list('id', flat=True):
+            run_job(job_id, claim_first=True)
+        return PostImage.objects.prefetch_related('renditions').get(pk=self.image.pk)
+
+    def test_placeholder_until_rendered_by_the_worker(self):
+        with self.assertNumQueries(1):
+            thumb = get_thumbnail(self.image, 'feed')
+        self.assertEqual(thumb.url, '/static/blog/placeholder.svg')
+        self.assertFalse(self.image.renditions.exists())
+
+        image = self.render()
+        self.assertEqual(image.status, PostImage.READY)
+        with self.assertNumQueries(0):
+            thumb = get_thumbnail(image, 'feed')
+        self.assertEqual((thumb.width, thumb.height), (400, 300))
+        self.assertIn('/media/renditions/', thumb.url)
+        self.assertEqual(thumb.srcset.count('w, '), 1)  # feed 400w, detail 800w
+        self.assertTrue(thumb.webp_srcset.endswith('detail.webp 800w'))
+
+    def test_missing_renditions_are_queued_by_the_command(self):
+        image = self.render()
+        image.renditions.filter(name='feed').delete()
+        image = PostImage.objects.prefetch_related('renditions').get(pk=self.image.pk)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(get_thumbnail(image, 'feed').url, '/static/blog/placeholder.svg')
+        self.assertFalse([q for q in queries if not q['sql'].startswith('SELECT')])
+
+        stdout = io.StringIO()
+        call_command('queue_missing_renditions', dry_run=True, stdout=stdout)
+        self.assertIn('1 images missing a rendition', stdout.getvalue())
+        jobs = Job.objects.count()
+        call_command('queue_missing_renditions', stdout=stdout)
+        call_command('queue_missing_renditions', stdout=stdout)
+        self.assertEqual(Job.objects.count(), jobs + 1)
+        self.assertIn('/media/renditions/', get_thumbnail(self.render(), 'feed').url)
+        self.assertEqual(queue_missing_renditions(dry_run=True), 0)
+
+    def test_concurrent_generation(self):
+        generate_renditions(self.image)
+        # The other run inserts the same rows between our delete and insert
+        with mock.patch.object(QuerySet, 'delete', return_value=(0, {})):
+            generate_renditions(PostImage.objects.get(pk=self.image.pk))
+        self.assertEqual(self.image.renditions.count(), len(generate_renditions(self.image)))
+
+    def test_template_tag(self):
+        self.image = self.render()
+        html = Template(
+            '{% load blog_images %}{% thumbnail image "detail" alt="Foto" %}'
+        ).render(Context({'image': self.image}))
+        self.assertTrue(html.startswith('<picture><source type="image/webp"'))
+        self.assertIn('alt="Foto"', html)
+        self.assertIn('width="800" height="600"', html)
+
+    def test_detail_page_gallery(self):
+        self.render()
+        response = self.client.get(self.image.post.get_absolute_url())
+        self.assertContains(response, 'full.jpg" target="_blank"')
+        self.assertContains(response, 'detail.webp 800w')
+
+    def test_failed_image_shows_placeholder(self):
+        PostImage.objects.filter(pk=self.image.pk).update(status=PostImage.FAILED)
+        self.image.refresh_from_db()
+        self.assertEqual(get_thumbnail(self.image, 'feed').url, '/static/blog/placeholder.svg')
+
+
+class CacheTests(BlogTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('seller', password='pass')
+        cls.category = Category.objects.create(name='Casa')
+        cls.post = Post.objects.create(title='Lampada', content='-', author=cls.user,
+                                       category=cls.category)
+
+    def test_categories_cached_until_changed(self):
+        self.assertEqual(get_categories(), [self.category])
+        with self.assertNumQueries(0):
+            get_categories()
+        other = Category.objects.create(name='Auto')
+        self.assertEqual(get_categories(), [other, self.category])
+        other.delete()
+        self.assertEqual(get_categories(), [self.category])
+
+    def test_post_card_invalidation(self):
+        self.assertContains(self.client.get(reverse('blog:home')), 'Lampada')
+        self.post.title = 'Lampada da tavolo'
+        self.post.save()
+        self.assertContains(self.client.get(reverse('blog:home')), 'Lampada da tavolo')
+
+        PostImage.objects.create(post=self.post, image=image_file())
+        self.assertContains(self.client.get(reverse('blog:home')), 'feed-thumbnail')
+
+        self.category.name = 'Arredamento'
+        self.category.save()
+        self.assertContains(self.client.get(reverse('blog:home')), 'bg-secondary">Arredamento<')
+
+
+class PageCacheTests(BlogTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('seller', password='pass')
+        cls.category = Category.objects.create(name='Casa')
+        cls.post = Post.objects.create(title='Lampada', content='-', author=cls.user,
+                                       category=cls.category)
+
+    def test_anonymous_pages_are_cached(self):
+        for url in (reverse('blog:home'), self.post.get_absolute_url(),
+                    reverse('blog:user-posts', args=['seller'])):
+            self.assertEqual(self.client.get(url)['X-Page-Cache'], 'miss')
+            with self.assertNumQueries(0):
+                response = self.client.get(url)
+            self.assertEqual(response['X-Page-Cache'], 'hit')
+            self.assertContains(response, 'Lampada')
+
+    def test_process_local_cache_is_refused(self):
+        self.assertEqual(check_shared_cache(None), [])
+        locmem = {'default': {'BACKEND': 'monitoring.cache.LocMemCache', 'LOCATION': 'check'}}
+        with self.settings(CACHES=locmem):
+            self.assertEqual([e.id for e in check_shared_cache(None)], ['blog.E002'])
+            without_page_cache = [m for m in settings.MIDDLEWARE if not m.startswith('blog.middleware.')]
+            with self.settings(MIDDLEWARE=without_page_cache):
+                self.assertEqual(check_shared_cache(None), [])
+
+    def test_conditional_get(self):
+        response = self.client.get(reverse('blog:home'))
+        self.assertEqual(self.client.get(reverse('blog:home'),
+                                         HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(self.client.get(reverse('blog:home'),
+                                         HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+
+    def test_query_string_is_normalized(self):
+        self.client.get(reverse('blog:home'), {'query': 'lampada', 'category': self.category.pk})
+        response = self.client.get(reverse('blog:home'), {'category': self.category.pk, 'query': ' lampada'})
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        response = self.client.get(reverse('blog:home'), {'utm_source': 'x'})
+        self.assertNotIn('X-Page-Cache', response)
+
+    def test_invalidated_by_changes(self):
+        self.client.get(self.post.get_absolute_url())
+        self.client.get(reverse('blog:home'))
+        self.post.title = 'Lampada da tavolo'
+        self.post.save()
+        self.assertContains(self.client.get(self.post.get_absolute_url()), 'Lampada da tavolo')
+        self.assertEqual(self.client.get(reverse('blog:home'))['X-Page-Cache'], 'miss')
+
+        Category.objects.create(name='Auto')
+        self.assertContains(self.client.get(reverse('blog:home')), 'Auto')
+
+    def test_logged_in_users_bypass_cache(self):
+        self.client.get(reverse('blog:home'))
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('blog:home'))
+        self.assertNotIn('X-Page-Cache', response)
+        self.assertContains(response, 'New Post')
+
+
+class AsyncViewTests(BlogTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('seller', password='pass')
+        cls.category = Category.objects.create(name='Casa')
+        for i in range(7):
+            cls.post = Post.objects.create(title=f'Lampada {i}', content='-', author=cls.user,
+                                           category=cls.category)
+
+    def setUp(self):
+        super().setUp()
+        self.enterContext(routed_views(True))
+
+    def test_async_views_are_routed(self):
+        for url, view in ((reverse('blog:home'), views.apost_list),
+                          (reverse('blog:user-posts', args=['seller']), views.auser_posts),
+                          (self.post.get_absolute_url(), views.apost_detail)):
+            self.assertIs(resolve(url).func, view)
+
+    async def test_same_pages_as_sync_views(self):
+        urls = [reverse('blog:home'), f"{reverse('blog:home')}?sort=price_asc&sold=all",
+                reverse('blog:user-posts', args=['seller']), self.post.get_absolute_url()]
+        for url in urls:
+            response = await self.async_client.get(url)
+            self.assertEqual(response['X-Page-Cache'], 'miss')
+            await cache.aclear()
+            with routed_views(False):
+                expected = await self.async_client.get(url)
+            await cache.aclear()
+            self.assertEqual(response.content, expected.content, url)
+
+    async def test_feed_pages(self):
+        response = await self.async_client.get(reverse('blog:home'))
+        self.assertEqual([post.title for post in response.context['posts']],
+                         ['Lampada 6', 'Lampada 5', 'Lampada 4', 'Lampada 3', 'Lampada 2'])
+        self.assertContains(response, 'Casa (7)')
+        response = await self.async_client.get(reverse('blog:home'),
+                                               {'cursor': response.context['page_obj'].next_cursor})
+        self.assertEqual([post.title for post in response.context['posts']], ['Lampada 1', 'Lampada 0'])
+        response = await self.async_client.get(reverse('blog:home'), {'cursor': 'invalid'})
+        self.assertEqual(response.status_code, 404)
+        response = await self.async_client.get(reverse('blog:home'), {'query': '!!'})
+        self.assertEqual(response.status_code, 200)
+
+    async def test_page_cache(self):
+        url = reverse('blog:user-posts', args=['seller'])
+        self.assertEqual((await self.async_client.get(url))['X-Page-Cache'], 'miss')
+        response = await self.async_client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        self.assertContains(response, '7 annunci attivi')
+
+    async def test_not_found(self):
+        await sync_to_async(self.post.soft_delete)()
+        for url in (self.post.get_absolute_url(), reverse('blog:user-posts', args=['nobody'])):
+            self.assertEqual((await self.async_client.get(url)).status_code, 404)
+
+
+class QueryPlanTests(BlogTestCase):
+    """The listing queries must be answered from the composite indexes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('seller', password='pass')
+        cls.category = Category.objects.create(name='Casa')
+        Post.objects.bulk_create(
+            Post(title=f'Post {i}', content='-', author=cls.user, category=cls.category,
+                 is_sold=i % 3 == 0)
+            for i in range(50)
+        )
+
+    def view_queryset(self, view_class, params=None, **kwargs):
+        view = view_class()
+        view.setup(RequestFactory().get('/', params or {}), **kwargs)
+        return view.get_queryset()[:6]
+
+    def assertUsesIndex(self, queryset, index):
+        plan = queryset.explain()
+        self.assertIn(index, plan)
+        self.assertNotIn('TEMP B-TREE', plan)  # No sort step
+
+    def test_feed(self):
+        self.assertUsesIndex(self.view_queryset(PostListView), 'blog_post_unsold_date_idx')
+
+    def test_feed_by_category(self):
+        queryset = self.view_queryset(PostListView, {'category': self.category.pk})
+        self.assertUsesIndex(queryset, 'blog_post_category_date_idx')
+
+    def test_user_posts(self):
+        queryset = self.view_queryset(UserPostListView, username='seller')
+        self.assertUsesIndex(queryset, 'blog_post_author_date_idx')
+
+    def test_search_matches_once(self):
+        plan = self.view_queryset(PostListView, {'query': 'post'}).explain()
+        # One full-text query over the index, then the posts by primary key
+        self.assertRegex(plan, r'SCAN blog_post_fts VIRTUAL TABLE INDEX \d+:M')
+        self.assertIn('SEARCH blog_post USING INTEGER PRIMARY KEY', plan)
+        self.assertEqual(plan.count('blog_post_fts'), 1)
+        self.assertNotIn('SUBQUERY', plan)
+        self.assertNotIn('LEFT-JOIN', plan)
+
+
+class SeedMarketplaceTests(BlogTestCase):
+
+    def test_seed(self):
+        call_command('seed_marketplace', users=5, posts=30, conversations=4, messages=3,
+                     max_images=2, stdout=io.StringIO())
+        self.assertEqual(User.objects.filter(username__startswith='seed').count(), 5)
+        self.assertEqual(User.objects.filter(profile__isnull=True).count(), 0)
+        self.assertEqual(Post.objects.count(), 30)
+        self.assertEqual(Job.objects.count(), PostImage.objects.count())
+        self.assertEqual(Conversation.objects.count(), 4)
+        self.assertEqual(ConversationSummary.objects.count(), 8)
+        post = Post.objects.first()
+        self.assertIn(post, get_search_backend().search(Post.objects.all(), post.title))
+
+        # Users are reused when seeding again
+        call_command('seed_marketplace', users=5, posts=10, conversations=0, stdout=io.StringIO())
+        self.assertEqual(User.objects.count(), 5)
+        self.assertEqual(Post.objects.count(), 40)
+        # Bulk inserts keep the counters right
+        self.assertEqual(sum(repair_counters(dry_run=True).values()), 0)
+
+
+class CounterTests(BlogTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('seller', password='pass')
+        cls.casa = Category.objects.create(name='Casa')
+        cls.sport = Category.objects.create(name='Sport')
+
+    def counts(self):
+        return (Category.objects.get(pk=self.casa.pk).active_post_count,
+                Category.objects.get(pk=self.sport.pk).active_post_count,
+                Profile.objects.get(user=self.user).active_listing_count)
+
+    def test_listing_counts_follow_posts(self):
+        post = Post.objects.create(title='Lampada', content='-', author=self.user, category=self.casa)
+        Post.objects.create(title='Sci', content='-', author=self.user, category=self.sport, is_sold=True)
+        self.assertEqual(self.counts(), (1, 0, 1))
+
+        post = Post.objects.get(pk=post.pk)
+        post.category = self.sport
+        post.save()
+        self.assertEqual(self.counts(), (0, 1, 1))
+        post.is_sold = True
+        post.save()
+        self.assertEqual(self.counts(), (0, 0, 0))
+        post.is_sold = False
+        post.save()
+        self.assertEqual(self.counts(), (0, 1, 1))
+
+        post.soft_delete()
+        self.assertEqual(self.counts(), (0, 0, 0))
+        run_job(Job.objects.get(task='blog.tasks.purge_post').pk)
+        self.assertFalse(Post.all_objects.filter(pk=post.pk).exists())
+        self.assertEqual(self.counts(), (0, 0, 0))
+
+        Post.objects.create(title='Divano', content='-', author=self.user, category=self.casa).delete()
+        self.assertEqual(self.counts(), (0, 0, 0))
+
+    def test_image_count(self):
+        post = Post.objects.create(title='Lampada', content='-', author=self.user, category=self.casa)
+        images = [PostImage.objects.create(post=post, image=image_file()) for _ in range(2)]
+        self.assertEqual(Post.objects.get(pk=post.pk).image_count, 2)
+        images[0].save()
+        images[1].delete()
+        self.assertEqual(Post.objects.get(pk=post.pk).image_count, 1)
+
+    def test_drifted_counters_stay_at_zero(self):
+        post = Post.objects.create(title='Lampada', content='-', author=self.user, category=self.casa)
+        image = PostImage.objects.create(post=post, image=image_file())
+        Post.objects.update(image_count=0)
+        Category.objects.update(active_post_count=0)
+        Profile.objects.update(active_listing_count=0)
+
+        image.delete()
+        post = Post.objects.get(pk=post.pk)
+        post.is_sold = True
+        post.save()
+        self.assertEqual(Post.objects.get(pk=post.pk).image_count, 0)
+        self.assertEqual(self.counts(), (0, 0, 0))
+
+    def test_repair(self):
+        post = Post.objects.create(title='Lampada', content='-', author=self.user, category=self.casa)
+        PostImage.objects.create(post=post, image=image_file())
+        Post.objects.update(image_count=5)
+        Category.objects.update(active_post_count=0)
+        stdout = io.StringIO()
+        call_command('repair_counters', dry_run=True, stdout=stdout)
+        self.assertIn('2 rows drifted', stdout.getvalue())
+        self.assertEqual(Post.objects.get().image_count, 5)
+
+        call_command('repair_counters', stdout=stdout)
+        self.assertEqual(Post.objects.get().image_count, 1)
+        self.assertEqual(self.counts(), (1, 0, 1))
+        self.assertEqual(sum(repair_counters(dry_run=True).values()), 0)
+
+
+class AdminTests(BlogTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', password='pass')
+        cls.casa = Category.objects.create(name='Casa')
+        cls.sport = Category.objects.create(name='Sport')
+        cls.posts = [
+            Post.objects.create(title=f'Post {i}', content='-', author=cls.admin, category=cls.casa)
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.admin)
+
+    def action(self, action, posts, **data):
+        return self.client.post(reverse('admin:blog_post_changelist'), {
+            'action': action, '_selected_action': [post.pk for post in posts], **data,
+        })
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        url = reverse('admin:blog_post_changelist')
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(url)
+        for i in range(5):
+            Post.objects.create(title=f'Altro {i}', content='-', author=self.admin, category=self.sport)
+        with CaptureQueriesContext(connection) as more:
+            response = self.client.get(url)
+        self.assertEqual(len(more), len(few))
+        self.assertContains(response, 'Altro 4')
+        self.assertEqual(self.client.get(reverse('admin:blog_postimage_changelist')).status_code, 200)
+
+    def test_mark_sold(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.action('mark_sold', self.posts[:2])
+        self.assertEqual(len([q for q in queries if q['sql'].startswith('UPDATE "blog_post"')]), 1)
+        self.assertEqual(Post.objects.filter(is_sold=True).count(), 2)
+        self.assertEqual(Category.objects.get(pk=self.casa.pk).active_post_count, 1)
+        self.assertEqual(sum(repair_counters(dry_run=True).values()), 0)
+
+    def test_reassign_category(self):
+        response = self.action('reassign_category', self.posts[:2])
+        self.assertContains(response, 'Nuova categoria')
+        self.assertFalse(Post.objects.filter(category=self.sport).exists())
+
+        self.action('reassign_category', self.posts[:2], apply='1', category=self.sport.pk)
+        self.assertEqual(set(Post.objects.filter(category=self.sport)), set(self.posts[:2]))
+        self.assertEqual(Category.objects.get(pk=self.sport.pk).active_post_count, 2)
+        self.assertEqual(sum(repair_counters(dry_run=True).values()), 0)
+
+    def test_estimated_count(self):
+        for post in self.posts:
+            PostImage.objects.create(post=post, image='post_images/photo.jpg')
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        paginator = EstimatedCountPaginator(PostImage.objects.order_by('-pk'), 2)
+        paginator.exact_limit = 1
+        self.assertEqual(estimate_row_count(PostImage), 3)
+        PostImage.objects.create(post=self.posts[0], image='post_images/photo.jpg')
+        # Statistics lag behind until the next ANALYZE, filtered querysets are counted
+        self.assertEqual(paginator.count, 3)
+        self.assertEqual(EstimatedCountPaginator(
+            PostImage.objects.filter(post=self.posts[0]).order_by('-pk'), 2).count, 2)
+
+    def test_soft_deleted_rows_are_not_estimated(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.posts[0].soft_delete()
+        paginator = EstimatedCountPaginator(Post.objects.order_by('-pk'), 2)
+        paginator.exact_limit = 1
+        self.assertEqual(paginator.count, 2)
+
+
+class BulkImportExportTests(BlogTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', password='pass')
+        cls.category = Category.objects.create(name='Casa')
+
+    def archive(self, *names):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as archive:
+            for name in names:
+                archive.writestr(name, image_file(name).read())
+            archive.writestr('fake.jpg', b'not an image')
+        buffer.seek(0)
+        buffer.name = 'images.zip'
+        return buffer
+
+    def test_csv_import_reports_row_errors(self):
+        rows = (
+            'title,content,category,price,is_sold,images\n'
+            'Lampada,Da tavolo,Casa,15,false,a.png;b.png\n'
+            'Sedia,Legno,Sconosciuta,10,false,\n'
+            'Tavolo,Legno,casa,-1,false,\n'
+            'Vaso,Vetro,%d,5,true,fake.jpg\n'
+            'Divano,"Tre posti,\nverde",casa,200,true,\n' % self.category.pk
+        )
+        self.client.force_login(self.seller)
+        response = self.client.post(reverse('blog:post-import'), {
+            'file': SimpleUploadedFile('posts.csv', rows.encode()),
+            'images': SimpleUploadedFile('images.zip', self.archive('a.png', 'b.png').getvalue()),
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(Post.objects.values_list('title', flat=True)), ['Divano', 'Lampada'])
+        lampada = Post.objects.get(title='Lampada')
+        self.assertEqual(lampada.images.count(), 2)
+        self.assertEqual(Job.objects.filter(task='blog.tasks.process_post_image').count(), 2)
+        self.assertIn(lampada, get_search_backend().search(Post.objects.all(), 'lampada'))
+        self.assertEqual([line for line, _ in response.context['result'].errors], [3, 4, 5])
+        self.assertContains(response, 'Riga 3: category: Categoria sconosciuta: Sconosciuta')
+
+    def test_non_string_image_names_are_row_errors(self):
+        rows = (json.dumps({'title': 'Lampada', 'content': '-', 'category': 'Casa', 'price': 5, 'images': [1, 2]}) + '\n'
+                + json.dumps({'title': 'Sedia', 'content': '-', 'category': 'Casa', 'price': 5}) + '\n')
+        result = import_posts(io.BytesIO(rows.encode()), 'jsonl', self.seller)
+        self.assertEqual(result.created, 1)
+        self.assertEqual([line for line, _ in result.errors], [1])
+
+    def test_non_utf8_file_is_refused_before_importing(self):
+        rows = 'title,content,category,price,is_sold\nSedia,-,Casa,1,false\nCaffè,-,Casa,1,false\n'
+        with self.assertRaises(BulkImportError):
+            import_posts(io.BytesIO(rows.encode('latin-1')), 'csv', self.seller, batch_size=1)
+        self.assertFalse(Post.objects.exists())
+
+        self.client.force_login(self.seller)
+        response = self.client.post(reverse('blog:post-import'), {
+            'file': SimpleUploadedFile('posts.csv', rows.encode('latin-1')),
+        })
+        self.assertContains(response, 'UTF-8')
+
+    def test_command_jsonl_import_in_batches(self):
+        path = os.path.join(MEDIA_ROOT, 'posts.jsonl')
+        with open(path, 'w') as f:
+            for i in range(5):
+                f.write(json.dumps({'title': f'Post {i}', 'content': '-', 'category': 'Casa', 'price': i}) + '\n')
+            f.write('{broken\n')
+        stderr = io.StringIO()
+        with CaptureQueriesContext(connection) as queries:
+            call_command('import_posts', path, author='seller', batch_size=2,
+                         stdout=io.StringIO(), stderr=stderr)
+        self.assertEqual(Post.objects.filter(author=self.seller).count(), 5)
+        self.assertIn('Line 6:', stderr.getvalue())
+        inserts = [q for q in queries if q['sql'].startswith('INSERT INTO "blog_post"')]
+        self.assertEqual(len(inserts), 3)
+
+    def test_streaming_export(self):
+        post = Post.objects.create(title='Lampada', content='Da tavolo', author=self.seller,
+                                   category=self.category, price=15)
+        PostImage.objects.create(post=post, image=image_file())
+        Post.objects.create(title='Altro', content='-', category=self.category,
+                            author=User.objects.create_user('other', password='pass'))
+        self.client.force_login(self.seller)
+
+        response = self.client.get(reverse('blog:post-export'))
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'id,date_posted,title,content,category,price,is_sold,images')
+        self.assertEqual(len(lines), 2)
+        self.assertIn('Lampada,Da tavolo,Casa,15.0,False,post_images/photo', lines[1])
+
+        response = self.client.get(reverse('blog:post-export'), {'format': 'jsonl'})
+        row = json.loads(b''.join(response.streaming_content))
+        self.assertEqual((row['title'], row['category']), ('Lampada', 'Casa'))
+
+
+class ApiTests(BlogTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', password='pass')
+        cls.category = Category.objects.create(name='Casa')
+        now = timezone.now()
+        cls.posts = [
+            Post.objects.create(title=f'Lampada {i}', content='Da tavolo', author=cls.seller,
+                                category=cls.category, price=i, date_posted=now - timedelta(hours=i))
+            for i in range(5)
+        ]
+        Post.objects.create(title='Sedia', content='Legno', author=cls.seller, category=cls.category,
+                            is_sold=True)
+
+    def test_sparse_fields_and_cursor_pagination(self):
+        url = reverse('blog:api-post-list')
+        response = self.client.get(url, {'fields': 'title,price', 'limit': 3})
+        data = response.json()
+        self.assertEqual(data['results'], [
+            {'title': 'Lampada 0', 'price': 0.0},
+            {'title': 'Lampada 1', 'price': 1.0},
+            {'title': 'Lampada 2', 'price': 2.0},
+        ])
+        self.assertIsNone(data['previous'])
+        data = self.client.get(url, {'fields': 'title', 'limit': 3, 'cursor': data['next']}).json()
+        self.assertEqual([post['title'] for post in data['results']], ['Lampada 3', 'Lampada 4'])
+        self.assertIsNone(data['next'])
+
+    def test_same_filters_as_feed(self):
+        data = self.client.get(reverse('blog:api-post-list'), {'query': 'sedia'}).json()
+        self.assertEqual(data['results'], [])
+        data = self.client.get(reverse('blog:api-post-list'), {'query': 'lampada 3'}).json()
+        self.assertEqual([post['id'] for post in data['results']], [self.posts[3].pk])
+        self.assertEqual(data['results'][0]['author'], 'seller')
+        self.assertNotIn('content', data['results'][0])
+
+    def test_fetch_by_ids_in_one_query(self):
+        sold = Post.objects.get(title='Sedia')
+        ids = f'{self.posts[2].pk},{sold.pk},999,{self.posts[0].pk}'
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('blog:api-post-list'), {'ids': ids, 'fields': 'id'})
+        self.assertEqual(response.json()['results'],
+                         [{'id': self.posts[2].pk}, {'id': sold.pk}, {'id': self.posts[0].pk}])
+
+    def test_etag_and_not_modified(self):
+        url = reverse('blog:api-post-detail', args=[self.posts[0].pk])
+        response = self.client.get(url)
+        self.assertEqual(response.json()['content'], 'Da tavolo')
+        self.assertEqual(response.json()['images'], [])
+        etag = response['ETag']
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+        self.posts[0].price = 99
+        self.posts[0].save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_images(self):
+        image = PostImage.objects.create(post=self.posts[0], image=image_file(size=(600, 300)))
+        generate_renditions(image)
+        data = self.client.get(reverse('blog:api-post-detail', args=[self.posts[0].pk]),
+                               {'fields': 'images'}).json()
+        self.assertEqual(data['images'][0]['feed']['width'], 400)
+        self.assertTrue(data['images'][0]['detail']['url'].endswith('.jpg'))
+
+    def test_user_posts_and_categories(self):
+        data = self.client.get(reverse('blog:api-user-posts', args=['seller']), {'fields': 'title'}).json()
+        self.assertEqual(len(data['results']), 6)
+        self.assertEqual(self.client.get(reverse('blog:api-user-posts', args=['nobody'])).status_code, 404)
+        data = self.client.get(reverse('blog:api-categories')).json()
+        self.assertEqual(data['results'], [{'id': self.category.pk, 'name': 'Casa'}])
+
+    def test_bad_requests(self):
+        url = reverse('blog:api-post-list')
+        self.assertEqual(self.client.get(url, {'fields': 'password'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'cursor': 'nope'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'ids': 'a,b'}).status_code, 400)
+        self.assertEqual(self.client.post(url).status_code, 405)
+
+
+class SoftDeleteTests(BlogTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.seller = User.objects.create_user('seller', password='pass')
+        self.buyer = User.objects.create_user('buyer', password='pass')
+        category = Category.objects.create(name='Casa')
+        self.post = Post.objects.create(title='Lampada', content='-', author=self.seller, category=category)
+        self.image = PostImage.objects.create(post=self.post, image=image_file(size=(500, 500)))
+        self.run_jobs()
+
+    def run_jobs(self):
+        """Run the queued jobs, including those queued by the jobs themselves"""
+        while job := Job.objects.filter(status=Job.PENDING).order_by('id').first():
+            run_job(job.pk, claim_first=True)
+
+    def test_delete_hides_then_purges(self):
+        self.client.force_login(self.buyer)
+        self.client.post(reverse('conversation:new', args=[self.post.pk]), {'content': 'Ciao'})
+        self.image.refresh_from_db()
+        files = [self.image.image.path] + [r.file.path for r in self.image.renditions.all()]
+        self.assertTrue(all(os.path.exists(path) for path in files))
+
+        self.client.force_login(self.seller)
+        response = self.client.post(reverse('blog:post-delete', args=[self.post.pk]))
+        self.assertRedirects(response, '/')
+        self.assertFalse(Post.objects.filter(pk=self.post.pk).exists())
+        self.assertTrue(Post.all_objects.filter(pk=self.post.pk).exists())
+        self.assertEqual(ConversationSummary.objects.count(), 0)
+        self.assertNotContains(self.client.get(reverse('blog:home')), 'Lampada')
+        self.assertEqual(self.client.get(self.post.get_absolute_url()).status_code, 404)
+        self.assertFalse(get_search_backend().search(Post.objects.all(), 'lampada').exists())
+
+        self.run_jobs()
+        self.assertFalse(Post.all_objects.filter(pk=self.post.pk).exists())
+        self.assertFalse(Conversation.objects.exists())
+        self.assertFalse(any(os.path.exists(path) for path in files))
+
+    def test_shared_files_are_kept(self):
+        other = PostImage.objects.create(post=self.post, image=self.image.image.name)
+        self.run_jobs()
+        self.image.delete()
+        self.run_jobs()
+        self.assertTrue(os.path.exists(other.image.path))
+        other.refresh_from_db()
+        self.assertTrue(all(os.path.exists(r.file.path) for r in other.renditions.all()))
+
+    def test_purge_in_short_transactions(self):
+        self.client.force_login(self.buyer)
+        for content in ('Ciao', 'Ancora disponibile?', 'Posso passare domani?'):
+            self.client.post(reverse('conversation:new', args=[self.post.pk]), {'content': content})
+        PostImage.objects.create(post=self.post, image=image_file())
+        self.run_jobs()
+        self.post.soft_delete()
+        Job.objects.filter(task='blog.tasks.purge_post').delete()
+
+        with CaptureQueriesContext(connection) as queries:
+            purge_post(self.post.pk, batch_size=1)
+        # 3 messages, 2 inbox rows, 1 conversation, 12 renditions, 2 images and the post
+        batches = [q for q in queries if q['sql'].startswith('SAVEPOINT')]
+        self.assertGreaterEqual(len(batches), 21)
+        self.assertFalse(Post.all_objects.exists())
+        self.assertFalse(ConversationMessage.objects.exists())
+        self.assertFalse(PostImage.objects.exists())
+
+    def test_replaced_upload_files_are_deleted(self):
+        image = PostImage.objects.get(pk=self.image.pk)
+        files = [image.image.path] + [r.file.path for r in image.renditions.all()]
+        image.image = image_file('other.png', size=(300, 300))
+        image.save()
+        self.run_jobs()
+        self.assertFalse(any(os.path.exists(path) for path in files))
+        image.refresh_from_db()
+        self.assertTrue(os.path.exists(image.image.path))
+        self.assertEqual(image.status, PostImage.READY)
+
+    def test_purge_command(self):
+        Post.objects.filter(pk=self.post.pk).update(deleted_at=timezone.now() - timedelta(days=1))
+        call_command('purge_deleted_posts', stdout=io.StringIO())
+        self.assertFalse(Post.all_objects.exists())
+        self.assertFalse(PostImage.objects.exists())
+
+    def test_find_orphaned_media(self):
+        self.image.refresh_from_db()
+        stray = os.path.join(MEDIA_ROOT, 'post_images', 'stray.jpg')
+        with open(stray, 'wb') as f:
+            f.write(b'x')
+        stdout = io.StringIO()
+        call_command('find_orphaned_media', min_age=0, stdout=stdout)
+        listed = stdout.getvalue().splitlines()
+        self.assertIn('post_images/stray.jpg', listed)
+        self.assertNotIn(self.image.image.name, listed)
+        self.assertNotIn('default.jpg', listed)
+        self.assertTrue(os.path.exists(stray))
+
+        call_command('find_orphaned_media', min_age=0, delete=True, stdout=io.StringIO())
+        self.assertFalse(os.path.exists(stray))
+        self.assertTrue(os.path.exists(self.image.image.path))
+
+
+class UploadValidationTests(BlogTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', password='pass')
+        cls.category = Category.objects.create(name='Casa')
+
+    def create_post(self, upload):
+        self.client.force_login(self.seller)
+        return self.client.post(reverse('blog:post-create'), {
+            'title': 'Lampada', 'content': '-', 'category': self.category.pk, 'price': 10,
+            'images-TOTAL_FORMS': 5, 'images-INITIAL_FORMS': 0,
+            'images-MIN_NUM_FORMS': 0, 'images-MAX_NUM_FORMS': 5,
+            'images-0-image': upload,
+        })
+
+    def assertRejected(self, response, message):
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(message, str(response.context['formset'].errors))
+        self.assertFalse(Post.objects.exists())
+
+    def test_valid_upload(self):
+        response = self.create_post(image_file())
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(PostImage.objects.count(), 1)
+
+    def test_format_is_sniffed(self):
+        upload = SimpleUploadedFile('photo.jpg', b'<?php echo 1; ?>' * 10, content_type='image/jpeg')
+        self.assertRejected(self.create_post(upload), 'immagine valida')
+
+    @override_settings(IMAGE_UPLOAD_MAX_SIZE=1024)
+    def test_size_limit(self):
+        upload = SimpleUploadedFile('photo.png', image_file().read() + b'\0' * 2048, content_type='image/png')
+        self.assertRejected(self.create_post(upload), 'troppo grande. Max')
+
+    @override_settings(IMAGE_UPLOAD_MAX_PIXELS=100)
+    def test_pixel_limit(self):
+        self.assertRejected(self.create_post(image_file(size=(20, 20))), '(20×20 pixel)')
+
+    @override_settings(IMAGE_UPLOAD_MAX_SIZE=100)
+    def test_handler_stops_buffering(self):
+        handler = ImageUploadHandler()
+        handler.new_file('images-0-image', 'photo.png', 'image/png', None)
+        header = b'\x89PNG\r\n\x1a\n' + b'\0' * 52
+        self.assertEqual(handler.receive_data_chunk(header, 0), header)
+        self.assertIsNone(handler.receive_data_chunk(b'\0' * 60, 60))
+        self.assertIsNone(handler.receive_data_chunk(b'\0' * 60, 120))
+        self.assertIn('troppo grande', handler.file_complete(180).error)
+
+        # Other fields (e.g. the bulk import archive) are left alone
+        handler.new_file('images', 'images.zip', 'application/zip', None)
+        self.assertEqual(handler.receive_data_chunk(b'\0' * 200, 0), b'\0' * 200)
+        self.assertIsNone(handler.file_complete(200))
+
+
+class StaticFilesTests(TestCase):
+
+    def setUp(self):
+        self.static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.static_root, ignore_errors=True)
+        storages = {
+            'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+            'staticfiles': {'BACKEND': 'django_project.static.CompressedManifestStaticFilesStorage'},
+        }
+        settings = override_settings(STATIC_ROOT=self.static_root, STORAGES=storages,
+                                     SERVE_FILES=True, MEDIA_ROOT=MEDIA_ROOT)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+        with open(os.path.join(self.static_root, 'staticfiles.json')) as f:
+            self.hashed = json.load(f)['paths']['blog/main.css']
+
+    def test_collectstatic_writes_hashed_and_compressed_files(self):
+        self.assertRegex(self.hashed, r'^blog/main\.[0-9a-f]{12}\.css$')
+        path = os.path.join(self.static_root, self.hashed)
+        with open(path, 'rb') as f, gzip.open(path + '.gz') as compressed:
+            self.assertEqual(compressed.read(), f.read())
+
+    def test_hashed_file_is_served_compressed_and_immutable(self):
+        response = self.client.get(f'/static/{self.hashed}', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertIn(b'site-header', gzip.decompress(b''.join(response.streaming_content)))
+
+        response = self.client.get(f'/static/{self.hashed}')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+        for refused in ('gzip;q=0', 'gzip; q=0.0, deflate', 'x-gzip', '*;q=0', 'identity'):
+            response = self.client.get(f'/static/{self.hashed}', HTTP_ACCEPT_ENCODING=refused)
+            self.assertFalse(response.has_header('Content-Encoding'), refused)
+        response = self.client.get(f'/static/{self.hashed}', HTTP_ACCEPT_ENCODING='br;q=0, *;q=0.5')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+    def test_unhashed_file_gets_short_max_age(self):
+        response = self.client.get('/static/blog/main.css')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=3600')
+
+    def test_not_modified(self):
+        response = self.client.get(f'/static/{self.hashed}')
+        response = self.client.get(f'/static/{self.hashed}', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_media_and_missing_files(self):
+        response = self.client.get('/media/default.jpg')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(self.client.get('/static/blog/missing.css').status_code, 404)
+        self.assertEqual(self.client.get('/static/../settings.py').status_code, 404)
+
+    def test_vendor_tag(self):
+        storages = {
+            'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+            'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+        }
+        template = Template('{% load blog_assets %}{% vendor "bootstrap.css" %}')
+        self.addCleanup(is_vendored.cache_clear)
+        for found, url in (('/found', '/static/vendor/bootstrap-5.3.2/bootstrap.min.css'),
+                           (None, VENDOR_ASSETS['bootstrap.css'][1])):
+            is_vendored.cache_clear()
+            with mock.patch('blog.vendor.finders.find', return_value=found), self.settings(STORAGES=storages):
+                self.assertEqual(template.render(Context()), url)
+
+    def test_pages_render_without_vendored_files(self):
+        self.addCleanup(is_vendored.cache_clear)
+        is_vendored.cache_clear()
+        with mock.patch('blog.vendor.finders.find', return_value=None):
+            response = self.client.get(reverse('blog:home'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, VENDOR_ASSETS['bootstrap.css'][1])
+        self.assertContains(response, f'/static/{self.hashed}')
+
+    def test_missing_vendored_assets_check(self):
+        with mock.patch('blog.vendor.finders.find', return_value=None):
+            with self.settings(STATIC_MANIFEST=False):
+                self.assertEqual([e.id for e in check_vendored_assets(None)], ['blog.W001'])
+            with self.settings(STATIC_MANIFEST=True):
+                self.assertEqual([e.id for e in check_vendored_assets(None)], ['blog.E001'])
+        with mock.patch('blog.vendor.finders.find', return_value='/found'):
+            self.assertEqual(check_vendored_assets(None), [])
@@ -0,0 +1,121 @@
+"""Early validation of uploaded images.
+
+ImageUploadHandler (first in FILE_UPLOAD_HANDLERS) watches image fields while
+the request body streams in: it sniffs the real format from the first bytes
+and stops buffering as soon as a file goes over IMAGE_UPLOAD_MAX_SIZE. A
+refused file reaches the form as a RejectedUpload carrying the reason.
+validate_image() then reads the pixel size from the file header, without
+decoding the image, and refuses anything over IMAGE_UPLOAD_MAX_PIXELS.
+"""
+import io
+
+from django import forms
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from PIL import Image
+
+# Fields handled as images: "image", or "<prefix>-image" in formsets
+IMAGE_FIELD_NAMES = ('image',)
+ALLOWED_FORMATS = ('JPEG', 'PNG', 'GIF', 'WEBP')
+
+
+def max_size():
+    return getattr(settings, 'IMAGE_UPLOAD_MAX_SIZE', 5 * 1024 * 1024)
+
+
+def max_pixels():
+    return getattr(settings, 'IMAGE_UPLOAD_MAX_PIXELS', 40_000_000)
+
+
+def sniff_format(header):
+    """Image format from the magic bytes at the start of a file, or None"""
+    if header.startswith(b'\xff\xd8\xff'):
+        return 'JPEG'
+    if header.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'PNG'
+    if header[:6] in (b'GIF87a', b'GIF89a'):
+        return 'GIF'
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'WEBP'
+    return None
+
+
+def is_image_field(field_name):
+    return field_name.rsplit('-', 1)[-1] in IMAGE_FIELD_NAMES
+
+
+class RejectedUpload(UploadedFile):
+    """Empty stand-in for an upload refused while streaming"""
+
+    def __init__(self, name, content_type, error):
+        super().__init__(io.BytesIO(), name, content_type, 0)
+        self.error = error
+
+
+class ImageUploadHandler(FileUploadHandler):
+    """Refuse non-images and oversized images before they are buffered.
+
+    Chunks of a refused file are not passed on to the following handlers, so
+    neither memory nor temporary files grow past the size limit.
+    """
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        self.active = is_image_field(field_name)
+        self.received = 0
+        self.error = None
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.active:
+            return raw_data
+        if self.error is None:
+            if start == 0 and sniff_format(raw_data[:12]) not in ALLOWED_FORMATS:
+                self.error = f'Il file "{self.file_name}" non è un\'immagine valida.'
+            self.received += len(raw_data)
+            if self.received > max_size():
+                self.error = f'Il file "{self.file_name}" è troppo grande. Max {max_size() // (1024 * 1024)}MB.'
+        return None if self.error else raw_data
+
+    def file_complete(self, file_size):
+        if self.active and self.error:
+            return RejectedUpload(self.file_name, self.content_type, self.error)
+        return None
+
+
+def validate_image(file):
+    """Check an uploaded image without decoding it, returns (format, width, height)"""
+    if isinstance(file, RejectedUpload):
+        raise forms.ValidationError(file.error)
+    if file.size > max_size():
+        raise forms.ValidationError(
+            f'Il file "{file.name}" è troppo grande. Max {max_size() // (1024 * 1024)}MB.')
+
+    invalid = forms.ValidationError(f'Il file "{file.name}" non è un\'immagine valida.')
+    file.seek(0)
+    if sniff_format(file.read(12)) not in ALLOWED_FORMATS:
+        raise invalid
+    file.seek(0)
+    try:
+        # Only parses the header: the pixel data is decoded on load()
+        with Image.open(file) as image:
+            format, (width, height) = image.format, image.size
+    except (OSError, Image.DecompressionBombError):
+        raise invalid
+    finally:
+        file.seek(0)
+    if format not in ALLOWED_FORMATS:
+        raise invalid
+    if width * height > max_pixels():
+        raise forms.ValidationError(
+            f'L\'immagine "{file.name}" è troppo grande ({width}×{height} pixel).')
+    return format, width, height
+
+
+class ImageUploadField(forms.ImageField):
+    """ImageField checking the upload with validate_image() before Pillow opens it"""
+
+    def to_python(self, data):
+        if isinstance(data, UploadedFile):
+            validate_image(data)
+        return super().to_python(data)
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path
 from .views import (
     PostListView,
@@ -5,18 +6,32 @@ from .views import (
     PostCreateView,
     PostUpdateView,
     PostDeleteView,
-    UserPostListView
+    UserPostListView,
+    PostImportView
 )
-from . import views
+from . import api, views
 
 app_name = 'blog' # namespace
 
+if settings.ASYNC_VIEWS:
+    post_list, user_posts, post_detail = views.apost_list, views.auser_posts, views.apost_detail
+else:
+    post_list, user_posts, post_detail = (PostListView.as_view(), UserPostListView.as_view(),
+                                          PostDetailView.as_view())
+
 urlpatterns = [
-    path('', PostListView.as_view(), name='home'),
-    path('user/<str:username>', UserPostListView.as_view(), name='user-posts'),
-    path('post/<int:pk>/', PostDetailView.as_view(), name='post-detail'),
+    path('', post_list, name='home'),
+    path('user/<str:username>', user_posts, name='user-posts'),
+    path('post/<int:pk>/', post_detail, name='post-detail'),
     path('post/new/', PostCreateView.as_view(), name='post-create'),
     path('post/<int:pk>/update/', PostUpdateView.as_view(), name='post-update'),
     path('post/<int:pk>/delete/', PostDeleteView.as_view(), name='post-delete'),
+    path('post/import/', PostImportView.as_view(), name='post-import'),
+    path('post/export/', views.post_export, name='post-export'),
     path('about/', views.about, name='about'),
+    # Read-only JSON API, see blog/api.py
+    path('api/posts/', api.post_list, name='api-post-list'),
+    path('api/posts/<int:pk>/', api.post_detail, name='api-post-detail'),
+    path('api/users/<str:username>/posts/', api.user_post_list, name='api-user-posts'),
+    path('api/categories/', api.category_list, name='api-categories'),
 ]
\ No newline at end of file
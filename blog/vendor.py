@@ -0,0 +1,52 @@
+"""Third-party front-end assets, served from our own static files.
+
+The files live in blog/static/vendor/; `manage.py vendor_assets` downloads
+them from the CDN URLs below, checking them against the published hash.
+Until they are committed the pages keep linking the CDN copy, and the
+blog.E001/W001 check reports the missing files.
+"""
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core import checks
+from django.templatetags.static import static
+
+# Name -> (static path, CDN URL, sha384 of the published file)
+VENDOR_ASSETS = {
+    'bootstrap.css': (
+        'vendor/bootstrap-5.3.2/bootstrap.min.css',
+        'https://cdn.jsdelivr.net/npm/bootstrap@5.3.2/dist/css/bootstrap.min.css',
+        'sha384-T3c6CoIi6uLrA9TneNEoa7RxnatzjcDSCmG1MXxSR1GAsXEV/Dwwykc2MPK8M2HN',
+    ),
+    'bootstrap.js': (
+        'vendor/bootstrap-5.3.2/bootstrap.bundle.min.js',
+        'https://cdn.jsdelivr.net/npm/bootstrap@5.3.2/dist/js/bootstrap.bundle.min.js',
+        'sha384-C6RzsynM9kWDrMNeT87bh95OGNyZPhcTNXj1NW7RuBCsyN/o0jlpcV8Qyq46cDfL',
+    ),
+}
+
+
+@lru_cache(maxsize=None)
+def is_vendored(path):
+    return finders.find(path) is not None
+
+
+def vendor_url(name):
+    """URL of a vendored asset: the local (hashed) static file, or the CDN"""
+    path, cdn_url, _ = VENDOR_ASSETS[name]
+    return static(path) if is_vendored(path) else cdn_url
+
+
+@checks.register(checks.Tags.staticfiles)
+def check_vendored_assets(app_configs, **kwargs):
+    """Missing vendored files: an error with the manifest storage, a warning otherwise"""
+    missing = [path for path, _, _ in VENDOR_ASSETS.values() if finders.find(path) is None]
+    if not missing:
+        return []
+    level, id = (checks.Error, 'blog.E001') if settings.STATIC_MANIFEST else (checks.Warning, 'blog.W001')
+    return [level(
+        f'Vendored assets missing: {", ".join(missing)}',
+        hint='Run "manage.py vendor_assets" and commit blog/static/vendor/.',
+        id=id,
+    )]
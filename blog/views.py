@@ -1,76 +1,203 @@
-from django.shortcuts import render, get_object_or_404, redirect
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.shortcuts import render, get_object_or_404, aget_object_or_404, redirect
+from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib.auth.models import User
 from django.contrib import messages
-from django.db.models import Q # New import to support complex queries
 
 from django.views.generic import (
     ListView,
     DetailView,
     CreateView,
     UpdateView,
-    DeleteView
+    DeleteView,
+    FormView
 )
+from django.http import Http404, StreamingHttpResponse
 
 from django.db import transaction
+from .bulk import FORMATS, BulkImportError, export_posts, guess_format, import_posts
+from .cache import CATEGORIES, get_categories, get_version
+from .facets import FeedFilters, category_counts
 from .models import Post, PostImage, Category
-from .forms import PostForm, PostImageFormSet
+from .forms import PostForm, PostImageFormSet, PostImportUploadForm
+from .middleware import PageCacheTagsMixin
+from .pagination import CursorPaginationMixin, CursorPaginator, InvalidCursor
+
+
+def filter_feed(posts, params):
+    """Apply the feed filters of a query string (see blog/facets.py).
+
+    Returns the filtered posts and their cursor ordering: the requested sort,
+    else best matches first when searching and newest first otherwise.
+    Shared with the JSON API.
+    """
+    filters = FeedFilters(params)
+    return filters.apply(posts), filters.ordering
+
+
+# Sort options of the feed: (value of ?sort=, label). The default is by relevance when searching.
+SORT_LABELS = [
+    ('', 'Più rilevanti'),
+    ('newest', 'Più recenti'),
+    ('price_asc', 'Prezzo crescente'),
+    ('price_desc', 'Prezzo decrescente'),
+]
 
-class PostListView(ListView): # Homepage.
+
+class PostListView(PageCacheTagsMixin, CursorPaginationMixin, ListView): # Homepage.
     model = Post
     template_name = 'blog/home.html'
     context_object_name = 'posts'
-    ordering = ['-date_posted']
     paginate_by = 5
+    cache_tags = ['posts', CATEGORIES]
 
     def get_queryset(self):
-        """Filter posts by search query and category"""
-        # Base queryset
-        posts = Post.objects.filter(is_sold=False).select_related('author', 'category')
-        
-        # Search filter
-        query = self.request.GET.get('query', '').strip()
-        if query:
-            posts = posts.filter(
-                Q(title__icontains=query) | Q(content__icontains=query)
-            )
-        
-        # Category filter
-        category_id = self.request.GET.get('category', '').strip()
-        if category_id and category_id.isdigit():
-            posts = posts.filter(category_id=int(category_id))
-        
-        return posts.order_by('-date_posted')
+        """Filter posts by search query, category, price and sold status"""
+        self.filters = FeedFilters(self.request.GET)
+        self.cursor_ordering = self.filters.ordering
+        posts = (Post.objects.select_related('author', 'category')
+                 .with_cover_image())
+        return self.filters.apply(posts).order_by(*self.cursor_ordering)
     
     def get_context_data(self, **kwargs):
-        """Add categories and filter values to context"""
+        """Add categories with their result counts and filter values to context"""
         context = super().get_context_data(**kwargs)
-        context['categories'] = Category.objects.all()
-        context['query'] = self.request.GET.get('query', '').strip()
-        context['category_id'] = self.request.GET.get('category', '').strip()
+        counts = category_counts(Post.objects.all(), self.filters)
+        context.update(feed_context(self.request.GET, self.filters, counts, get_categories()))
+        context['categories_version'] = get_version(CATEGORIES)
         return context
 
 
-class UserPostListView(ListView):
+def feed_context(params, filters, counts, categories):
+    """Categories with their result counts and filter values, for blog/home.html"""
+    for category in categories:
+        category.result_count = counts.get(category.pk, 0)
+    return {
+        'categories': categories,
+        'filters': filters,
+        'sorts': SORT_LABELS if filters.query else SORT_LABELS[1:],
+        'result_count': (counts.get(filters.category_id, 0)
+                         if filters.category_id is not None else sum(counts.values())),
+        'query': filters.query,
+        'category_id': params.get('category', '').strip(),
+    }
+
+
+class UserPostListView(PageCacheTagsMixin, CursorPaginationMixin, ListView):
     model = Post
     template_name = 'blog/user_posts.html'
     context_object_name = 'posts'
     paginate_by = 5
 
     def get_queryset(self):
-        user = get_object_or_404(User, username=self.kwargs.get('username'))
-        return Post.objects.filter(author=user).order_by('-date_posted')
+        self.author = get_object_or_404(User.objects.select_related('profile'), username=self.kwargs.get('username'))
+        return (Post.objects.filter(author=self.author)
+                .select_related('author__profile')
+                .order_by(*self.cursor_ordering))
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['author'] = self.author
+        return context
 
+    def get_cache_tags(self):
+        return [f'author:{self.author.pk}']
 
-class PostDetailView(DetailView):
+
+class PostDetailView(PageCacheTagsMixin, DetailView):
     model = Post
-    
+    queryset = Post.objects.select_related('author__profile')
+
+    def get_cache_tags(self):
+        # The author tag covers the avatar shown in the header
+        return [f'post:{self.object.pk}', f'author:{self.object.author_id}']
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['images'] = self.object.images.all()
+        context['images'] = self.object.images.prefetch_related('renditions')
         return context
 
 
+# Async versions of the read-only pages, routed instead of the views above when
+# ASYNC_VIEWS is on (see blog/urls.py). Under ASGI they wait on the database
+# without holding a thread; queries go through the async ORM API and the
+# independent ones are started together with asyncio.gather(). Rendering runs
+# in a thread: context processors and templates read request.user lazily.
+
+async def alist(queryset):
+    return [obj async for obj in queryset]
+
+
+async def apost_list(request):
+    """Async PostListView"""
+    filters = FeedFilters(request.GET)
+    posts = filters.apply(Post.objects.select_related('author', 'category').with_cover_image())
+    paginator = CursorPaginator(posts, PostListView.paginate_by, filters.ordering)
+    try:
+        page, counts, categories, categories_version = await asyncio.gather(
+            paginator.apage(request.GET.get('cursor')),
+            sync_to_async(category_counts)(Post.objects.all(), filters),
+            sync_to_async(get_categories)(),
+            sync_to_async(get_version)(CATEGORIES),
+        )
+    except InvalidCursor:
+        raise Http404('Invalid page cursor.')
+
+    context = feed_context(request.GET, filters, counts, categories)
+    context.update({
+        'posts': page.object_list,
+        'page_obj': page,
+        'is_paginated': page.has_other_pages(),
+        'categories_version': categories_version,
+    })
+    response = await sync_to_async(render)(request, 'blog/home.html', context)
+    response.cache_tags = PostListView.cache_tags
+    return response
+
+
+async def auser_posts(request, username):
+    """Async UserPostListView: the author and their posts are fetched together"""
+    posts = (Post.objects.filter(author__username=username)
+             .select_related('author__profile'))
+    paginator = CursorPaginator(posts, UserPostListView.paginate_by, UserPostListView.cursor_ordering)
+    try:
+        author, page = await asyncio.gather(
+            aget_object_or_404(User.objects.select_related('profile'), username=username),
+            paginator.apage(request.GET.get('cursor')),
+        )
+    except InvalidCursor:
+        raise Http404('Invalid page cursor.')
+
+    response = await sync_to_async(render)(request, 'blog/user_posts.html', {
+        'author': author,
+        'posts': page.object_list,
+        'page_obj': page,
+        'is_paginated': page.has_other_pages(),
+    })
+    response.cache_tags = [f'author:{author.pk}']
+    return response
+
+
+async def apost_detail(request, pk):
+    """Async PostDetailView: the post and its images are fetched together"""
+    images = PostImage.objects.filter(post_id=pk).prefetch_related('renditions')
+    post, images = await asyncio.gather(
+        aget_object_or_404(PostDetailView.queryset, pk=pk),
+        alist(images),
+    )
+
+    response = await sync_to_async(render)(request, 'blog/post_detail.html', {
+        'object': post,
+        'post': post,
+        'images': images,
+    })
+    response.cache_tags = [f'post:{post.pk}', f'author:{post.author_id}']
+    return response
+
+
 class PostCreateView(LoginRequiredMixin, CreateView):
     """Create post with formset for images"""
     model = Post
@@ -171,9 +298,51 @@ class PostDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
     model = Post
     success_url = '/'
 
+    def form_valid(self, form):
+        """Soft delete: the post disappears now, rows and files go in the background"""
+        self.object.soft_delete()
+        messages.success(self.request, 'Post eliminato!')
+        return redirect(self.get_success_url())
+
     def test_func(self):
         return self.request.user == self.get_object().author
 
 
+class PostImportView(LoginRequiredMixin, FormView):
+    """Bulk import of the user's listings from a CSV/JSONL file and a zip of images"""
+    form_class = PostImportUploadForm
+    template_name = 'blog/post_import.html'
+
+    def form_valid(self, form):
+        upload = form.cleaned_data['file']
+        try:
+            result = import_posts(upload, guess_format(upload.name), self.request.user,
+                                  form.cleaned_data['images'])
+        except BulkImportError as e:
+            form.add_error(None, str(e))
+            return self.form_invalid(form)
+
+        if result.created:
+            messages.success(self.request, f'{result.created} post importati con {result.images} immagine/i!')
+        if result.errors:
+            messages.warning(self.request, f'{len(result.errors)} errori, le righe indicate non sono state importate.')
+        return self.render_to_response(self.get_context_data(form=form, result=result))
+
+
+@login_required
+def post_export(request):
+    """Stream all the listings of the user, as CSV or JSON Lines"""
+    format = request.GET.get('format', 'csv')
+    if format not in FORMATS:
+        raise Http404
+    content_type = 'text/csv' if format == 'csv' else 'application/x-ndjson'
+    response = StreamingHttpResponse(
+        export_posts(Post.objects.filter(author=request.user), format),
+        content_type=f'{content_type}; charset=utf-8',
+    )
+    response['Content-Disposition'] = f'attachment; filename="posts.{format}"'
+    return response
+
+
 def about(request):
     return render(request, 'blog/about.html', {'title': 'About'})
\ No newline at end of file
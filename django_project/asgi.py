@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'django_project.settings')
+# Tells the settings not to keep database connections open by default
+os.environ.setdefault('DJANGO_ASGI', 'true')
 
 application = get_asgi_application()
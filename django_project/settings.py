@@ -11,7 +11,8 @@ https://docs.djangoproject.com/en/2.1/ref/settings/
 """
 
 import os
-from decouple import config
+import tempfile
+from decouple import Csv, config
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -24,9 +25,9 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 SECRET_KEY = config('SECRET_KEY', default='exhlfdat&vfum(-34*c2uroi(($ww(yo$9pv98=e6p^gl(-eoj')
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = config('DEBUG', default=True, cast=bool)
 
-ALLOWED_HOSTS = []
+ALLOWED_HOSTS = config('ALLOWED_HOSTS', default='', cast=Csv())
 
 
 # Application definition
@@ -35,6 +36,8 @@ INSTALLED_APPS = [
     'blog.apps.BlogConfig',
     'users.apps.UsersConfig',
     'messaging.apps.MessagingConfig',
+    'jobs.apps.JobsConfig',
+    'monitoring.apps.MonitoringConfig',
     'crispy_forms',
     'crispy_bootstrap5',
     'django.contrib.admin',
@@ -47,11 +50,14 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'django_project.static.StaticFilesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'monitoring.middleware.InstrumentationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'blog.middleware.AnonymousPageCacheMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
@@ -59,12 +65,19 @@ ROOT_URLCONF = 'django_project.urls'
 # Redirect dopo logout
 LOGOUT_REDIRECT_URL = 'blog:home'
 
+# Compiled templates are kept in memory by the cached loader. runserver
+# clears it when a template file changes, other servers need a restart.
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
+            'loaders': [('django.template.loaders.cached.Loader', TEMPLATE_LOADERS)],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -78,16 +91,79 @@ TEMPLATES = [
 WSGI_APPLICATION = 'django_project.wsgi.application'
 
 
+# Set by asgi.py before the settings are loaded
+SERVED_BY_ASGI = config('DJANGO_ASGI', default=False, cast=bool)
+
+# Route the feed, post, user and inbox pages to their async views (blog/urls.py,
+# messaging/urls.py). Worth it when serving through asgi.py; under WSGI each
+# async view runs in an event loop of its own, which only adds overhead.
+ASYNC_VIEWS = config('ASYNC_VIEWS', default=False, cast=bool)
+
+
 # Database
 # https://docs.djangoproject.com/en/2.1/ref/settings/#databases
 
+# Configured from the environment, e.g. for PostgreSQL:
+# DB_ENGINE=django.db.backends.postgresql DB_NAME=juja DB_USER=... DB_HOST=...
+# Connections are kept open for DB_CONN_MAX_AGE seconds and checked before
+# reuse. Not by default under ASGI or with the async views: the ORM calls of
+# those run in sync_to_async() threads, each of which would keep a connection
+# of its own open.
+
+DB_ENGINE = config('DB_ENGINE', default='django.db.backends.sqlite3')
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'ENGINE': DB_ENGINE,
+        'NAME': config('DB_NAME', default=os.path.join(BASE_DIR, 'db.sqlite3')),
+        'USER': config('DB_USER', default=''),
+        'PASSWORD': config('DB_PASSWORD', default=''),
+        'HOST': config('DB_HOST', default=''),
+        'PORT': config('DB_PORT', default=''),
+        'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=0 if SERVED_BY_ASGI or ASYNC_VIEWS else 60, cast=int),
+        'CONN_HEALTH_CHECKS': config('DB_CONN_HEALTH_CHECKS', default=True, cast=bool),
+        'OPTIONS': {},
     }
 }
 
+if DB_ENGINE == 'django.db.backends.sqlite3':
+    # WAL lets readers and the background workers (jobs app) run alongside a writer
+    DATABASES['default']['OPTIONS'] = {
+        'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;',
+        'transaction_mode': 'IMMEDIATE',
+        'timeout': 20,
+    }
+
+
+# Cache
+# File-based, shared by the server processes and the run_jobs worker: the
+# version keys of blog/cache.py only invalidate pages for the processes that
+# share the cache. No external cache service is needed; across several hosts,
+# point CACHE_DIR at shared storage. An empty CACHE_DIR selects a per-process
+# local-memory cache, which the anonymous page cache refuses (blog.E002).
+
+CACHE_DIR = config('CACHE_DIR', default=os.path.join(tempfile.gettempdir(), 'juja-cache'))
+
+CACHES = {
+    'default': {
+        'BACKEND': ('monitoring.cache.FileBasedCache' if CACHE_DIR
+                    else 'monitoring.cache.LocMemCache'),
+        'LOCATION': CACHE_DIR or 'app-cache',
+        'TIMEOUT': 600,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+}
+
+# Full-page cache for logged-out visitors (see blog/middleware.py)
+PAGE_CACHE_TIMEOUT = 300
+PAGE_CACHE_QUERY_PARAMS = ['query', 'category', 'min_price', 'max_price', 'sold', 'sort', 'page', 'cursor']
+
+# Request instrumentation (see monitoring/)
+MONITORING_RING_SIZE = 1000
+MONITORING_PROFILE_DIR = config('MONITORING_PROFILE_DIR',
+                                default=os.path.join(tempfile.gettempdir(), 'juja-profiles'))
+MONITORING_METRICS_TOKEN = config('MONITORING_METRICS_TOKEN', default='')
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.1/ref/settings/#auth-password-validators
@@ -126,14 +202,55 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/2.1/howto/static-files/
 
 STATIC_URL = '/static/'
-# STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles') -- for production use
+STATIC_ROOT = config('STATIC_ROOT', default=os.path.join(BASE_DIR, 'staticfiles'))
+
+# Production assets (see django_project/static.py): `collectstatic` writes
+# content-hashed, precompressed copies, and the app serves STATIC_ROOT and
+# MEDIA_ROOT itself with far-future cache headers. Both default to on when
+# DEBUG is off.
+STATIC_MANIFEST = config('STATIC_MANIFEST', default=not DEBUG, cast=bool)
+SERVE_FILES = config('SERVE_FILES', default=not DEBUG, cast=bool)
+# Cache-Control max-age of files without a content hash in their name
+STATIC_MAX_AGE = 3600
+# Media files never rewritten in place, cached like hashed static files
+MEDIA_IMMUTABLE_PREFIXES = ['renditions/', 'profile_pics/variants/']
+
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {
+        'BACKEND': ('django_project.static.CompressedManifestStaticFilesStorage' if STATIC_MANIFEST
+                    else 'django.contrib.staticfiles.storage.StaticFilesStorage'),
+    },
+}
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
 
+# Image uploads are checked while they stream in (see blog/uploads.py)
+FILE_UPLOAD_HANDLERS = [
+    'blog.uploads.ImageUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+IMAGE_UPLOAD_MAX_SIZE = 5 * 1024 * 1024
+IMAGE_UPLOAD_MAX_PIXELS = 40_000_000
+
 CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
 CRISPY_TEMPLATE_PACK = 'bootstrap5'
 
+# Full-text search backend for the home page (dotted path, see blog/search.py).
+# Empty means: FTS5 index on SQLite, substring matching elsewhere.
+BLOG_SEARCH_BACKEND = config('BLOG_SEARCH_BACKEND', default='')
+
+# Run background jobs in-process right after commit instead of through
+# `manage.py run_jobs` (see jobs/queue.py). Meant for development only.
+JOBS_EAGER = config('JOBS_EAGER', default=False, cast=bool)
+
+# Pub/sub used to push new messages to open conversations (see messaging/realtime.py).
+# InMemoryBackend needs a single server process, DatabaseBackend works with many.
+MESSAGING_REALTIME_BACKEND = config('MESSAGING_REALTIME_BACKEND',
+                                    default='messaging.realtime.InMemoryBackend')
+
 LOGIN_REDIRECT_URL = 'blog:home'
 LOGIN_URL = 'login'
 
@@ -48,6 +48,7 @@ urlpatterns = [
          name='password_reset_complete'),
     path('', include('blog.urls')),
     path('inbox/', include('messaging.urls')),
+    path('monitoring/', include('monitoring.urls')),
 ]
 
 
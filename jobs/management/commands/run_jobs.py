@@ -0,0 +1,98 @@
+import logging
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from jobs.queue import claim, fail_job, requeue_stale, run_job
+
+logger = logging.getLogger(__name__)
+
+
+def _init_worker():
+    # Under the "spawn" start method the child has to set Django up itself;
+    # when forked, drop the database connections inherited from the parent.
+    django.setup()
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs in a pool of worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--poll-interval', type=float, default=1.0)
+        parser.add_argument('--stale-after', type=int, default=600,
+                            help='Requeue jobs left running for more than this many seconds, '
+                                 'checked at startup and then every as many seconds')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once the queue is empty instead of polling')
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        poll_interval = options['poll_interval']
+        stale_after = options['stale_after']
+
+        self.requeue_stale(stale_after)
+        next_requeue = time.monotonic() + stale_after
+
+        connections.close_all()
+        processed = 0
+        pool = self.new_pool(workers)
+        running = {}  # future -> job id
+        try:
+            while True:
+                if time.monotonic() >= next_requeue:
+                    # Jobs of other workers that died; ours may legitimately run long
+                    self.requeue_stale(stale_after, exclude=running.values())
+                    next_requeue = time.monotonic() + stale_after
+
+                free = workers - len(running)
+                if free > 0:
+                    for job_id in claim(free):
+                        running[pool.submit(run_job, job_id)] = job_id
+
+                if not running:
+                    if options['once']:
+                        break
+                    time.sleep(poll_interval)
+                    continue
+
+                done, _ = wait(running, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                processed += len(done)
+                if self.collect(done, running):
+                    # A worker process died: every job still in the pool failed with it
+                    done, _ = wait(running)
+                    processed += len(done)
+                    self.collect(done, running)
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    pool = self.new_pool(workers)
+        finally:
+            pool.shutdown()
+
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} job(s)'))
+
+    def new_pool(self, workers):
+        return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+
+    def collect(self, done, running):
+        """Record the jobs whose future raised; True when the pool is broken"""
+        broken = False
+        for future in done:
+            job_id = running.pop(future)
+            try:
+                future.result()
+            except Exception as e:
+                broken = broken or isinstance(e, BrokenProcessPool)
+                logger.error('Job %s failed outside of its task: %r', job_id, e)
+                fail_job(job_id, ''.join(traceback.format_exception(e)))
+        return broken
+
+    def requeue_stale(self, stale_after, exclude=()):
+        requeued = requeue_stale(stale_after, exclude)
+        if requeued:
+            self.stdout.write(f'Requeued {requeued} stale job(s)')
@@ -0,0 +1,122 @@
+"""Database-backed job queue.
+
+Jobs are rows in the `Job` table; `manage.py run_jobs` claims them and runs
+them in a process pool, so no external broker is needed. A job's task is the
+dotted path of a plain function, called with the job payload as kwargs:
+
+    enqueue('blog.tasks.process_post_image', image_id=image.pk)
+
+With the JOBS_EAGER setting, jobs run in-process as soon as the enclosing
+transaction commits (handy in development and tests).
+"""
+import logging
+import traceback
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait before retrying a failed job, multiplied by the attempt number
+RETRY_DELAY = 30
+
+
+def _run_eagerly(job_ids):
+    if getattr(settings, 'JOBS_EAGER', False):
+        for job_id in job_ids:
+            transaction.on_commit(partial(run_job, job_id, claim_first=True))
+
+
+def enqueue(task, run_after=None, **payload):
+    """Queue `task(**payload)` for the background workers"""
+    job = Job.objects.create(task=task, payload=payload, run_after=run_after or timezone.now())
+    _run_eagerly([job.pk])
+    return job
+
+
+def enqueue_many(task, payloads):
+    """Queue one job per payload with a single INSERT"""
+    now = timezone.now()
+    jobs = Job.objects.bulk_create(
+        [Job(task=task, payload=payload, run_after=now) for payload in payloads]
+    )
+    _run_eagerly([job.pk for job in jobs if job.pk])
+    return jobs
+
+
+def _mark_running(queryset):
+    return queryset.update(
+        status=Job.RUNNING, started_at=timezone.now(), attempts=F('attempts') + 1
+    )
+
+
+def claim(limit):
+    """Atomically move up to `limit` due jobs to RUNNING and return their ids"""
+    due = (Job.objects.filter(status=Job.PENDING, run_after__lte=timezone.now())
+           .order_by('id').values_list('id', flat=True))
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = list(due.select_for_update(skip_locked=True)[:limit])
+            _mark_running(Job.objects.filter(pk__in=ids))
+        return ids
+
+    # No row locks (SQLite): the conditional UPDATE decides who wins each job
+    return [
+        job_id for job_id in due[:limit]
+        if _mark_running(Job.objects.filter(pk=job_id, status=Job.PENDING))
+    ]
+
+
+def requeue_stale(older_than, exclude=()):
+    """Give RUNNING jobs abandoned by a dead worker back to the queue (but not the `exclude` ids)"""
+    cutoff = timezone.now() - timedelta(seconds=older_than)
+    return (Job.objects.filter(status=Job.RUNNING, started_at__lt=cutoff).exclude(pk__in=list(exclude))
+            .update(status=Job.PENDING))
+
+
+def _record_failure(job, error):
+    """Retry `job` later, or give up once it has used its attempts"""
+    job.last_error = error
+    if job.attempts < job.max_attempts:
+        job.status = Job.PENDING
+        job.run_after = timezone.now() + timedelta(seconds=RETRY_DELAY * job.attempts)
+    else:
+        job.status = Job.FAILED
+        job.finished_at = timezone.now()
+
+
+def fail_job(job_id, error):
+    """Record a failure outside of the task (e.g. a crashed worker process) of a RUNNING job"""
+    job = Job.objects.filter(pk=job_id, status=Job.RUNNING).first()
+    if job is None:  # The job recorded its own outcome
+        return None
+    _record_failure(job, error)
+    job.save(update_fields=['status', 'run_after', 'finished_at', 'last_error'])
+    return job.status
+
+
+def run_job(job_id, claim_first=False):
+    """Execute a claimed job and record the outcome. Returns the final status."""
+    if claim_first and not _mark_running(Job.objects.filter(pk=job_id, status=Job.PENDING)):
+        return None
+    job = Job.objects.get(pk=job_id)
+
+    try:
+        import_string(job.task)(**job.payload)
+    except Exception:
+        logger.exception('Job %s (%s) failed', job.pk, job.task)
+        _record_failure(job, traceback.format_exc())
+    else:
+        job.status = Job.DONE
+        job.finished_at = timezone.now()
+
+    job.save(update_fields=['status', 'run_after', 'finished_at', 'last_error'])
+    return job.status
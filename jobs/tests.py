@@ -0,0 +1,120 @@
+import io
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from .models import Job
+from .queue import claim, enqueue, fail_job, requeue_stale, run_job
+
+calls = []
+
+
+def record(**kwargs):
+    calls.append(kwargs)
+
+
+def explode():
+    raise ValueError('boom')
+
+
+class JobQueueTests(TestCase):
+
+    def setUp(self):
+        calls.clear()
+
+    def test_claim_and_run(self):
+        job = enqueue('jobs.tests.record', value=1)
+        self.assertEqual(claim(10), [job.pk])
+        self.assertEqual(claim(10), [])
+        self.assertEqual(run_job(job.pk), Job.DONE)
+        self.assertEqual(calls, [{'value': 1}])
+
+    def test_failed_job_is_retried_then_given_up(self):
+        job = enqueue('jobs.tests.explode')
+        job.max_attempts = 2
+        job.save()
+        with self.assertLogs('jobs.queue', 'ERROR'):
+            self.assertEqual(run_job(job.pk, claim_first=True), Job.PENDING)
+            Job.objects.filter(pk=job.pk).update(run_after=job.run_after)
+            self.assertEqual(claim(10), [job.pk])
+            self.assertEqual(run_job(job.pk), Job.FAILED)
+        self.assertIn('ValueError', Job.objects.get(pk=job.pk).last_error)
+
+    def test_requeue_stale(self):
+        job = enqueue('jobs.tests.record')
+        claim(1)
+        self.assertEqual(requeue_stale(older_than=-1), 1)
+        self.assertEqual(Job.objects.get(pk=job.pk).status, Job.PENDING)
+
+    @override_settings(JOBS_EAGER=True)
+    def test_eager_runs_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            job = enqueue('jobs.tests.record', value=2)
+        self.assertEqual(calls, [{'value': 2}])
+        self.assertEqual(Job.objects.get(pk=job.pk).status, Job.DONE)
+
+
+class InlineExecutor:
+    """Stand-in for the process pool of run_jobs, running each job right away"""
+    instances = 0
+
+    def __init__(self, max_workers, initializer):
+        InlineExecutor.instances += 1
+
+    def submit(self, fn, *args):
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+
+def crash_or_run(job_id):
+    if Job.objects.get(pk=job_id).task == 'jobs.tests.explode':
+        raise BrokenProcessPool('A child process terminated abruptly')
+    return run_job(job_id)
+
+
+@mock.patch('jobs.management.commands.run_jobs.ProcessPoolExecutor', InlineExecutor)
+class RunJobsCommandTests(TestCase):
+
+    def setUp(self):
+        calls.clear()
+        InlineExecutor.instances = 0
+
+    def run_jobs(self):
+        stdout = io.StringIO()
+        call_command('run_jobs', once=True, workers=2, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_runs_the_queue(self):
+        enqueue('jobs.tests.record', value=1)
+        self.assertIn('Processed 1 job(s)', self.run_jobs())
+        self.assertEqual(calls, [{'value': 1}])
+
+    @mock.patch('jobs.management.commands.run_jobs.run_job', crash_or_run)
+    def test_broken_pool_fails_the_job_and_is_replaced(self):
+        crashed = enqueue('jobs.tests.explode')
+        other = enqueue('jobs.tests.record', value=1)
+        with self.assertLogs('jobs.management.commands.run_jobs', 'ERROR'):
+            output = self.run_jobs()
+        self.assertIn('Processed 2 job(s)', output)
+        crashed.refresh_from_db()
+        self.assertEqual(crashed.status, Job.PENDING)  # Retried later
+        self.assertIn('BrokenProcessPool', crashed.last_error)
+        self.assertEqual(Job.objects.get(pk=other.pk).status, Job.DONE)
+        self.assertEqual(InlineExecutor.instances, 2)
+
+    def test_requeue_stale_spares_running_jobs(self):
+        job = enqueue('jobs.tests.record')
+        claim(1)
+        self.assertEqual(requeue_stale(older_than=-1, exclude=[job.pk]), 0)
+        self.assertEqual(fail_job(job.pk, 'worker died'), Job.PENDING)
+        self.assertIsNone(fail_job(job.pk, 'worker died'))
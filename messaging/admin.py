@@ -1,6 +1,7 @@
 from django.contrib import admin
 
-from .models import Conversation, ConversationMessage
+from .models import Conversation, ConversationMessage, ConversationSummary
 
 admin.site.register(Conversation)
-admin.site.register(ConversationMessage)
\ No newline at end of file
+admin.site.register(ConversationMessage)
+admin.site.register(ConversationSummary)
\ No newline at end of file
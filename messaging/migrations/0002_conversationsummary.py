@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def build_summaries(apps, schema_editor):
+    Conversation = apps.get_model('messaging', 'Conversation')
+    ConversationSummary = apps.get_model('messaging', 'ConversationSummary')
+    PostImage = apps.get_model('blog', 'PostImage')
+
+    summaries = []
+    conversations = Conversation.objects.select_related('post').prefetch_related('members')
+    for conversation in conversations.iterator(chunk_size=500):
+        last = conversation.messages.order_by('-created_at', '-id').first()
+        if last is None:
+            continue
+        members = list(conversation.members.all())
+        cover = PostImage.objects.filter(post_id=conversation.post_id).order_by('uploaded_at', 'id').first()
+        for member in members:
+            summaries.append(ConversationSummary(
+                user=member,
+                conversation=conversation,
+                other_user=next((m for m in members if m != member), member),
+                post_title=conversation.post.title,
+                cover_image=cover,
+                last_message=' '.join(last.content.split())[:140],
+                last_activity=last.created_at,
+            ))
+    ConversationSummary.objects.bulk_create(summaries, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0007_postimage_renditions'),
+        ('messaging', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConversationSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('post_title', models.CharField(max_length=100)),
+                ('last_message', models.CharField(blank=True, max_length=140)),
+                ('unread_count', models.PositiveIntegerField(default=0)),
+                ('last_activity', models.DateTimeField()),
+                ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='summaries', to='messaging.conversation')),
+                ('cover_image', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='blog.postimage')),
+                ('other_user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversation_summaries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ('-last_activity',),
+                'indexes': [models.Index(fields=['user', '-last_activity', '-id'], name='messaging_summary_inbox_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'conversation'), name='messaging_summary_unique')],
+            },
+        ),
+        migrations.RunPython(build_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,100 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:20
+
+import logging
+
+from django.db import migrations
+from django.db.models import Max, Sum
+from django.utils.text import Truncator
+
+logger = logging.getLogger(__name__)
+
+
+def snippet(content):
+    # As messaging.signals.snippet() when this migration was written
+    return Truncator(' '.join(content.split())).chars(140)
+
+
+def merge_summaries(apps, conversation_id, duplicate_ids):
+    """Rebuild the inbox rows and modified_at of a conversation that took over the messages of others"""
+    Conversation = apps.get_model('messaging', 'Conversation')
+    ConversationMessage = apps.get_model('messaging', 'ConversationMessage')
+    ConversationSummary = apps.get_model('messaging', 'ConversationSummary')
+    ids = [conversation_id, *duplicate_ids]
+
+    latest = ConversationMessage.objects.filter(conversation_id=conversation_id).order_by('-created_at', '-id').first()
+    modified_at = Conversation.objects.filter(pk__in=ids).aggregate(last=Max('modified_at'))['last']
+    if latest is not None:
+        modified_at = max(modified_at, latest.created_at)
+    Conversation.objects.filter(pk=conversation_id).update(modified_at=modified_at)
+
+    # One row per member: the kept conversation's own, else one of a duplicate
+    rows = {}
+    for row in ConversationSummary.objects.filter(conversation_id__in=ids).order_by('id'):
+        if row.user_id not in rows or row.conversation_id == conversation_id:
+            rows[row.user_id] = row
+    unread = dict(ConversationSummary.objects.filter(conversation_id__in=ids).order_by()
+                  .values('user_id').annotate(total=Sum('unread_count')).values_list('user_id', 'total'))
+    ConversationSummary.objects.filter(conversation_id__in=ids).exclude(pk__in=[row.pk for row in rows.values()]).delete()
+    for user_id, row in rows.items():
+        row.conversation_id = conversation_id
+        row.unread_count = unread[user_id]
+        if latest is not None:
+            row.last_message = snippet(latest.content)
+            row.last_activity = latest.created_at
+        row.save()
+
+
+def backfill_buyer_seller(apps, schema_editor):
+    """Fill buyer/seller from the members, merging duplicate threads of a (post, buyer) pair"""
+    Conversation = apps.get_model('messaging', 'Conversation')
+    ConversationMessage = apps.get_model('messaging', 'ConversationMessage')
+    Membership = Conversation.members.through
+
+    members = {}
+    for conversation_id, user_id in Membership.objects.values_list('conversation_id', 'user_id').iterator():
+        members.setdefault(conversation_id, set()).add(user_id)
+
+    kept = {}  # (post id, buyer id) -> id of the oldest conversation
+    duplicates = {}  # conversation id -> id of the conversation it is merged into
+    orphans = []
+    conversations = Conversation.objects.order_by('created_at', 'id').values_list('id', 'post_id', 'post__author_id')
+    for conversation_id, post_id, seller_id in conversations.iterator():
+        others = members.get(conversation_id, set()) - {seller_id}
+        if not others:
+            orphans.append(conversation_id)  # No buyer left (e.g. deleted account)
+            continue
+        buyer_id = min(others)
+        key = (post_id, buyer_id)
+        if key in kept:
+            duplicates[conversation_id] = kept[key]
+            continue
+        kept[key] = conversation_id
+        Conversation.objects.filter(pk=conversation_id).update(buyer_id=buyer_id, seller_id=seller_id)
+
+    # Threads opened twice by racing requests: keep the oldest with all the messages
+    merged = {}  # kept conversation id -> ids of its duplicates
+    for duplicate_id, conversation_id in duplicates.items():
+        merged.setdefault(conversation_id, []).append(duplicate_id)
+    for conversation_id, duplicate_ids in merged.items():
+        ConversationMessage.objects.filter(conversation_id__in=duplicate_ids).update(conversation_id=conversation_id)
+        merge_summaries(apps, conversation_id, duplicate_ids)
+    Conversation.objects.filter(pk__in=list(duplicates)).delete()
+
+    if orphans:
+        # Only the seller is left, there is no buyer to assign the thread to
+        messages = ConversationMessage.objects.filter(conversation_id__in=orphans).count()
+        logger.warning('Deleting %d conversations without a buyer (%d messages): ids %s',
+                       len(orphans), messages, ', '.join(map(str, orphans)))
+        Conversation.objects.filter(pk__in=orphans).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0004_conversation_buyer_seller'),
+        ('blog', '0012_listing_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_buyer_seller, migrations.RunPython.noop),
+    ]
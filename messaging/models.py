@@ -1,19 +1,72 @@
 from django.contrib.auth.models import User
 from django.db import models
-from blog.models import Post
+from blog.models import Post, PostImage
+
+class ConversationQuerySet(models.QuerySet):
+
+    def involving(self, user):
+        """Conversations `user` takes part in, as buyer or as seller"""
+        return self.filter(models.Q(buyer=user) | models.Q(seller=user))
+
 
 class Conversation(models.Model):
+    """Thread between the seller of a post and one buyer, at most one per (post, buyer)"""
     post = models.ForeignKey(Post, related_name='conversations', on_delete=models.CASCADE)
-    members = models.ManyToManyField(User, related_name='conversations')
+    buyer = models.ForeignKey(User, related_name='buying_conversations', on_delete=models.CASCADE)
+    seller = models.ForeignKey(User, related_name='selling_conversations', on_delete=models.CASCADE)  # The post author
     created_at = models.DateTimeField(auto_now_add=True)
     modified_at = models.DateTimeField(auto_now=True)
 
+    objects = ConversationQuerySet.as_manager()
+
     class Meta:
         ordering = ('-modified_at',)
+        constraints = [
+            # Also the index behind the "existing conversation?" lookup
+            models.UniqueConstraint(fields=['post', 'buyer'], name='messaging_conversation_unique'),
+        ]
+
+    @property
+    def member_ids(self):
+        return (self.buyer_id, self.seller_id)
 
 
 class ConversationMessage(models.Model):
     conversation = models.ForeignKey(Conversation, related_name='messages', on_delete=models.CASCADE)
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
-    created_by = models.ForeignKey(User, related_name='created_messages', on_delete=models.CASCADE)
\ No newline at end of file
+    created_by = models.ForeignKey(User, related_name='created_messages', on_delete=models.CASCADE)
+
+    class Meta:
+        indexes = [
+            # Message history is read page by page, newest first
+            models.Index(fields=['conversation', 'created_at', 'id'], name='messaging_message_history_idx'),
+        ]
+
+
+class ConversationSummary(models.Model):
+    """Inbox row of a conversation for one of its members.
+
+    Denormalized read model kept up to date by messaging/signals.py, so the
+    inbox is a single indexed query whatever the number of conversations.
+    """
+    user = models.ForeignKey(User, related_name='conversation_summaries', on_delete=models.CASCADE)
+    conversation = models.ForeignKey(Conversation, related_name='summaries', on_delete=models.CASCADE)
+    other_user = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE)
+    post_title = models.CharField(max_length=100)
+    cover_image = models.ForeignKey(PostImage, related_name='+', null=True, blank=True, on_delete=models.SET_NULL)
+    last_message = models.CharField(max_length=140, blank=True)  # Snippet of the latest message
+    unread_count = models.PositiveIntegerField(default=0)
+    last_activity = models.DateTimeField()
+
+    class Meta:
+        ordering = ('-last_activity',)
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'conversation'], name='messaging_summary_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-last_activity', '-id'], name='messaging_summary_inbox_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user} - {self.post_title}'
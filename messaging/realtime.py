@@ -0,0 +1,146 @@
+"""Pub/sub hub used to push new messages to open conversations.
+
+A channel is a conversation id and an event is the id of a new message. The
+views subscribe *before* reading the database, then wait for an event, so a
+message committed in between is never missed:
+
+    async with get_hub().subscribe(conversation_id) as subscription:
+        ...read messages newer than the client's last id...
+        await subscription.wait(timeout)
+
+The backend is chosen with the MESSAGING_REALTIME_BACKEND setting:
+InMemoryBackend for a single server process, DatabaseBackend when several
+processes serve the site.
+"""
+import asyncio
+import threading
+from functools import lru_cache
+
+from django.conf import settings
+from django.db.models import Max
+from django.utils.module_loading import import_string
+
+
+class BaseBackend:
+
+    def publish(self, channel, event_id):
+        """Announce a new event. Safe to call from sync code in any thread."""
+        raise NotImplementedError
+
+    def subscribe(self, channel):
+        """Async context manager whose `wait(timeout)` returns True once an event arrives"""
+        raise NotImplementedError
+
+
+class _MemorySubscription:
+
+    def __init__(self, backend, channel):
+        self.backend = backend
+        self.channel = channel
+        self.event = asyncio.Event()
+        self.loop = None
+
+    async def __aenter__(self):
+        self.loop = asyncio.get_running_loop()
+        self.backend._add(self)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.backend._remove(self)
+
+    def notify(self):
+        self.loop.call_soon_threadsafe(self.event.set)
+
+    async def wait(self, timeout):
+        try:
+            await asyncio.wait_for(self.event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        self.event.clear()
+        return True
+
+
+class InMemoryBackend(BaseBackend):
+    """Delivers events to subscribers living in the same process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = {}
+
+    def _add(self, subscription):
+        with self._lock:
+            self._subscriptions.setdefault(subscription.channel, set()).add(subscription)
+
+    def _remove(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.channel, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self._subscriptions.pop(subscription.channel, None)
+
+    def publish(self, channel, event_id):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.notify()
+
+    def subscribe(self, channel):
+        return _MemorySubscription(self, channel)
+
+
+class _DatabaseSubscription:
+
+    def __init__(self, backend, channel):
+        self.backend = backend
+        self.channel = channel
+        self.last_id = None
+
+    async def _latest_id(self):
+        from .models import ConversationMessage
+        result = await ConversationMessage.objects.filter(
+            conversation_id=self.channel
+        ).aaggregate(latest=Max('id'))
+        return result['latest'] or 0
+
+    async def __aenter__(self):
+        self.last_id = await self._latest_id()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    async def wait(self, timeout):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while loop.time() < deadline:
+            await asyncio.sleep(min(self.backend.poll_interval, deadline - loop.time()))
+            latest = await self._latest_id()
+            if latest > self.last_id:
+                self.last_id = latest
+                return True
+        return False
+
+
+class DatabaseBackend(BaseBackend):
+    """Works across processes by polling the messages table.
+
+    Every committed ConversationMessage row already is the notification, so
+    publishing is free and subscribers look for a newer id in the channel.
+    """
+    poll_interval = 1.0
+
+    def publish(self, channel, event_id):
+        pass
+
+    def subscribe(self, channel):
+        return _DatabaseSubscription(self, channel)
+
+
+@lru_cache(maxsize=None)
+def _load_hub(path):
+    return import_string(path)()
+
+
+def get_hub():
+    return _load_hub(getattr(settings, 'MESSAGING_REALTIME_BACKEND',
+                             'messaging.realtime.InMemoryBackend'))
@@ -0,0 +1,89 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models import Case, F, When
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.text import Truncator
+
+from blog.models import Post, PostImage
+from .models import ConversationMessage, ConversationSummary
+from .realtime import get_hub
+
+
+def snippet(content):
+    return Truncator(' '.join(content.split())).chars(140)
+
+
+@receiver(post_save, sender=ConversationMessage)
+def update_summaries(sender, instance, created, **kwargs):
+    """Refresh the inbox rows of every member when a message is sent"""
+    if not created:
+        return
+
+    # Usual case: one UPDATE covering both members
+    updated = ConversationSummary.objects.filter(conversation_id=instance.conversation_id).update(
+        last_message=snippet(instance.content),
+        last_activity=instance.created_at,
+        unread_count=Case(
+            When(user_id=instance.created_by_id, then=0),
+            default=F('unread_count') + 1,
+        ),
+    )
+    if updated:
+        return
+
+    # First message of the conversation: create the rows
+    conversation = instance.conversation
+    post = conversation.post
+    cover = post.cover_image
+    buyer_id, seller_id = conversation.member_ids
+    ConversationSummary.objects.bulk_create([
+        ConversationSummary(
+            user_id=user_id,
+            conversation=conversation,
+            other_user_id=other_id,
+            post_title=post.title,
+            cover_image=cover,
+            last_message=snippet(instance.content),
+            unread_count=0 if user_id == instance.created_by_id else 1,
+            last_activity=instance.created_at,
+        )
+        for user_id, other_id in ((buyer_id, seller_id), (seller_id, buyer_id))
+    ], ignore_conflicts=True)
+
+
+@receiver(post_save, sender=ConversationMessage)
+def publish_message(sender, instance, created, **kwargs):
+    """Wake up the clients waiting on this conversation once the message is committed"""
+    if created:
+        transaction.on_commit(partial(get_hub().publish, instance.conversation_id, instance.pk))
+
+
+@receiver(post_save, sender=Post)
+def update_summary_titles(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields is not None and 'title' not in update_fields):
+        return
+    changed = instance.changed_fields()
+    if changed is not None and 'title' not in changed:
+        return  # Same title as when the post was loaded
+    ConversationSummary.objects.filter(conversation__post=instance).update(post_title=instance.title)
+
+
+@receiver(post_save, sender=Post)
+def hide_deleted_post_conversations(sender, instance, **kwargs):
+    """Drop the inbox rows of a soft-deleted post, its conversations are purged later"""
+    if instance.deleted_at is not None:
+        ConversationSummary.objects.filter(conversation__post=instance).delete()
+
+
+@receiver(post_save, sender=PostImage)
+@receiver(post_delete, sender=PostImage)
+def update_summary_covers(sender, instance, **kwargs):
+    if kwargs.get('created') is False:
+        return
+    cover_id = (PostImage.objects.filter(post_id=instance.post_id)
+                .order_by('uploaded_at', 'id').values_list('id', flat=True).first())
+    ConversationSummary.objects.filter(conversation__post_id=instance.post_id).update(
+        cover_image_id=cover_id
+    )
@@ -1,3 +1,321 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import shutil
+import tempfile
+import threading
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+from PIL import Image
+
+from blog.images import generate_renditions
+from blog.models import Category, Post, PostImage
+from monitoring.loadtest import routed_views
+from . import views
+from .models import Conversation, ConversationMessage, ConversationSummary
+from .realtime import InMemoryBackend
+from .views import MESSAGES_PER_PAGE
+
+MEDIA_ROOT = tempfile.mkdtemp()
+Image.new('RGB', (10, 10)).save(f'{MEDIA_ROOT}/default.jpg')
+
+
+def tearDownModule():
+    shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class MessagingTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', password='pass')
+        cls.buyer = User.objects.create_user('buyer', password='pass')
+        cls.category = Category.objects.create(name='Casa')
+        cls.post = Post.objects.create(title='Lampada', content='-', author=cls.seller,
+                                       category=cls.category)
+
+    def start_conversation(self, buyer=None, post=None, content='Ciao, è disponibile?'):
+        self.client.force_login(buyer or self.buyer)
+        post = post or self.post
+        self.client.post(reverse('conversation:new', args=[post.pk]), {'content': content})
+        return Conversation.objects.get(post=post, buyer=buyer or self.buyer)
+
+    def reply(self, user, conversation, content):
+        self.client.force_login(user)
+        self.client.post(reverse('conversation:detail', args=[conversation.pk]), {'content': content})
+
+
+class ConversationTests(MessagingTestCase):
+
+    def test_double_submit_creates_one_conversation(self):
+        first = self.start_conversation()
+        second = self.start_conversation(content='Ancora io')
+        self.assertEqual(first, second)
+        self.assertEqual(Conversation.objects.filter(post=self.post).count(), 1)
+        self.assertEqual(first.seller, self.seller)
+
+    def test_existing_conversation_is_found_with_one_query(self):
+        conversation = self.start_conversation()
+        url = reverse('conversation:new', args=[self.post.pk])
+        # session, user, post, conversation lookup
+        with self.assertNumQueries(4):
+            response = self.client.get(url)
+        self.assertRedirects(response, reverse('conversation:detail', args=[conversation.pk]))
+
+    def test_concurrent_create_reuses_the_winner(self):
+        self.client.force_login(self.buyer)
+        url = reverse('conversation:new', args=[self.post.pk])
+        # Another request creates the row between the lookup and the insert
+        winner = Conversation(post=self.post, buyer=self.buyer, seller=self.seller)
+        lookup = Conversation.objects.filter(post=self.post, buyer=self.buyer).values_list('id', flat=True)
+        with mock.patch('messaging.views.Conversation.objects.filter', return_value=lookup.none()):
+            winner.save()
+            self.client.post(url, {'content': 'Ciao'})
+        self.assertEqual(Conversation.objects.filter(post=self.post).count(), 1)
+        self.assertEqual(winner.messages.count(), 1)
+
+    def test_buyer_and_post_are_unique(self):
+        Conversation.objects.create(post=self.post, buyer=self.buyer, seller=self.seller)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Conversation.objects.create(post=self.post, buyer=self.buyer, seller=self.seller)
+
+
+class InboxTests(MessagingTestCase):
+
+    def test_summaries_follow_messages(self):
+        conversation = self.start_conversation()
+        self.reply(self.buyer, conversation, 'Posso passare domani?')
+
+        seller_row = ConversationSummary.objects.get(user=self.seller)
+        buyer_row = ConversationSummary.objects.get(user=self.buyer)
+        self.assertEqual(seller_row.other_user, self.buyer)
+        self.assertEqual(seller_row.unread_count, 2)
+        self.assertEqual(seller_row.last_message, 'Posso passare domani?')
+        self.assertEqual(buyer_row.unread_count, 0)
+
+        self.client.force_login(self.seller)
+        self.client.get(reverse('conversation:detail', args=[conversation.pk]))
+        self.assertEqual(ConversationSummary.objects.get(user=self.seller).unread_count, 0)
+
+    def test_title_change_is_propagated(self):
+        self.start_conversation()
+        self.post.title = 'Lampada da tavolo'
+        self.post.save()
+        self.assertEqual(ConversationSummary.objects.get(user=self.seller).post_title, 'Lampada da tavolo')
+
+        post = Post.objects.get(pk=self.post.pk)
+        post.price = 30
+        with CaptureQueriesContext(connection) as queries:
+            post.save()
+        self.assertFalse([q for q in queries if 'UPDATE "messaging_conversationsummary"' in q['sql']])
+        post.title = 'Lampada'
+        post.save()
+        self.assertEqual(ConversationSummary.objects.get(user=self.seller).post_title, 'Lampada')
+
+    def test_inbox_queries_do_not_grow(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (500, 500)).save(buffer, 'PNG')
+        upload = SimpleUploadedFile('lampada.png', buffer.getvalue())
+        generate_renditions(PostImage.objects.create(post=self.post, image=upload))
+        for i in range(3):
+            buyer = User.objects.create_user(f'buyer{i}', password='pass')
+            self.start_conversation(buyer=buyer)
+
+        self.client.force_login(self.seller)
+        # session, user, summaries page, cover renditions
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('conversation:inbox'))
+        self.assertContains(response, 'Lampada', count=3)
+        self.assertContains(response, 'buyer2')
+        self.assertContains(response, 'feed.webp', count=3)
+
+
+class MessageHistoryTests(MessagingTestCase):
+
+    def setUp(self):
+        self.conversation = self.start_conversation(content='Messaggio 0')
+        ConversationMessage.objects.bulk_create(
+            ConversationMessage(conversation=self.conversation, created_by=self.buyer,
+                                content=f'Messaggio {i}')
+            for i in range(1, MESSAGES_PER_PAGE + 5)
+        )
+        self.url = reverse('conversation:messages', args=[self.conversation.pk])
+
+    def test_detail_shows_latest_page_in_constant_queries(self):
+        # session, user, conversation, mark as read, messages with their authors
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('conversation:detail', args=[self.conversation.pk]))
+        shown = [m.content for m in response.context['conversation_messages']]
+        self.assertEqual(len(shown), MESSAGES_PER_PAGE)
+        self.assertEqual(shown[-1], f'Messaggio {MESSAGES_PER_PAGE + 4}')
+        self.assertTrue(response.context['older_cursor'])
+
+    def test_older_and_newer_messages(self):
+        response = self.client.get(reverse('conversation:detail', args=[self.conversation.pk]))
+        older = self.client.get(self.url, {'before': response.context['older_cursor']}).json()
+        self.assertEqual(older['count'], 5)
+        self.assertIsNone(older['older_cursor'])
+        self.assertIn('Messaggio 0<', older['html'])
+
+        last_id = response.context['last_id']
+        self.reply(self.seller, self.conversation, 'Nuovo')
+        newer = self.client.get(self.url, {'after': last_id}).json()
+        self.assertEqual(newer['count'], 1)
+        self.assertIn('Nuovo', newer['html'])
+
+    def test_only_members_can_read(self):
+        self.client.force_login(User.objects.create_user('other', password='pass'))
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+
+class AsyncInboxTests(MessagingTestCase):
+
+    async def test_async_inbox(self):
+        await sync_to_async(self.start_conversation)()
+        await self.async_client.aforce_login(self.seller)
+        with routed_views(True):
+            self.assertIs(resolve(reverse('conversation:inbox')).func, views.ainbox)
+            response = await self.async_client.get(reverse('conversation:inbox'))
+            self.assertContains(response, 'Ciao, è disponibile?')
+            self.assertContains(response, '<strong>buyer</strong>')
+            self.assertEqual((await self.async_client.get(reverse('conversation:inbox'),
+                                                          {'cursor': 'x'})).status_code, 404)
+
+
+class RealtimeTests(MessagingTestCase):
+
+    def test_in_memory_hub_wakes_subscribers_from_other_threads(self):
+        hub = InMemoryBackend()
+
+        async def scenario():
+            async with hub.subscribe(1) as subscription:
+                threading.Thread(target=hub.publish, args=(1, 10)).start()
+                woken = await subscription.wait(5)
+            async with hub.subscribe(1) as subscription:
+                timed_out = not await subscription.wait(0.01)
+            return woken, timed_out
+
+        self.assertEqual(asyncio.run(scenario()), (True, True))
+        self.assertEqual(hub._subscriptions, {})
+
+    def test_long_poll(self):
+        conversation = self.start_conversation()
+        first = conversation.messages.get()
+        url = reverse('conversation:poll', args=[conversation.pk])
+
+        data = self.client.get(url, {'after': 0}).json()
+        self.assertEqual((data['count'], data['last_id']), (1, first.pk))
+
+        with mock.patch('messaging.views.LONG_POLL_TIMEOUT', 0.01):
+            data = self.client.get(url, {'after': first.pk}).json()
+        self.assertEqual(data['count'], 0)
+
+    async def test_event_stream(self):
+        conversation = await sync_to_async(self.start_conversation)()
+        first = await conversation.messages.afirst()
+        await self.async_client.aforce_login(self.seller)
+
+        response = await self.async_client.get(
+            reverse('conversation:events', args=[conversation.pk]), {'after': 0}
+        )
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = aiter(response.streaming_content)
+        self.assertEqual(await anext(events), b'retry: 3000\n\n')
+        event = (await anext(events)).decode()
+        self.assertTrue(event.startswith(f'id: {first.pk}\n'))
+        self.assertEqual(json.loads(event.split('data: ', 1)[1])['count'], 1)
+        await events.aclose()
+
+        detail = await self.async_client.get(reverse('conversation:detail', args=[conversation.pk]))
+        self.assertContains(detail, 'data-events-url=')
+
+    def test_no_event_stream_under_wsgi(self):
+        conversation = self.start_conversation()
+        response = self.client.get(reverse('conversation:detail', args=[conversation.pk]))
+        self.assertNotContains(response, 'data-events-url=')
+        response = self.client.get(reverse('conversation:events', args=[conversation.pk]))
+        self.assertEqual(response.status_code, 404)
+
+
+class QueryPlanTests(MessagingTestCase):
+
+    def assertUsesIndex(self, queryset, index):
+        plan = queryset.explain()
+        self.assertIn(index, plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_inbox(self):
+        queryset = ConversationSummary.objects.filter(user=self.seller).order_by('-last_activity', '-id')
+        self.assertUsesIndex(queryset[:21], 'messaging_summary_inbox_idx')
+
+    def test_message_history(self):
+        conversation = self.start_conversation()
+        queryset = conversation.messages.order_by('-created_at', '-id')
+        self.assertUsesIndex(queryset[:31], 'messaging_message_history_idx')
+
+
+class BuyerSellerMigrationTests(TransactionTestCase):
+    """Backfill of buyer/seller (migration 0005) from the old members M2M"""
+    before = [('messaging', '0004_conversation_buyer_seller')]
+    after = [('messaging', '0006_conversation_unique_buyer')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def setUp(self):
+        self.addCleanup(lambda: self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes()))
+        apps = self.migrate(self.before)
+        # Historical models of the messaging app only, the others are migrated
+        Conversation = apps.get_model('messaging', 'Conversation')
+        ConversationMessage = apps.get_model('messaging', 'ConversationMessage')
+        ConversationSummary = apps.get_model('messaging', 'ConversationSummary')
+        seller = User.objects.create_user('seller').pk
+        buyer = User.objects.create_user('buyer').pk
+        post = Post.objects.create(title='Lampada', content='-', author_id=seller,
+                                   category=Category.objects.create(name='Casa'))
+        now = timezone.now()
+        # The same thread opened twice, plus one whose buyer is gone
+        for i, (text, members) in enumerate([('Ancora disponibile?', [seller, buyer]),
+                                             ('Posso passare domani?', [seller, buyer]),
+                                             ('Ciao', [seller])]):
+            conversation = Conversation.objects.create(post_id=post.pk)
+            conversation.members.set(members)
+            at = now + timedelta(minutes=i)
+            ConversationMessage.objects.create(conversation=conversation, content=text, created_by_id=members[-1])
+            ConversationMessage.objects.filter(conversation=conversation).update(created_at=at)
+            Conversation.objects.filter(pk=conversation.pk).update(created_at=at, modified_at=at)
+            for user, other, unread in ((seller, buyer, 1), (buyer, seller, 0)):
+                ConversationSummary.objects.create(user_id=user, conversation=conversation, other_user_id=other,
+                                                   post_title=post.title, last_message=text,
+                                                   unread_count=unread, last_activity=at)
+        self.latest = now + timedelta(minutes=1)
+
+    def test_duplicates_are_merged(self):
+        with self.assertLogs('messaging.migrations', 'WARNING') as logs:
+            self.migrate(self.after)
+        self.assertIn('Deleting 1 conversations without a buyer (1 messages)', logs.output[0])
+
+        conversation = Conversation.objects.get()
+        self.assertEqual((conversation.buyer.username, conversation.seller.username), ('buyer', 'seller'))
+        self.assertEqual(conversation.messages.count(), 2)
+        self.assertEqual(conversation.modified_at, self.latest)
+        rows = {row.user.username: row for row in ConversationSummary.objects.all()}
+        self.assertEqual(rows.keys(), {'buyer', 'seller'})
+        for username, unread in (('seller', 2), ('buyer', 0)):
+            self.assertEqual(rows[username].conversation, conversation)
+            self.assertEqual(rows[username].last_message, 'Posso passare domani?')
+            self.assertEqual(rows[username].last_activity, self.latest)
+            self.assertEqual(rows[username].unread_count, unread)
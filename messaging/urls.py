@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path
 
 from . import views
@@ -5,7 +6,10 @@ from . import views
 app_name = 'conversation'
 
 urlpatterns = [
-    path('', views.inbox, name='inbox'),
+    path('', views.ainbox if settings.ASYNC_VIEWS else views.inbox, name='inbox'),
     path('<int:pk>/', views.detail, name='detail'),
+    path('<int:pk>/messages/', views.message_list, name='messages'),
+    path('<int:pk>/poll/', views.message_poll, name='poll'),
+    path('<int:pk>/events/', views.message_events, name='events'),
     path('new/<int:post_pk>/', views.new_conversation, name='new'),
 ]
\ No newline at end of file
@@ -1,37 +1,52 @@
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
 from django.contrib.auth.decorators import login_required
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.template.loader import render_to_string
 from django.shortcuts import render, get_object_or_404, redirect
 
 from blog.models import Post
+from blog.pagination import CursorPaginator, InvalidCursor
 from .forms import ConversationMessageForm
-from .models import Conversation
+from .models import Conversation, ConversationMessage, ConversationSummary
+from .realtime import get_hub
+
+MESSAGES_PER_PAGE = 30
+LONG_POLL_TIMEOUT = 25  # seconds
+EVENT_STREAM_DURATION = 300  # seconds, the browser reconnects afterwards
+KEEPALIVE_INTERVAL = 15  # seconds
 
 @login_required
 def new_conversation(request, post_pk):
-    post = get_object_or_404(Post, pk=post_pk)
+    post = get_object_or_404(Post.objects.only('id', 'author_id'), pk=post_pk)
 
     # Can't start a conversation with yourself
-    if post.author == request.user:
+    if post.author_id == request.user.id:
         return redirect('blog:home')
-    
-    conversations = Conversation.objects.filter(post=post).filter(members__in=[request.user.id])
 
-    if conversations:
-        return redirect('conversation:detail', pk=conversations.first().id)
+    # One indexed lookup on the (post, buyer) unique constraint
+    conversation_id = (Conversation.objects.filter(post=post, buyer=request.user)
+                       .values_list('id', flat=True).first())
+    if conversation_id is not None:
+        return redirect('conversation:detail', pk=conversation_id)
 
     if request.method == 'POST':
         form = ConversationMessageForm(request.POST)
 
         if form.is_valid():
-            # Crucial step.
-            conversation = Conversation.objects.create(post=post)
-            conversation.members.add(request.user)
-            conversation.members.add(post.author)
-            conversation.save()
-
-            conversation_message = form.save(commit=False)
-            conversation_message.conversation = conversation
-            conversation_message.created_by = request.user
-            conversation_message.save()
+            with transaction.atomic():
+                # A double submit finds the conversation created by the first request
+                conversation, _ = Conversation.objects.get_or_create(
+                    post=post, buyer=request.user, defaults={'seller_id': post.author_id},
+                )
+                conversation_message = form.save(commit=False)
+                conversation_message.conversation = conversation
+                conversation_message.created_by = request.user
+                conversation_message.save()
 
             return redirect('blog:post-detail', pk=post_pk)
     else:
@@ -41,17 +56,68 @@ def new_conversation(request, post_pk):
         'form': form
     })
 
+def inbox_paginator(user):
+    summaries = (ConversationSummary.objects.filter(user=user)
+                 .select_related('other_user', 'cover_image')
+                 .prefetch_related('cover_image__renditions'))
+    return CursorPaginator(summaries, 20, ordering=('-last_activity', '-id'))
+
+
+def inbox_context(page):
+    return {
+        'summaries': page.object_list,
+        'page_obj': page,
+        'is_paginated': page.has_other_pages(),
+    }
+
+
 @login_required
 def inbox(request):
-    conversations = Conversation.objects.filter(members__in=[request.user.id])
+    paginator = inbox_paginator(request.user)
+    try:
+        page = paginator.page(request.GET.get('cursor'))
+    except InvalidCursor:
+        raise Http404('Invalid page cursor.')
+
+    return render(request, 'messaging/inbox.html', inbox_context(page))
+
+
+@login_required
+async def ainbox(request):
+    """Async inbox, routed when ASYNC_VIEWS is on (see blog/views.py)"""
+    paginator = inbox_paginator(await request.auser())
+    try:
+        page = await paginator.apage(request.GET.get('cursor'))
+    except InvalidCursor:
+        raise Http404('Invalid page cursor.')
+
+    return await sync_to_async(render)(request, 'messaging/inbox.html', inbox_context(page))
+
+def is_asgi(request):
+    """Served by asgi.py: a WSGI server would buffer the whole event stream"""
+    return isinstance(request, ASGIRequest)
+
+
+def get_member_conversation(request, pk):
+    return get_object_or_404(Conversation.objects.involving(request.user), pk=pk)
+
+
+def message_history(conversation, cursor=None):
+    """Page of messages, newest first; the page's next cursor points to older messages"""
+    messages = conversation.messages.select_related('created_by')
+    paginator = CursorPaginator(messages, MESSAGES_PER_PAGE, ordering=('-created_at', '-id'))
+    try:
+        return paginator.page(cursor)
+    except InvalidCursor:
+        raise Http404('Invalid page cursor.')
 
-    return render(request, 'messaging/inbox.html', {
-        'conversations': conversations
-    })
 
 @login_required
 def detail(request, pk):
-    conversation = Conversation.objects.filter(members__in=[request.user.id]).get(pk=pk)
+    conversation = get_member_conversation(request, pk)
+    ConversationSummary.objects.filter(
+        user=request.user, conversation=conversation, unread_count__gt=0
+    ).update(unread_count=0)
 
     if request.method == 'POST':
         form = ConversationMessageForm(request.POST)
@@ -68,7 +134,119 @@ def detail(request, pk):
     else:
         form = ConversationMessageForm()
 
+    page = message_history(conversation)
+    conversation_messages = page.object_list[::-1]
+
     return render(request, 'messaging/detail.html', {
         'conversation': conversation,
+        'conversation_messages': conversation_messages,
+        'older_cursor': page.next_cursor,
+        'last_id': conversation_messages[-1].id if conversation_messages else 0,
+        'event_stream': is_asgi(request),
         'form': form
-    })
\ No newline at end of file
+    })
+
+
+@login_required
+def message_list(request, pk):
+    """Messages as HTML fragments: `?before=<cursor>` for older ones, `?after=<id>` for newer ones"""
+    conversation = get_member_conversation(request, pk)
+    after = request.GET.get('after', '')
+    older_cursor = None
+
+    if after:
+        conversation_messages = list(
+            conversation.messages.filter(id__gt=parse_message_id(after))
+            .select_related('created_by').order_by('id')[:MESSAGES_PER_PAGE]
+        )
+    else:
+        page = message_history(conversation, request.GET.get('before'))
+        conversation_messages = page.object_list[::-1]
+        older_cursor = page.next_cursor
+
+    return JsonResponse(messages_payload(request, conversation_messages, older_cursor))
+
+
+def messages_payload(request, conversation_messages, older_cursor=None):
+    html = render_to_string('messaging/message_list.html', {
+        'conversation_messages': conversation_messages,
+    }, request=request)
+
+    return {
+        'html': html,
+        'count': len(conversation_messages),
+        'older_cursor': older_cursor,
+        'last_id': conversation_messages[-1].id if conversation_messages else None,
+    }
+
+
+async def aget_member_conversation(request, pk):
+    user = await request.auser()
+    conversation = await Conversation.objects.involving(user).filter(pk=pk).afirst()
+    if conversation is None:
+        raise Http404('No conversation found.')
+    return conversation
+
+
+async def messages_after(conversation_id, last_id):
+    messages = (ConversationMessage.objects
+                .filter(conversation_id=conversation_id, id__gt=last_id)
+                .select_related('created_by').order_by('id')[:MESSAGES_PER_PAGE])
+    return [message async for message in messages]
+
+
+def parse_message_id(value):
+    if not value.isdigit():
+        raise Http404('Invalid message id.')
+    return int(value)
+
+
+@login_required
+async def message_poll(request, pk):
+    """Long-poll fallback: answers as soon as messages newer than `?after=<id>` exist"""
+    conversation = await aget_member_conversation(request, pk)
+    last_id = parse_message_id(request.GET.get('after', '0'))
+
+    async with get_hub().subscribe(conversation.pk) as subscription:
+        new_messages = await messages_after(conversation.pk, last_id)
+        if not new_messages and await subscription.wait(LONG_POLL_TIMEOUT):
+            new_messages = await messages_after(conversation.pk, last_id)
+
+    payload = await sync_to_async(messages_payload)(request, new_messages)
+    return JsonResponse(payload)
+
+
+@login_required
+async def message_events(request, pk):
+    """Server-sent events stream of new messages (needs the ASGI server)"""
+    if not is_asgi(request):
+        # The page long-polls instead, see messaging/detail.html
+        raise Http404('Event stream not available.')
+    conversation = await aget_member_conversation(request, pk)
+    last_id = parse_message_id(
+        request.headers.get('Last-Event-ID') or request.GET.get('after', '0')
+    )
+    hub = get_hub()
+
+    async def stream():
+        nonlocal last_id
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + EVENT_STREAM_DURATION
+        yield 'retry: 3000\n\n'
+
+        while loop.time() < deadline:
+            async with hub.subscribe(conversation.pk) as subscription:
+                new_messages = await messages_after(conversation.pk, last_id)
+                if not new_messages:
+                    if not await subscription.wait(KEEPALIVE_INTERVAL):
+                        yield ': keepalive\n\n'
+                    continue
+
+            payload = await sync_to_async(messages_payload)(request, new_messages)
+            last_id = payload['last_id']
+            yield f'id: {last_id}\ndata: {json.dumps(payload)}\n\n'
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,26 @@
+"""Cache backends that report hits and misses to the request instrumentation.
+
+get_many() and get_or_set() of these backends are built on get(), so every
+lookup is counted exactly once.
+"""
+from django.core.cache.backends import filebased, locmem
+
+from .instrumentation import record_cache_lookup
+
+_missing = object()
+
+
+class InstrumentedCacheMixin:
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _missing, version=version)
+        record_cache_lookup(value is not _missing)
+        return default if value is _missing else value
+
+
+class LocMemCache(InstrumentedCacheMixin, locmem.LocMemCache):
+    pass
+
+
+class FileBasedCache(InstrumentedCacheMixin, filebased.FileBasedCache):
+    pass
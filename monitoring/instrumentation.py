@@ -0,0 +1,117 @@
+"""Hooks that attribute database, template and cache costs to the current request."""
+import time
+from contextvars import ContextVar
+
+from django.template import base, loader_tags
+
+# RequestMetrics of the request being served, set by InstrumentationMiddleware
+current_metrics = ContextVar('current_metrics', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    """connection.execute_wrapper() hook counting queries and their duration"""
+    metrics = current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_queries += 1
+        metrics.db_time += time.perf_counter() - start
+
+
+def install_query_recording(sender, connection, **kwargs):
+    """connection_created receiver adding record_query to every connection.
+
+    Installed per connection rather than per request, so that queries run by
+    async views (in the threads of sync_to_async) are counted as well.
+    """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def record_cache_lookup(hit):
+    metrics = current_metrics.get()
+    if metrics is not None:
+        if hit:
+            metrics.cache_hits += 1
+        else:
+            metrics.cache_misses += 1
+
+
+def template_name(node):
+    """Loader name of the template a Template or Node comes from, e.g. 'blog/home.html'"""
+    return getattr(getattr(node, 'origin', None), 'template_name', None) or '<string>'
+
+
+def timed_render(metrics, name, render, *args):
+    """Run `render`, charging its time to `name` and to the enclosing frame.
+
+    metrics.template_stack holds, for every render in progress, the time
+    spent in its nested renders, so each template also gets its self time.
+    """
+    stack = metrics.template_stack
+    stack.append(0.0)
+    start = time.perf_counter()
+    try:
+        return render(*args)
+    finally:
+        elapsed = time.perf_counter() - start
+        nested = stack.pop()
+        if stack:
+            stack[-1] += elapsed
+        else:
+            metrics.template_time += elapsed
+        entry = metrics.templates.get(name)
+        if entry is None:
+            entry = metrics.templates[name] = [0, 0.0, 0.0]
+        entry[0] += 1
+        entry[1] += elapsed
+        entry[2] += elapsed - nested
+
+
+def install_template_timing():
+    """Time template rendering, in total and per template.
+
+    Three render paths are wrapped: Template.render (the response template
+    and every {% include %}), ExtendsNode.render (the parent layout, e.g.
+    blog/base.html) and BlockNode.render, charged to the template that
+    provides the block ("blog/home.html#content"). Only the outermost frame
+    counts towards the request template time, so nested renders are not
+    counted twice.
+    """
+    render = base.Template.render
+    if getattr(render, 'instrumented', False):
+        return
+    extends_render = loader_tags.ExtendsNode.render
+    block_render = loader_tags.BlockNode.render
+
+    def instrumented_render(self, context):
+        metrics = current_metrics.get()
+        if metrics is None:
+            return render(self, context)
+        return timed_render(metrics, template_name(self), render, self, context)
+
+    def instrumented_extends_render(self, context):
+        metrics = current_metrics.get()
+        if metrics is None or not metrics.template_stack:
+            return extends_render(self, context)
+        parent = self.parent_name.resolve(context)
+        name = parent if isinstance(parent, str) else template_name(parent)
+        return timed_render(metrics, name, extends_render, self, context)
+
+    def instrumented_block_render(self, context):
+        metrics = current_metrics.get()
+        if metrics is None or not metrics.template_stack:
+            return block_render(self, context)
+        # The block actually rendered is the override of the deepest child template
+        block_context = context.render_context.get(loader_tags.BLOCK_CONTEXT_KEY)
+        block = (block_context and block_context.get_block(self.name)) or self
+        name = f'{template_name(block)}#{self.name}'
+        return timed_render(metrics, name, block_render, self, context)
+
+    instrumented_render.instrumented = True
+    base.Template.render = instrumented_render
+    loader_tags.ExtendsNode.render = instrumented_extends_render
+    loader_tags.BlockNode.render = instrumented_block_render
@@ -0,0 +1,115 @@
+"""Throughput of the app under concurrent load, through the WSGI or the ASGI handler.
+
+Requests go through Django's test clients, so the whole middleware stack and
+the views run exactly as behind a server, without sockets or an ASGI server
+dependency. WSGI requests are sent by a pool of threads, one client each, the
+way a threaded WSGI server serves them. ASGI requests are tasks of a single
+event loop, each in its own ThreadSensitiveContext like under a real ASGI
+server, so the sync code of a request runs in a thread of its own.
+"""
+import asyncio
+import importlib
+import itertools
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import ThreadSensitiveContext
+from django.conf import settings
+from django.db import connections
+from django.test import AsyncClient, Client, override_settings
+from django.urls import clear_url_caches
+
+from .stats import percentile
+
+# Modules reading ASYNC_VIEWS when imported
+ROUTED_URLCONFS = ['blog.urls', 'messaging.urls']
+
+
+def reload_urlconfs():
+    for name in ROUTED_URLCONFS + [settings.ROOT_URLCONF]:
+        if name in sys.modules:
+            importlib.reload(sys.modules[name])
+    clear_url_caches()
+
+
+@contextmanager
+def routed_views(async_views):
+    """Route the pages to their sync or async views, whatever ASYNC_VIEWS says"""
+    try:
+        with override_settings(ASYNC_VIEWS=async_views):
+            reload_urlconfs()
+            yield
+    finally:
+        reload_urlconfs()
+
+
+def bypass_page_cache(url, n):
+    """`url` with a query parameter unknown to the anonymous page cache"""
+    return f"{url}{'&' if '?' in url else '?'}_lt={n}"
+
+
+def run_wsgi(url, user, concurrency, requests, page_cache=True):
+    """Send `requests` GETs from `concurrency` threads; (latencies in s, errors, elapsed s)"""
+    counter = itertools.count()
+    latencies, errors = [], []
+
+    def worker():
+        client = Client(raise_request_exception=False)
+        if user is not None:
+            client.force_login(user)
+        try:
+            while (n := next(counter)) < requests:
+                start = time.perf_counter()
+                response = client.get(url if page_cache else bypass_page_cache(url, n))
+                latencies.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    errors.append(response.status_code)
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors, time.perf_counter() - start
+
+
+def run_asgi(url, user, concurrency, requests, page_cache=True):
+    """Send `requests` GETs from `concurrency` tasks; (latencies in s, errors, elapsed s)"""
+    counter = itertools.count()
+    latencies, errors = [], []
+
+    async def worker(client):
+        while (n := next(counter)) < requests:
+            start = time.perf_counter()
+            async with ThreadSensitiveContext():
+                response = await client.get(url if page_cache else bypass_page_cache(url, n))
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors.append(response.status_code)
+
+    async def main():
+        client = AsyncClient(raise_request_exception=False)
+        if user is not None:
+            await client.aforce_login(user)
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        return time.perf_counter() - start
+
+    elapsed = asyncio.run(main())
+    return latencies, errors, elapsed
+
+
+def summarize(latencies, errors, elapsed):
+    latencies_ms = [latency * 1000 for latency in latencies]
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else 0,
+        'p50_ms': round(percentile(latencies_ms, 0.50), 3),
+        'p95_ms': round(percentile(latencies_ms, 0.95), 3),
+    }
@@ -0,0 +1,166 @@
+import json
+import platform
+import subprocess
+import time
+from collections import Counter
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from blog.models import Category, Post
+from messaging.models import Conversation, ConversationSummary
+from monitoring.stats import percentile
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def scenarios():
+    """(name, url, user to log in as) for every benchmarked page, also used by loadtest"""
+    post = Post.objects.filter(is_sold=False).order_by('-date_posted').first()
+    summary = ConversationSummary.objects.order_by('-last_activity').first()
+    if post is None or summary is None:
+        raise CommandError('The database is empty, run "manage.py seed_marketplace" first.')
+    category = Category.objects.order_by('?').first()
+    word = post.title.split()[0]
+    # Busiest inbox: the worst case for the messaging pages
+    user_id = Counter(ConversationSummary.objects.values_list('user_id', flat=True)).most_common(1)[0][0]
+    user = User.objects.get(pk=user_id)
+    conversation = Conversation.objects.involving(user).order_by('-modified_at').first()
+
+    home = reverse('blog:home')
+    return [
+        ('feed', home, None),
+        ('feed_search', f'{home}?query={word}', None),
+        ('feed_category', f'{home}?category={category.pk}', None),
+        ('feed_logged_in', home, user),
+        ('post_detail', reverse('blog:post-detail', args=[post.pk]), None),
+        ('user_posts', reverse('blog:user-posts', args=[post.author.username]), None),
+        ('inbox', reverse('conversation:inbox'), user),
+        ('conversation_detail', reverse('conversation:detail', args=[conversation.pk]), user),
+    ]
+
+
+class Command(BaseCommand):
+    help = ('Measure latency, query counts and template render time of the main pages with the test client. '
+            'Use -v 2 to list the slowest templates of each page')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=30)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--warm-cache', action='store_true',
+                            help='Keep the cache between requests instead of clearing it before each one')
+        parser.add_argument('--only', nargs='*', help='Run only these scenarios')
+        parser.add_argument('--output', help='Write the JSON report to this file')
+        parser.add_argument('--compare', help='Previous JSON report to compare with')
+        parser.add_argument('--label', default=None, help='Name of this run, the git revision by default')
+
+    def run_scenario(self, url, user, iterations, warmup, warm_cache):
+        client = Client()
+        if user is not None:
+            client.force_login(user)
+        latencies, queries, render_times = [], [], []
+        templates = {}
+        for i in range(warmup + iterations):
+            if not warm_cache:
+                cache.clear()
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                response = client.get(url)
+                elapsed = time.perf_counter() - start
+            if response.status_code != 200:
+                raise CommandError(f'{url} returned {response.status_code}')
+            if i >= warmup:
+                latencies.append(elapsed * 1000)
+                queries.append(len(captured))
+                # Costs recorded by InstrumentationMiddleware
+                metrics = response.wsgi_request.metrics
+                render_times.append(metrics.template_time * 1000)
+                for name, (renders, _, self_time) in metrics.templates.items():
+                    entry = templates.setdefault(name, [0, 0.0])
+                    entry[0] += renders
+                    entry[1] += self_time * 1000
+        top_templates = sorted(templates.items(), key=lambda item: item[1][1], reverse=True)[:5]
+        return {
+            'url': url,
+            'logged_in': user is not None,
+            'p50_ms': round(percentile(latencies, 0.50), 3),
+            'p95_ms': round(percentile(latencies, 0.95), 3),
+            'mean_ms': round(sum(latencies) / len(latencies), 3),
+            'queries': max(queries),
+            'template_p50_ms': round(percentile(render_times, 0.50), 3),
+            'template_p95_ms': round(percentile(render_times, 0.95), 3),
+            # Templates with the highest self time, per request
+            'templates': {
+                name: {'renders': renders / iterations, 'self_ms': round(self_ms / iterations, 3)}
+                for name, (renders, self_ms) in top_templates
+            },
+        }
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('--iterations must be at least 1')
+
+        results = {}
+        # The test client talks to the app as "testserver"
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            for name, url, user in scenarios():
+                if options['only'] and name not in options['only']:
+                    continue
+                results[name] = self.run_scenario(
+                    url, user, options['iterations'], options['warmup'], options['warm_cache'])
+                self.stdout.write(
+                    f"{name:<22} p50 {results[name]['p50_ms']:>8.2f} ms  "
+                    f"p95 {results[name]['p95_ms']:>8.2f} ms  {results[name]['queries']:>3} queries  "
+                    f"templates p95 {results[name]['template_p95_ms']:>7.2f} ms"
+                )
+                if options['verbosity'] > 1:
+                    for template, row in results[name]['templates'].items():
+                        self.stdout.write(f"    {template:<40} x{row['renders']:<5g} {row['self_ms']:>8.3f} ms")
+
+        report = {
+            'label': options['label'] if options['label'] is not None else git_revision(),
+            'created_at': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'iterations': options['iterations'],
+            'warm_cache': options['warm_cache'],
+            'dataset': {
+                'users': User.objects.count(),
+                'posts': Post.objects.count(),
+                'conversations': Conversation.objects.count(),
+            },
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+        if options['compare']:
+            self.compare(report, options['compare'])
+
+    def compare(self, report, path):
+        with open(path) as f:
+            previous = json.load(f)
+        self.stdout.write(f"\nCompared with {previous.get('label') or path}:")
+        for name, result in report['results'].items():
+            before = previous['results'].get(name)
+            if before is None:
+                continue
+            change = (result['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100 if before['p95_ms'] else 0
+            self.stdout.write(
+                f"{name:<22} p95 {before['p95_ms']:>8.2f} -> {result['p95_ms']:>8.2f} ms ({change:+.0f}%)  "
+                f"queries {before['queries']} -> {result['queries']}  "
+                f"templates p95 {before.get('template_p95_ms', 0):.2f} -> {result['template_p95_ms']:.2f} ms"
+            )
@@ -0,0 +1,80 @@
+import json
+import platform
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+from django.utils import timezone
+
+from monitoring.loadtest import routed_views, run_asgi, run_wsgi, summarize
+from .benchmark import git_revision, scenarios
+
+# Mode -> (runner, route the async views)
+MODES = {
+    'wsgi': (run_wsgi, False),
+    'asgi_sync': (run_asgi, False),
+    'asgi': (run_asgi, True),
+}
+
+
+class Command(BaseCommand):
+    help = ('Compare the throughput of the main pages under concurrent load through the WSGI handler '
+            '(sync views) and the ASGI handler (sync or async views, see ASYNC_VIEWS)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=16, help='Requests in flight at once')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per page and mode')
+        parser.add_argument('--warmup', type=int, default=20)
+        parser.add_argument('--modes', nargs='*', choices=list(MODES), default=list(MODES))
+        parser.add_argument('--only', nargs='*', help='Run only these scenarios')
+        parser.add_argument('--page-cache', action='store_true',
+                            help='Let the anonymous page cache answer, instead of rendering every request')
+        parser.add_argument('--output', help='Write the JSON report to this file')
+        parser.add_argument('--label', default=None, help='Name of this run, the git revision by default')
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1 or options['requests'] < 1:
+            raise CommandError('--concurrency and --requests must be at least 1')
+
+        results = {}
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            for name, url, user in scenarios():
+                if options['only'] and name not in options['only']:
+                    continue
+                results[name] = {}
+                for mode in options['modes']:
+                    run, async_views = MODES[mode]
+                    with routed_views(async_views):
+                        run(url, user, options['concurrency'], options['warmup'], options['page_cache'])
+                        result = summarize(*run(url, user, options['concurrency'], options['requests'],
+                                                options['page_cache']))
+                    results[name][mode] = result
+                    self.stdout.write(
+                        f"{name:<22} {mode:<10} {result['rps']:>8.1f} req/s  "
+                        f"p50 {result['p50_ms']:>8.2f} ms  p95 {result['p95_ms']:>8.2f} ms  "
+                        f"{result['errors']} errors"
+                    )
+                self.compare(name, results[name])
+
+        report = {
+            'label': options['label'] if options['label'] is not None else git_revision(),
+            'created_at': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'concurrency': options['concurrency'],
+            'requests': options['requests'],
+            'page_cache': options['page_cache'],
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+
+    def compare(self, name, results):
+        wsgi = results.get('wsgi')
+        if not wsgi or not wsgi['rps']:
+            return
+        for mode, result in results.items():
+            if mode != 'wsgi':
+                self.stdout.write(f"{'':<22} {mode} / wsgi: {result['rps'] / wsgi['rps']:.2f}x throughput")
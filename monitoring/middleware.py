@@ -0,0 +1,100 @@
+import cProfile
+import os
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.urls import Resolver404, resolve
+
+from .instrumentation import current_metrics
+from .stats import RequestMetrics, registry
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+
+
+def route_name(request):
+    """URL name of the request, e.g. 'blog:home'"""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        # Responses served before URL resolution (e.g. from the page cache)
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return '<unresolved>'
+    return match.view_name or '<unnamed>'
+
+
+class InstrumentationMiddleware:
+    """Record latency, queries, template time and cache hit rate of each request.
+
+    Sending an ``X-Profile: 1`` header as a staff user also runs the request
+    under cProfile and writes the stats to MONITORING_PROFILE_DIR; the file
+    name is returned in ``X-Profile-File``. Staff is required even with DEBUG
+    on, which is the default of the settings.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        # Also kept on the request, for the benchmark command
+        request.metrics = metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        start = time.perf_counter()
+        try:
+            if self.wants_profile(request) and request.user.is_staff:
+                response = self.profile(request)
+            else:
+                response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        registry.record(route_name(request), time.perf_counter() - start, metrics, response.status_code)
+        return response
+
+    async def __acall__(self, request):
+        request.metrics = metrics = RequestMetrics()
+        # Copied into the threads running the ORM calls by sync_to_async()
+        token = current_metrics.set(metrics)
+        start = time.perf_counter()
+        try:
+            if self.wants_profile(request) and (await request.auser()).is_staff:
+                response = await self.aprofile(request)
+            else:
+                response = await self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        registry.record(route_name(request), time.perf_counter() - start, metrics, response.status_code)
+        return response
+
+    def wants_profile(self, request):
+        return request.META.get(PROFILE_HEADER) in ('1', 'true')
+
+    def profile(self, request):
+        profiler = cProfile.Profile()
+        response = profiler.runcall(self.get_response, request)
+        return self.save_profile(request, profiler, response)
+
+    async def aprofile(self, request):
+        """Profile of the event loop thread: includes other requests served meanwhile"""
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            response = await self.get_response(request)
+        finally:
+            profiler.disable()
+        return self.save_profile(request, profiler, response)
+
+    def save_profile(self, request, profiler, response):
+        os.makedirs(settings.MONITORING_PROFILE_DIR, exist_ok=True)
+        filename = '%s-%d.prof' % (route_name(request).replace(':', '-'), time.time_ns())
+        profiler.dump_stats(os.path.join(settings.MONITORING_PROFILE_DIR, filename))
+        response['X-Profile-File'] = filename
+        return response
@@ -0,0 +1,182 @@
+"""In-process request statistics, aggregated per URL name.
+
+Each route keeps cumulative counters and a latency histogram (exported in the
+Prometheus text format) plus a ring buffer of the most recent requests, used
+for percentiles on the stats page. Everything lives in the memory of the
+server process and is lost on restart.
+"""
+import threading
+from collections import deque
+
+from django.conf import settings
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers, 0 when empty"""
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class RequestMetrics:
+    """Costs accumulated while serving a single request"""
+    __slots__ = ('db_queries', 'db_time', 'template_time', 'template_stack', 'templates',
+                 'cache_hits', 'cache_misses')
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.template_stack = []
+        # Template name -> [renders, total seconds, self seconds]
+        self.templates = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+
+class RouteStats:
+
+    def __init__(self, ring_size):
+        self.requests = 0
+        self.errors = 0
+        self.latency_sum = 0.0
+        self.latency_buckets = [0] * len(LATENCY_BUCKETS)
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.templates = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # (latency, db queries) of the latest requests
+        self.recent = deque(maxlen=ring_size)
+
+    def record(self, latency, metrics, status_code):
+        self.requests += 1
+        if status_code >= 500:
+            self.errors += 1
+        self.latency_sum += latency
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if latency <= bound:
+                self.latency_buckets[i] += 1
+                break
+        self.db_queries += metrics.db_queries
+        self.db_time += metrics.db_time
+        self.template_time += metrics.template_time
+        for name, (renders, total, self_time) in metrics.templates.items():
+            entry = self.templates.get(name)
+            if entry is None:
+                entry = self.templates[name] = [0, 0.0, 0.0]
+            entry[0] += renders
+            entry[1] += total
+            entry[2] += self_time
+        self.cache_hits += metrics.cache_hits
+        self.cache_misses += metrics.cache_misses
+        self.recent.append((latency, metrics.db_queries))
+
+    def percentile(self, fraction):
+        return percentile([latency for latency, _ in self.recent], fraction)
+
+    def summary(self):
+        requests = self.requests or 1
+        cache_lookups = self.cache_hits + self.cache_misses
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'p50': self.percentile(0.50),
+            'p95': self.percentile(0.95),
+            'mean': self.latency_sum / requests,
+            'db_queries': self.db_queries / requests,
+            'db_time': self.db_time / requests,
+            'template_time': self.template_time / requests,
+            'cache_hit_rate': self.cache_hits / cache_lookups if cache_lookups else None,
+            'templates': self.template_summary(requests),
+        }
+
+    def template_summary(self, requests, limit=10):
+        """Templates with the highest self time, averaged per request"""
+        rows = [
+            {
+                'name': name,
+                'renders': renders / requests,
+                'time_ms': total * 1000 / requests,
+                'self_ms': self_time * 1000 / requests,
+            }
+            for name, (renders, total, self_time) in self.templates.items()
+        ]
+        return sorted(rows, key=lambda row: row['self_ms'], reverse=True)[:limit]
+
+
+class Registry:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.routes = {}
+
+    def record(self, route, latency, metrics, status_code):
+        with self._lock:
+            if route not in self.routes:
+                self.routes[route] = RouteStats(getattr(settings, 'MONITORING_RING_SIZE', 1000))
+            self.routes[route].record(latency, metrics, status_code)
+
+    def reset(self):
+        with self._lock:
+            self.routes = {}
+
+    def snapshot(self):
+        with self._lock:
+            return {route: stats.summary() for route, stats in sorted(self.routes.items())}
+
+    def prometheus(self):
+        """All counters in the Prometheus text exposition format"""
+        lines = []
+
+        def metric(name, kind, help_text):
+            lines.append(f'# HELP juja_{name} {help_text}')
+            lines.append(f'# TYPE juja_{name} {kind}')
+
+        with self._lock:
+            routes = sorted(self.routes.items())
+
+            metric('request_duration_seconds', 'histogram', 'Request latency.')
+            for route, stats in routes:
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS, stats.latency_buckets):
+                    cumulative += count
+                    lines.append(f'juja_request_duration_seconds_bucket{{route="{route}",le="{bound}"}} {cumulative}')
+                lines.append(f'juja_request_duration_seconds_bucket{{route="{route}",le="+Inf"}} {stats.requests}')
+                lines.append(f'juja_request_duration_seconds_sum{{route="{route}"}} {stats.latency_sum}')
+                lines.append(f'juja_request_duration_seconds_count{{route="{route}"}} {stats.requests}')
+
+            counters = [
+                ('request_errors_total', 'Responses with a 5xx status.', 'errors'),
+                ('db_queries_total', 'Database queries.', 'db_queries'),
+                ('db_query_seconds_total', 'Time spent in database queries.', 'db_time'),
+                ('template_render_seconds_total', 'Time spent rendering templates.', 'template_time'),
+            ]
+            for name, help_text, attribute in counters:
+                metric(name, 'counter', help_text)
+                for route, stats in routes:
+                    lines.append(f'juja_{name}{{route="{route}"}} {getattr(stats, attribute)}')
+
+            metric('template_renders_total', 'counter', 'Renders of each template, include and block.')
+            for route, stats in routes:
+                for name, (renders, _, _) in sorted(stats.templates.items()):
+                    lines.append(f'juja_template_renders_total{{route="{route}",template="{name}"}} {renders}')
+            metric('template_self_seconds_total', 'counter', 'Time spent in each template, excluding nested renders.')
+            for route, stats in routes:
+                for name, (_, _, self_time) in sorted(stats.templates.items()):
+                    lines.append(f'juja_template_self_seconds_total{{route="{route}",template="{name}"}} {self_time}')
+
+            metric('cache_lookups_total', 'counter', 'Cache lookups by result.')
+            for route, stats in routes:
+                lines.append(f'juja_cache_lookups_total{{route="{route}",result="hit"}} {stats.cache_hits}')
+                lines.append(f'juja_cache_lookups_total{{route="{route}",result="miss"}} {stats.cache_misses}')
+
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
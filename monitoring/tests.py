@@ -0,0 +1,159 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from blog.models import Category, Post
+from .loadtest import routed_views
+from .stats import registry
+
+MEDIA_ROOT = tempfile.mkdtemp()
+Image.new('RGB', (10, 10)).save(f'{MEDIA_ROOT}/default.jpg')
+
+
+def tearDownModule():
+    shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, DEBUG=False)
+class InstrumentationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', password='pass', is_staff=True)
+        cls.user = User.objects.create_user('user', password='pass')
+        Post.objects.create(title='Lampada', content='-', author=cls.user,
+                            category=Category.objects.create(name='Casa'))
+
+    def setUp(self):
+        cache.clear()
+        registry.reset()
+
+    def test_request_costs_recorded_per_route(self):
+        self.client.get(reverse('blog:home'))
+        row = registry.snapshot()['blog:home']
+        self.assertEqual(row['requests'], 1)
+        self.assertGreater(row['db_queries'], 0)
+        self.assertGreater(row['template_time'], 0)
+        self.assertGreater(row['p95'], 0)
+        self.assertIsNotNone(row['cache_hit_rate'])
+        queries = registry.routes['blog:home'].db_queries
+
+        # Served by the page cache: no queries, still attributed to the route
+        self.client.get(reverse('blog:home'))
+        row = registry.snapshot()['blog:home']
+        self.assertEqual(row['requests'], 2)
+        self.assertEqual(registry.routes['blog:home'].db_queries, queries)
+
+    def test_render_time_per_template(self):
+        self.client.get(reverse('blog:home'))
+        templates = registry.routes['blog:home'].templates
+        for name in ('blog/home.html', 'blog/base.html', 'blog/home.html#content', 'blog/post_card.html'):
+            self.assertEqual(templates[name][0], 1, name)
+        # The feed is rendered inside the layout, and not counted twice in the request total
+        self.assertLessEqual(templates['blog/home.html#content'][1], templates['blog/base.html'][1])
+        self.assertAlmostEqual(registry.routes['blog:home'].template_time, templates['blog/home.html'][1])
+        self.assertAlmostEqual(sum(entry[2] for entry in templates.values()), templates['blog/home.html'][1])
+
+        self.client.force_login(self.staff)
+        self.assertContains(self.client.get(reverse('monitoring:stats')), 'blog/post_card.html')
+
+    def test_stats_view_is_staff_only(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('monitoring:stats')).status_code, 302)
+        self.client.force_login(self.staff)
+        self.client.get(reverse('blog:home'))
+        response = self.client.get(reverse('monitoring:stats'))
+        self.assertContains(response, 'blog:home')
+
+    def test_prometheus_export(self):
+        self.client.get(reverse('blog:home'))
+        self.assertEqual(self.client.get(reverse('monitoring:metrics')).status_code, 403)
+        with self.settings(MONITORING_METRICS_TOKEN='secret'):
+            response = self.client.get(reverse('monitoring:metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('juja_request_duration_seconds_count{route="blog:home"} 1', body)
+        self.assertIn('juja_request_duration_seconds_bucket{route="blog:home",le="+Inf"} 1', body)
+        self.assertIn('juja_db_queries_total{route="blog:home"}', body)
+
+    async def test_async_views_are_measured(self):
+        # Their queries run in the threads of sync_to_async
+        with routed_views(True):
+            response = await self.async_client.get(reverse('blog:home'))
+        self.assertEqual(response.status_code, 200)
+        row = registry.snapshot()['blog:home']
+        self.assertGreater(row['db_queries'], 0)
+        self.assertGreater(row['template_time'], 0)
+
+    def test_profile_header(self):
+        profile_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, profile_dir, ignore_errors=True)
+        with self.settings(MONITORING_PROFILE_DIR=profile_dir, DEBUG=True):
+            response = self.client.get(reverse('blog:home'), HTTP_X_PROFILE='1')
+            self.assertNotIn('X-Profile-File', response)
+            self.assertEqual(os.listdir(profile_dir), [])
+
+            self.client.force_login(self.staff)
+            response = self.client.get(reverse('blog:home'), HTTP_X_PROFILE='1')
+        self.assertTrue(os.path.exists(os.path.join(profile_dir, response['X-Profile-File'])))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class BenchmarkTests(TestCase):
+
+    def test_report(self):
+        call_command('seed_marketplace', users=4, posts=10, conversations=3, messages=2,
+                     max_images=1, stdout=io.StringIO())
+        report_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, report_dir, ignore_errors=True)
+        output = os.path.join(report_dir, 'report.json')
+        call_command('benchmark', iterations=2, warmup=0, output=output, label='test', stdout=io.StringIO())
+        with open(output) as f:
+            report = json.load(f)
+        self.assertEqual(report['label'], 'test')
+        self.assertEqual(set(report['results']), {
+            'feed', 'feed_search', 'feed_category', 'feed_logged_in', 'post_detail',
+            'user_posts', 'inbox', 'conversation_detail',
+        })
+        self.assertGreater(report['results']['feed']['queries'], 0)
+        self.assertGreater(report['results']['feed']['template_p95_ms'], 0)
+        self.assertIn('blog/post_card.html', report['results']['feed']['templates'])
+
+        stdout = io.StringIO()
+        call_command('benchmark', iterations=1, warmup=0, only=['feed'], compare=output, stdout=stdout)
+        self.assertIn('Compared with test', stdout.getvalue())
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class LoadTestTests(TransactionTestCase):
+    # The requests are served by other threads, which must see the data
+
+    def setUp(self):
+        cache.clear()
+
+    def test_report(self):
+        call_command('seed_marketplace', users=4, posts=10, conversations=3, messages=2,
+                     max_images=0, stdout=io.StringIO())
+        report_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, report_dir, ignore_errors=True)
+        output = os.path.join(report_dir, 'report.json')
+        stdout = io.StringIO()
+        call_command('loadtest', concurrency=2, requests=4, warmup=0, only=['feed', 'post_detail'],
+                     output=output, stdout=stdout)
+        with open(output) as f:
+            report = json.load(f)
+        for name in ('feed', 'post_detail'):
+            self.assertEqual(set(report['results'][name]), {'wsgi', 'asgi_sync', 'asgi'})
+            for result in report['results'][name].values():
+                self.assertEqual((result['requests'], result['errors']), (4, 0))
+                self.assertGreater(result['rps'], 0)
+        self.assertIn('asgi / wsgi', stdout.getvalue())
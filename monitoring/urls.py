@@ -0,0 +1,10 @@
+from django.urls import path
+
+from . import views
+
+app_name = 'monitoring'
+
+urlpatterns = [
+    path('', views.stats, name='stats'),
+    path('metrics/', views.metrics, name='metrics'),
+]
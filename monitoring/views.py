@@ -0,0 +1,27 @@
+import hmac
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import HttpResponse, HttpResponseForbidden
+from django.shortcuts import render
+
+from .stats import registry
+
+
+@staff_member_required
+def stats(request):
+    """Per-route summary of the requests served by this process"""
+    if request.method == 'POST' and 'reset' in request.POST:
+        registry.reset()
+    return render(request, 'monitoring/stats.html', {'routes': registry.snapshot()})
+
+
+def metrics(request):
+    """Prometheus scrape endpoint, for staff or a bearer MONITORING_METRICS_TOKEN"""
+    token = settings.MONITORING_METRICS_TOKEN
+    authorization = request.headers.get('Authorization', '')
+    authorized = request.user.is_staff or (
+        token and hmac.compare_digest(authorization, f'Bearer {token}'))
+    if not authorized:
+        return HttpResponseForbidden()
+    return HttpResponse(registry.prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -1,6 +1,7 @@
 from django import forms
 from django.contrib.auth.models import User
 from django.contrib.auth.forms import UserCreationForm
+from blog.uploads import ImageUploadField
 from .models import Profile
 
 
@@ -23,4 +24,5 @@ class UserUpdateForm(forms.ModelForm):
 class ProfileUpdateForm(forms.ModelForm):
     class Meta:
         model = Profile
-        fields = ['image']
\ No newline at end of file
+        fields = ['image']
+        field_classes = {'image': ImageUploadField}
\ No newline at end of file
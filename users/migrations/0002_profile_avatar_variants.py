@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:37
+
+from django.db import migrations, models
+
+
+def queue_existing_avatars(apps, schema_editor):
+    Profile = apps.get_model('users', 'Profile')
+    Job = apps.get_model('jobs', 'Job')
+    Job.objects.bulk_create(
+        Job(task='users.tasks.process_avatar', payload={'profile_id': pk})
+        for pk in Profile.objects.exclude(image='default.jpg').values_list('pk', flat=True)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+        ('jobs', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='avatar_large',
+            field=models.ImageField(blank=True, upload_to='profile_pics/variants'),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='avatar_small',
+            field=models.ImageField(blank=True, upload_to='profile_pics/variants'),
+        ),
+        migrations.RunPython(queue_existing_avatars, migrations.RunPython.noop),
+    ]
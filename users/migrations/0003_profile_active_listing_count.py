@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_profile_avatar_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='active_listing_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -1,21 +1,53 @@
 from django.db import models
 from django.contrib.auth.models import User
-from PIL import Image
+from jobs.queue import enqueue
+
+DEFAULT_IMAGE = 'default.jpg'
 
 
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
-    image = models.ImageField(default='default.jpg', upload_to='profile_pics')
+    image = models.ImageField(default=DEFAULT_IMAGE, upload_to='profile_pics')
+    # Square variants of the picture, generated by users.tasks.process_avatar
+    avatar_small = models.ImageField(upload_to='profile_pics/variants', blank=True)  # Post headers
+    avatar_large = models.ImageField(upload_to='profile_pics/variants', blank=True)  # Profile page
+    # Unsold, not deleted posts of the user, maintained by blog/counters.py
+    active_listing_count = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         return f'{self.user.username} Profile'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored picture, to notice when it is replaced
+        instance._stored_image = instance.image.name if 'image' in field_names else None
+        return instance
+
     def save(self, *args, **kwargs): # Essential to have *args and **kwargs here.
+        stored = getattr(self, '_stored_image', None)
+        changed = self.image.name != stored and self.image.name != DEFAULT_IMAGE
+        replaced = stored is not None and self.image.name != stored
+        old_variants = [f.name for f in (self.avatar_small, self.avatar_large) if f]
+        if replaced:
+            # The variants of the previous picture go away with it
+            self.avatar_small = self.avatar_large = ''
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'avatar_small', 'avatar_large'}
+
         super().save(*args, **kwargs)
 
-        img = Image.open(self.image.path)
+        if replaced:
+            enqueue('blog.tasks.delete_files', names=[stored] + old_variants)
+        if changed:
+            # Resizing happens in the background, the original is shown meanwhile
+            enqueue('users.tasks.process_avatar', profile_id=self.pk)
+        self._stored_image = self.image.name
+
+    @property
+    def avatar_small_url(self):
+        return (self.avatar_small or self.image).url
 
-        if img.height > 300 or img.width > 300:
-            output_size = (300, 300)
-            img.thumbnail(output_size)
-            img.save(self.image.path)
\ No newline at end of file
+    @property
+    def avatar_large_url(self):
+        return (self.avatar_large or self.image).url
@@ -1,15 +1,19 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.contrib.auth.models import User
 from django.dispatch import receiver
+from jobs.queue import enqueue
 from .models import Profile
 
 
 @receiver(post_save, sender=User)
 def create_profile(sender, instance, created, **kwargs):
+    # Only on creation: saving the user (e.g. last_login on every login)
+    # leaves the profile alone
     if created:
         Profile.objects.create(user=instance)
 
 
-@receiver(post_save, sender=User)
-def save_profile(sender, instance, **kwargs):
-    instance.profile.save()
\ No newline at end of file
+@receiver(post_delete, sender=Profile)
+def delete_profile_image(sender, instance, **kwargs):
+    names = [f.name for f in (instance.image, instance.avatar_small, instance.avatar_large) if f]
+    enqueue('blog.tasks.delete_files', names=names)
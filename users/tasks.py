@@ -0,0 +1,48 @@
+"""Background tasks, queued with jobs.queue.enqueue()"""
+import hashlib
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+from blog.cache import bump_version
+from .models import DEFAULT_IMAGE, Profile
+
+# Field -> side of the square variant, twice the CSS size for HiDPI screens
+AVATAR_SIZES = {
+    'avatar_large': 250,
+    'avatar_small': 130,
+}
+
+
+def process_avatar(profile_id):
+    """Render the square variants of a new profile picture"""
+    profile = Profile.objects.filter(pk=profile_id).first()
+    if profile is None or profile.image.name == DEFAULT_IMAGE:
+        return
+    source = profile.image.name
+
+    try:
+        with profile.image.open('rb') as f, Image.open(f) as original:
+            largest = max(AVATAR_SIZES.values())
+            original.draft('RGB', (largest, largest))  # JPEG: decode at reduced size
+            img = ImageOps.exif_transpose(original).convert('RGB')
+            variants = {}
+            for field, size in AVATAR_SIZES.items():
+                buffer = BytesIO()
+                ImageOps.fit(img, (size, size), Image.LANCZOS).save(buffer, 'JPEG', quality=85, optimize=True)
+                data = buffer.getvalue()
+                # Content hash in the name: a new picture never reuses a cached URL
+                name = f'{profile.user_id}-{size}-{hashlib.sha256(data).hexdigest()[:12]}.jpg'
+                file = getattr(profile, field)
+                file.save(name, ContentFile(data), save=False)
+                variants[field] = file.name
+    except (OSError, Image.DecompressionBombError):
+        return  # Unreadable upload: the original keeps being shown
+
+    # The picture may have been replaced while rendering
+    if not Profile.objects.filter(pk=profile_id, image=source).update(**variants):
+        for field in variants:
+            getattr(profile, field).delete(save=False)
+        return
+    bump_version(f'author:{profile.user_id}')
@@ -1,3 +1,85 @@
-from django.test import TestCase
+import io
+import os
+import shutil
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from jobs.models import Job
+from jobs.queue import run_job
+from .models import Profile
+
+MEDIA_ROOT = tempfile.mkdtemp()
+Image.new('RGB', (10, 10)).save(f'{MEDIA_ROOT}/default.jpg')
+
+
+def tearDownModule():
+    shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+
+def image_file(name='avatar.png', size=(50, 50), color='blue'):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ProfileImageTests(TestCase):
+
+    def run_jobs(self):
+        while job := Job.objects.filter(status=Job.PENDING).order_by('id').first():
+            run_job(job.pk, claim_first=True)
+
+    def test_login_does_not_touch_profile(self):
+        User.objects.create_user('seller', password='pass')
+        with mock.patch.object(Profile, 'save') as save:
+            self.assertTrue(self.client.login(username='seller', password='pass'))
+            User.objects.get(username='seller').save()
+        save.assert_not_called()
+
+    def test_variants_generated_in_background(self):
+        user = User.objects.create_user('seller', password='pass', email='s@example.com')
+        self.assertFalse(Job.objects.exists())  # Default picture: nothing to do
+        self.client.force_login(user)
+        self.client.post(reverse('profile'), {
+            'username': 'seller', 'email': 's@example.com', 'image': image_file(size=(400, 200)),
+        })
+        profile = Profile.objects.get(user=user)
+        self.assertFalse(profile.avatar_small)
+        self.assertEqual(profile.avatar_small_url, profile.image.url)
+
+        self.run_jobs()
+        profile.refresh_from_db()
+        with Image.open(profile.avatar_small.path) as small, Image.open(profile.image.path) as original:
+            self.assertEqual(small.size, (130, 130))
+            self.assertEqual(original.size, (400, 200))  # The upload is kept untouched
+        self.assertContains(self.client.get(reverse('profile')), profile.avatar_large.url)
+
+    def test_replaced_picture_is_deleted(self):
+        user = User.objects.create_user('seller', password='pass')
+        profile = user.profile
+        profile.image = image_file('first.png')
+        profile.save()
+        first = profile.image.path
+
+        self.run_jobs()
+        profile = User.objects.get(pk=user.pk).profile
+        first_variant = profile.avatar_small.path
+        profile.image = image_file('second.png', color='red')
+        profile.save()
+        self.run_jobs()
+        self.assertFalse(os.path.exists(first))
+        self.assertFalse(os.path.exists(first_variant))
+        self.assertTrue(os.path.exists(profile.image.path))
+
+        profile.refresh_from_db()
+        user.delete()
+        self.run_jobs()
+        self.assertFalse(os.path.exists(profile.image.path))
+        self.assertFalse(os.path.exists(profile.avatar_small.path))
+        self.assertTrue(os.path.exists(os.path.join(MEDIA_ROOT, 'default.jpg')))